@@ -1,13 +1,12 @@
 """Gemini AIを使ってバズる投稿を自動生成するモジュール"""
 
-import os
 import json
 import random
 
-try:
-    import google.generativeai as genai
-except ImportError:
-    genai = None
+import gemini_client
+from json_stream import JsonStreamParser
+
+_DECODER = json.JSONDecoder()
 
 SYSTEM_PROMPT = """あなたはX（旧Twitter）で月100万インプレッションを達成したSNSマーケターです。
 日本語でバズる投稿を1つ生成してください。
@@ -80,70 +79,34 @@ TREND_PROMPT_TEMPLATE = """あなたはX（旧Twitter）でバズる投稿を作
 """
 
 
-def _get_model():
-    """Geminiモデルを取得"""
-    if genai is None:
-        raise ImportError("google-generativeai がインストールされていません")
-
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY が設定されていません")
-
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel("gemini-2.0-flash")
+# まとめて生成するときにプロンプトの末尾に付ける指示
+BATCH_INSTRUCTION = """
+【まとめて生成】
+上記の条件で、テーマ・パターン・書き出しがそれぞれ異なるものを{count}個作ってください。
+出力は上記の形式のJSONオブジェクトを{count}個並べた次の形式のみ。他の文章は絶対に不要。
+{{"items": [ {{...}}, {{...}} ]}}
+"""
 
 
 def _parse_response(text: str) -> dict:
-    """AIの応答からJSONを抽出"""
-    # ```json ... ``` ブロックを抽出
-    if "```json" in text:
-        start = text.index("```json") + 7
-        end = text.index("```", start)
-        text = text[start:end].strip()
-    elif "```" in text:
-        start = text.index("```") + 3
-        end = text.index("```", start)
-        text = text[start:end].strip()
-
-    # JSON中の改行文字をエスケープ
-    # まずJSONとしてパースを試みる
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        pass
-
-    # { から } を抽出して再試行
-    brace_start = text.find("{")
-    brace_end = text.rfind("}") + 1
-    if brace_start >= 0 and brace_end > brace_start:
-        try:
-            return json.loads(text[brace_start:brace_end])
-        except json.JSONDecodeError:
-            pass
-
-    raise ValueError(f"JSONのパースに失敗: {text[:200]}")
-
-
-def generate_viral_post() -> dict:
-    """バズる投稿をAIで生成
+    """AIの応答からJSONオブジェクトを取り出す
 
-    Returns:
-        dict: {post_text, image_quote, image_author}
+    最初の { から始まるオブジェクトを1回だけデコードする（```json などの前置き・後ろの文章は無視）。
+    閉じていない・壊れているJSONは推測で補わずに ValueError にする。
     """
-    model = _get_model()
-
-    response = model.generate_content(
-        SYSTEM_PROMPT,
-        generation_config=genai.GenerationConfig(
-            temperature=1.0,
-            max_output_tokens=500,
-        ),
-    )
+    start = text.find("{")
+    if start < 0:
+        raise ValueError(f"JSONが見つかりません: {text[:200]}")
+    try:
+        result, _ = _DECODER.raw_decode(text, start)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSONのパースに失敗（{e}）: {text[:200]}")
+    return result
 
-    result = _parse_response(response.text)
 
-    # バリデーション
-    if "post_text" not in result:
+def _finish_post(result) -> dict:
+    """生成された投稿を検証して整える（長すぎる本文は切り詰め）"""
+    if not isinstance(result, dict) or not result.get("post_text"):
         raise ValueError("post_text がありません")
 
     # 280文字制限チェック
@@ -159,53 +122,110 @@ def generate_viral_post() -> dict:
 
     result.setdefault("image_quote", "")
     result.setdefault("image_author", "")
+    return result
 
-    print(f"[OK] AI投稿を生成しました（{len(result['post_text'])}文字）")
+
+def _fit_tweet(tweet) -> str:
+    """ツイートが長すぎれば切り詰める"""
+    if not isinstance(tweet, str):
+        raise ValueError("ツイートが文字列ではありません")
+    if len(tweet) > 280:
+        tweet = tweet[:277] + "..."
+    return tweet
+
+
+def _finish_thread(result) -> dict:
+    """生成されたスレッドを検証して整える（長すぎるツイートは切り詰め）"""
+    if not isinstance(result, dict) or not isinstance(result.get("tweets"), list) or not result["tweets"]:
+        raise ValueError("tweetsリストがありません")
+
+    # 各ツイートの文字数チェック
+    result["tweets"] = [_fit_tweet(tweet) for tweet in result["tweets"]]
+
+    result.setdefault("image_quote", "")
+    result.setdefault("image_author", "")
     return result
 
 
-def generate_trend_post(trend_data: list) -> dict:
-    """トレンド情報を参考にバズ投稿を生成
+def _generate_batch(prompt, kind, count, finish) -> list:
+    """1回のリクエストで count 件生成し、検証を通ったものだけ返す"""
+    tokens = gemini_client.GENERATION_SETTINGS[kind]["max_output_tokens"] * count
+    text = gemini_client.generate(
+        prompt + BATCH_INSTRUCTION.format(count=count), kind, max_output_tokens=tokens,
+    )
+    data = _parse_response(text)
+    items = data.get("items")
+    if not isinstance(items, list):
+        raise ValueError("itemsリストがありません")
 
-    Args:
-        trend_data: スクレイピングしたバズ投稿リスト [{text, likes, author}, ...]
+    results = []
+    for item in items:
+        try:
+            results.append(finish(item))
+        except ValueError as e:
+            print(f"[WARN] 生成結果を1件除外: {e}")
+    return results
+
+
+def generate_viral_post() -> dict:
+    """バズる投稿をAIで生成
 
     Returns:
-        dict: {post_text, image_quote, image_author, is_trend}
+        dict: {post_text, image_quote, image_author}
     """
-    if not trend_data:
-        return generate_viral_post()
+    result = _finish_post(_parse_response(gemini_client.generate(SYSTEM_PROMPT, "post")))
+    print(f"[OK] AI投稿を生成しました（{len(result['post_text'])}文字）")
+    return result
+
 
+def generate_viral_posts(count=5) -> list:
+    """バズる投稿をまとめて生成（1リクエストで count 件）"""
+    results = _generate_batch(SYSTEM_PROMPT, "post", count, _finish_post)
+    print(f"[OK] AI投稿を {len(results)} 件生成しました")
+    return results
+
+
+def _trend_prompt(trend_data) -> str:
     # 上位投稿を参考テキストとして使う
     top_posts = trend_data[:3]
     trend_text = "\n---\n".join(
         f"いいね数: {p.get('likes', 0)}\n{p['text']}" for p in top_posts
     )
+    return TREND_PROMPT_TEMPLATE.format(trend_text=trend_text)
 
-    prompt = TREND_PROMPT_TEMPLATE.format(trend_text=trend_text)
 
-    model = _get_model()
-    response = model.generate_content(
-        prompt,
-        generation_config=genai.GenerationConfig(
-            temperature=1.0,
-            max_output_tokens=500,
-        ),
-    )
+def _finish_trend_post(result) -> dict:
+    result = _finish_post(result)
+    result["is_trend"] = True
+    return result
 
-    result = _parse_response(response.text)
 
-    if "post_text" not in result:
-        raise ValueError("post_text がありません")
+def generate_trend_post(trend_data: list) -> dict:
+    """トレンド情報を参考にバズ投稿を生成
 
-    result.setdefault("image_quote", "")
-    result.setdefault("image_author", "")
-    result["is_trend"] = True
+    Args:
+        trend_data: スクレイピングしたバズ投稿リスト [{text, likes, author}, ...]
 
+    Returns:
+        dict: {post_text, image_quote, image_author, is_trend}
+    """
+    if not trend_data:
+        return generate_viral_post()
+
+    result = _finish_trend_post(_parse_response(gemini_client.generate(_trend_prompt(trend_data), "post")))
     print(f"[OK] AIトレンド投稿を生成しました（{len(result['post_text'])}文字）")
     return result
 
 
+def generate_trend_posts(trend_data: list, count=3) -> list:
+    """トレンド参考のバズ投稿をまとめて生成（1リクエストで count 件）"""
+    if not trend_data:
+        return []
+    results = _generate_batch(_trend_prompt(trend_data), "post", count, _finish_trend_post)
+    print(f"[OK] AIトレンド投稿を {len(results)} 件生成しました")
+    return results
+
+
 THREAD_PROMPT = """あなたはX（旧Twitter）で月100万インプレッションを達成したSNSマーケターです。
 お金・成功・マインドセットをテーマに、バズるスレッドを作ってください。
 
@@ -226,16 +246,17 @@ THREAD_PROMPT = """あなたはX（旧Twitter）で月100万インプレッシ
 
 【出力形式】
 以下のJSON形式のみ出力。他の文章は絶対に不要。
+image_quote と image_author を tweets より先に出力すること。
 {
+  "image_quote": "画像に載せるインパクトある一言（25文字以内）",
+  "image_author": "名言の著者（オリジナルなら空文字）",
   "tweets": [
     "1ツイート目の本文",
     "2ツイート目の本文",
     "3ツイート目の本文",
     "4ツイート目の本文",
     "5ツイート目の本文 #お金 #マインドセット #成功法則"
-  ],
-  "image_quote": "画像に載せるインパクトある一言（25文字以内）",
-  "image_author": "名言の著者（オリジナルなら空文字）"
+  ]
 }
 """
 
@@ -246,34 +267,48 @@ def generate_thread() -> dict:
     Returns:
         dict: {tweets: [str, ...], image_quote, image_author}
     """
-    model = _get_model()
-
-    response = model.generate_content(
-        THREAD_PROMPT,
-        generation_config=genai.GenerationConfig(
-            temperature=1.0,
-            max_output_tokens=800,
-        ),
-    )
+    result = _finish_thread(_parse_response(gemini_client.generate(THREAD_PROMPT, "thread")))
+    print(f"[OK] スレッドを生成しました（{len(result['tweets'])}ツイート）")
+    return result
 
-    result = _parse_response(response.text)
 
-    if "tweets" not in result or not isinstance(result["tweets"], list):
-        raise ValueError("tweetsリストがありません")
+def generate_thread_stream(on_tweet=None, on_image=None) -> dict:
+    """スレッドをストリーミングで生成する（戻り値は generate_thread と同じ）
 
-    # 各ツイートの文字数チェック
+    応答を読みながら、完成したツイートから順に on_tweet(番号, ツイート) を呼ぶ（文字数チェック済み）。
+    画像用の一言と著者がそろった時点で on_image(image_quote, image_author) を呼ぶ。
+    プロンプトでは画像用の一言を tweets より先に出させるので、ツイートの生成中から
+    後続の処理（画像生成など）を始められる。
+    """
+    parser = JsonStreamParser()
     tweets = []
-    for tweet in result["tweets"]:
-        if len(tweet) > 280:
-            tweet = tweet[:277] + "..."
-        tweets.append(tweet)
-    result["tweets"] = tweets
+    fields = {}
+    image_sent = False
+    for chunk in gemini_client.generate_stream(THREAD_PROMPT, "thread"):
+        for key, value, is_item in parser.feed(chunk):
+            if key == "tweets" and is_item:
+                tweet = _fit_tweet(value)
+                tweets.append(tweet)
+                if on_tweet:
+                    on_tweet(len(tweets) - 1, tweet)
+                continue
+            fields[key] = value
+            if on_image and not image_sent and "image_quote" in fields and "image_author" in fields:
+                image_sent = True
+                on_image(fields["image_quote"], fields["image_author"])
+
+    result = _finish_thread(parser.result())
+    if on_image and not image_sent:
+        on_image(result["image_quote"], result["image_author"])
+    print(f"[OK] スレッドを生成しました（{len(result['tweets'])}ツイート）")
+    return result
 
-    result.setdefault("image_quote", "")
-    result.setdefault("image_author", "")
 
-    print(f"[OK] スレッドを生成しました（{len(tweets)}ツイート）")
-    return result
+def generate_threads(count=3) -> list:
+    """スレッドをまとめて生成（1リクエストで count 件）"""
+    results = _generate_batch(THREAD_PROMPT, "thread", count, _finish_thread)
+    print(f"[OK] スレッドを {len(results)} 件生成しました")
+    return results
 
 
 if __name__ == "__main__":
@@ -0,0 +1,201 @@
+"""AI生成コンテンツの作り置き（プール）
+
+投稿の直前に Gemini を呼ぶと、その待ち時間と失敗がそのまま投稿に響く。
+そこで検証済みのAI投稿・スレッドを ai_pool.json に作り置きしておき、
+投稿時はプールから1件取り出すだけにする（APIは呼ばない）。
+
+  - 種類（viral / trend / thread）ごとに残りが LOW_WATER を下回ったら TARGET まで補充
+  - 補充は1リクエストで BATCH_SIZE 件まとめて生成
+  - 古くなった作り置き（MAX_AGE_HOURS 超え）は取り出さずに捨てる
+  - ほぼ同じ内容は dedup_index で除外
+
+補充: python ai_pool.py refill    残数の確認: python ai_pool.py status
+"""
+
+import os
+import sys
+import json
+import time
+
+from dedup_index import DedupIndex
+
+DEFAULT_POOL_FILE = os.path.join(os.path.dirname(__file__), "ai_pool.json")
+KINDS = ("viral", "trend", "thread")
+
+LOW_WATER = {"viral": 3, "trend": 2, "thread": 2}   # これを下回ったら補充
+TARGET = {"viral": 8, "trend": 4, "thread": 4}      # 補充するときの目標数
+MAX_AGE_HOURS = {"viral": 24 * 7, "trend": 24, "thread": 24 * 7}  # トレンドは鮮度が大事
+BATCH_SIZE = {"viral": 4, "trend": 2, "thread": 2}  # 1リクエストで生成する件数
+MAX_REQUESTS = 3                                   # 1回の補充で種類ごとに送るリクエストの上限
+QUOTA_RESERVE = 30                                 # Gemini の1日の残りがこれ以下なら補充しない（投稿・リプライ用）
+
+
+def _item_text(kind, data) -> str:
+    """重複判定に使う本文（スレッドは1ツイート目）"""
+    if kind == "thread":
+        return data["tweets"][0]
+    return data["post_text"]
+
+
+class AIPool:
+    """作り置きのAIコンテンツ（JSONファイルに保存）"""
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("AI_POOL_FILE", DEFAULT_POOL_FILE)
+        self.items = {kind: [] for kind in KINDS}  # 種類 -> [{"created": 時刻, "data": {...}}]（古い順）
+        self._taken = []  # take() で取り出したもの（restore() で戻せる）
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] AIプールを読み込めません（空として扱います）: {e}")
+            return
+        for kind in KINDS:
+            self.items[kind] = [
+                item for item in data.get(kind, [])
+                if isinstance(item, dict) and "created" in item and "data" in item
+            ]
+
+    def save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.items, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def prune(self, now=None) -> int:
+        """古くなった作り置きを捨てて、捨てた件数を返す"""
+        now = time.time() if now is None else now
+        dropped = 0
+        for kind in KINDS:
+            limit = MAX_AGE_HOURS[kind] * 3600
+            fresh = [item for item in self.items[kind] if now - item["created"] <= limit]
+            dropped += len(self.items[kind]) - len(fresh)
+            self.items[kind] = fresh
+        return dropped
+
+    def count(self, kind) -> int:
+        return len(self.items[kind])
+
+    def needed(self, kind) -> int:
+        """補充すべき件数（LOW_WATER 以上あれば0）"""
+        if self.count(kind) >= LOW_WATER[kind]:
+            return 0
+        return TARGET[kind] - self.count(kind)
+
+    def add(self, kind, candidates, now=None) -> int:
+        """検証済みの候補を追加（既存とほぼ同じものは除外）して、追加した件数を返す"""
+        now = time.time() if now is None else now
+        index = DedupIndex()
+        index.add_all(_item_text(kind, item["data"]) for item in self.items[kind])
+        added = 0
+        for data in candidates:
+            duplicate = index.add_if_new(_item_text(kind, data))
+            if duplicate is not None:
+                print(f"[INFO] AIプール: 重複のため除外（類似度 {duplicate[1]:.2f}）")
+                continue
+            self.items[kind].append({"created": now, "data": data})
+            added += 1
+        return added
+
+    def take(self, kind):
+        """一番古い（期限内の）作り置きを取り出す（なければ None）
+
+        ファイルには保存しないので、投稿に成功してから save() する（失敗時はそのまま残る）。
+        """
+        self.prune()
+        if not self.items[kind]:
+            return None
+        item = self.items[kind].pop(0)
+        self._taken.append((kind, item))
+        return item["data"]
+
+    def restore(self):
+        """take() で取り出したものを元の位置に戻す（投稿に失敗したとき）"""
+        while self._taken:
+            kind, item = self._taken.pop()
+            self.items[kind].insert(0, item)
+
+
+def refill(pool, trend_data_fn=None) -> dict:
+    """LOW_WATER を下回った種類を補充して {種類: 追加件数} を返す
+
+    trend_data_fn: トレンド投稿を取得する関数（ブラウザを使うので必要なときだけ呼ぶ）
+    """
+    import gemini_client
+    from ai_generator import generate_viral_posts, generate_trend_posts, generate_threads
+
+    dropped = pool.prune()
+    if dropped:
+        print(f"[INFO] AIプール: 期限切れを {dropped} 件削除")
+
+    trend_data = None
+    added = {}
+    for kind in KINDS:
+        added[kind] = 0
+        if not pool.needed(kind):
+            continue
+        if kind == "trend":
+            if trend_data_fn is None:
+                continue
+            try:
+                trend_data = trend_data_fn()
+            except Exception as e:
+                print(f"[WARN] トレンド取得失敗: {e}")
+                continue
+            if not trend_data:
+                continue
+
+        for _ in range(MAX_REQUESTS):
+            need = TARGET[kind] - pool.count(kind)
+            if need <= 0:
+                break
+            if gemini_client.remaining_today() <= QUOTA_RESERVE:
+                print("[INFO] Gemini APIの今日の残りが少ないため補充を見送ります")
+                pool.save()
+                return added
+            size = min(BATCH_SIZE[kind], need)
+            try:
+                if kind == "viral":
+                    candidates = generate_viral_posts(size)
+                elif kind == "trend":
+                    candidates = generate_trend_posts(trend_data, size)
+                else:
+                    candidates = generate_threads(size)
+            except Exception as e:
+                print(f"[WARN] AIプールの補充に失敗（{kind}）: {e}")
+                break
+            added[kind] += pool.add(kind, candidates)
+            # 途中で止まっても生成済みの分は残す
+            pool.save()
+    pool.save()
+    return added
+
+
+def _scrape_trend_data():
+    import random
+    from trend_scraper import scrape_trending_posts, TREND_QUERIES
+    return scrape_trending_posts(search_query=random.choice(TREND_QUERIES), max_posts=5)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    pool = AIPool()
+    if command == "refill":
+        use_trend = "--no-trend" not in sys.argv
+        result = refill(pool, _scrape_trend_data if use_trend else None)
+        print(f"[OK] AIプールを補充しました: {result}")
+    elif command == "status":
+        pool.prune()
+    else:
+        print("使い方: python ai_pool.py [status | refill [--no-trend]]")
+        sys.exit(1)
+    for kind in KINDS:
+        print(f"  {kind}: {pool.count(kind)} 件（補充の目安 {LOW_WATER[kind]} 件未満）")
@@ -15,10 +15,7 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-try:
-    import google.generativeai as genai
-except ImportError:
-    genai = None
+import gemini_client
 
 COOKIE_FILE = os.path.join(os.path.dirname(__file__), "x_cookies.pkl")
 REPLY_HISTORY_FILE = os.path.join(os.path.dirname(__file__), "reply_history.json")
@@ -131,20 +128,8 @@ def _save_reply_history(urls: list):
 
 def _generate_reply(post_text: str) -> str:
     """Gemini AIでリプライを生成"""
-    if genai is None:
-        raise ImportError("google-generativeai がインストールされていません")
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY が設定されていません")
-
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-2.0-flash")
     prompt = REPLY_PROMPT.format(post_text=post_text[:200])
-    response = model.generate_content(
-        prompt,
-        generation_config=genai.GenerationConfig(temperature=1.0, max_output_tokens=150),
-    )
-    reply = response.text.strip()
+    reply = gemini_client.generate(prompt, "reply").strip()
     # ハッシュタグを念のため除去
     reply = re.sub(r"#\S+", "", reply).strip()
     return reply[:100]
@@ -261,6 +246,8 @@ def run_auto_reply(replies_per_run=3):
     replied_urls = []
 
     try:
+        # ブラウザ起動・検索の間にGeminiの準備を済ませておく
+        gemini_client.prewarm()
         is_ci = bool(os.getenv("CI"))
         driver = _create_driver(headless=is_ci or True)
 
@@ -289,6 +276,10 @@ def run_auto_reply(replies_per_run=3):
         selected = random.sample(target_posts, min(replies_per_run, len(target_posts)))
 
         for post in selected:
+            # 1日の上限に達していたら生成を試さずに終える（流量制限の待ちは generate 側で行う）
+            if gemini_client.expected_wait() == float("inf"):
+                print("[WARN] Gemini APIの1日の上限に達しているため、リプライを終了します")
+                break
             try:
                 # AIでリプライを生成
                 reply_text = _generate_reply(post["text"])
@@ -0,0 +1,404 @@
+"""名言画像生成のベンチマーク
+
+generate_quote_image の各段階（グラデーション・ビネット・ボケ・ノイズ・折り返し・
+カード・テキスト・書き出し）と描画全体の所要時間を、名言の長さ × 背景モード
+（グラデーション / 写真）ごとに計測し、JSONに書き出す。
+
+Wikimedia API はローカルの代替サーバーに置き換えるのでネットワークなしで動く。
+キャッシュはすべて一時ディレクトリを使うので、普段のキャッシュには触れない。
+
+使い方:
+    python benchmark_image.py                       # benchmark_results.json に保存
+    python benchmark_image.py --repeat 10 --output before.json
+    python benchmark_image.py --baseline before.json  # 前回より遅くなった段階を報告
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import tracemalloc
+import contextlib
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows
+
+import numpy as np
+from PIL import Image
+
+# 計測する名言（長さ別）
+QUOTES = {
+    "short": ("小さな一歩が大きな未来をつくる。", "作者不明"),
+    "medium": (
+        "成功とは、失敗を重ねても情熱を失わずに進み続ける能力のことだ。"
+        "昨日の自分を超えることだけを考えればいい。",
+        "ウィンストン・チャーチル",
+    ),
+    "long": (
+        "人生で一番大切なのは、何を持っているかではなく、誰と一緒にいるかだ。"
+        "お金は失っても取り戻せるが、時間と信頼は二度と戻らない。"
+        "だからこそ今日という一日を、大切な人のために、そして未来の自分のために使おう。"
+        "小さな積み重ねが、やがて誰にも真似できない大きな差になる。",
+        "アンドリュー・カーネギー",
+    ),
+    "paragraphs": (
+        "夢を見ることができれば、それは実現できる。\n\n"
+        "いつだって忘れないでほしい。\nすべては一匹のネズミから始まったということを。",
+        "ウォルト・ディズニー",
+    ),
+}
+
+BACKGROUND_MODES = ("gradient", "photo")
+JPEG_MAX_BYTES = 300 * 1024  # ci_post の投稿画像と同じ容量上限
+STUB_PHOTO_SIZE = (1280, 853)
+STUB_CANDIDATES = 5
+
+
+class _StubWikimediaHandler(BaseHTTPRequestHandler):
+    """Wikimedia Commons API の代替（検索結果と画像を返す）"""
+
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if parsed.path == "/w/api.php":
+            query = urllib.parse.parse_qs(parsed.query).get("gsrsearch", [""])[0]
+            key = hashlib.sha1(query.encode("utf-8")).hexdigest()[:8]
+            host, port = self.server.server_address[:2]
+            pages = {
+                str(i): {"imageinfo": [{"thumburl": f"http://{host}:{port}/img/{key}-{i}.jpg"}]}
+                for i in range(STUB_CANDIDATES)
+            }
+            self._send(json.dumps({"query": {"pages": pages}}).encode("utf-8"), "application/json")
+        elif parsed.path.startswith("/img/"):
+            self._send(self.server.photo_bytes, "image/jpeg")
+        else:
+            self.send_error(404)
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _make_stub_photo() -> bytes:
+    """写真の代わりになるJPEG（グラデーション + ノイズでデコード負荷を実写に近づける）"""
+    width, height = STUB_PHOTO_SIZE
+    rng = np.random.default_rng(0)
+    ramp = np.linspace(40, 200, width, dtype=np.float32)
+    arr = np.empty((height, width, 3), dtype=np.float32)
+    arr[...] = ramp[None, :, None]
+    arr += rng.normal(0, 25, size=arr.shape)
+    img = Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8), "RGB")
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+def start_stub_server(latency=0.0):
+    """代替サーバーを起動して (サーバー, APIのURL) を返す"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubWikimediaHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.photo_bytes = _make_stub_photo()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/w/api.php"
+
+
+def _summary(samples) -> dict:
+    """計測値（秒）をミリ秒の統計にまとめる"""
+    ms = [s * 1000 for s in samples]
+    return {
+        "runs": len(ms),
+        "min_ms": round(min(ms), 3),
+        "median_ms": round(statistics.median(ms), 3),
+        "mean_ms": round(statistics.mean(ms), 3),
+        "max_ms": round(max(ms), 3),
+    }
+
+
+def _measure(fn, repeat, warmup=1):
+    """fn(i) を warmup 回空回ししてから repeat 回計測（i は空回しも含め通し番号）"""
+    for i in range(warmup):
+        fn(repeat + i)
+    samples = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+    return _summary(samples)
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB, macOS は バイト
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_case(ig, length, mode, repeat, work_dir):
+    """1ケース（名言の長さ × 背景モード）の段階別・全体の所要時間を計測"""
+    from image_effects import gradient_array, vignette_mask, apply_vignette, add_noise
+    from image_encoder import encode_image, save_image
+
+    quote, author = QUOTES[length]
+    scheme = ig.COLOR_SCHEMES[0]
+    width, height = ig.WIDTH, ig.HEIGHT
+    use_photo = mode == "photo"
+    stages = {}
+
+    # 背景（写真は代替サーバーから取得 → 加工、グラデーションはキャッシュなしで計算）
+    if use_photo:
+        query = ig.LUXURY_QUERIES[0]
+        photos = []
+        stages["photo_fetch"] = _measure(
+            lambda i: photos.append(ig._fetch_luxury_background(query, random.Random(i))), repeat)
+        raw = next((p for p in photos if p is not None), None)
+        if raw is None:
+            raise RuntimeError("代替サーバーから写真を取得できませんでした")
+        stages["photo_prepare"] = _measure(
+            lambda i: ig._prepare_background_photo(raw, width, height), repeat)
+        background = np.asarray(ig._prepare_background_photo(raw, width, height).convert("RGB"))
+    else:
+        stages["gradient"] = _measure(
+            lambda i: gradient_array(width, height, scheme["grad1"], scheme["grad2"]), repeat)
+        background = gradient_array(width, height, scheme["grad1"], scheme["grad2"])
+
+    stages["vignette"] = _measure(
+        lambda i: apply_vignette(background, vignette_mask(width, height)), repeat)
+
+    buf = np.empty((height, width, 4), dtype=np.uint8)
+    buf[:, :, 3] = 255
+    buf[:, :, :3] = background
+
+    if not use_photo:
+        def bokeh(i):
+            buf[:, :, :3] = background
+            ig._add_light_bokeh(buf, scheme["glow"], count=7, rng=random.Random(i))
+        stages["bokeh"] = _measure(bokeh, repeat)
+
+    rgb = buf[:, :, :3]
+    stages["noise"] = _measure(
+        lambda i: add_noise(rgb, intensity=4 if use_photo else 6,
+                            rng=np.random.default_rng(i), out=rgb), repeat)
+
+    # 前景（折り返し・カード・テキスト）。同じキャンバスに重ね描きするが所要時間は変わらない
+    stages["wrap"] = _measure(lambda i: ig.compute_layout(quote, author), repeat)
+    layout = ig.compute_layout(quote, author)
+    canvas = Image.fromarray(buf, "RGBA")
+    x1, y1, x2, y2 = layout["card"]
+    stages["card"] = _measure(
+        lambda i: ig._draw_glass_card(canvas, x1, y1, x2, y2, opacity=80 if use_photo else 55), repeat)
+
+    font_quote = ig.get_font(ig.FONT_SIZE_QUOTE)
+    font_author = ig.get_font(ig.FONT_SIZE_AUTHOR)
+
+    def text(i):
+        ig._draw_text_block(canvas, layout["quote_items"], font_quote, "#ffffff",
+                            shadow_offsets=[(3, 3), (2, 2), (1, 1)])
+        ig._draw_text_block(canvas, layout["author_items"], font_author, "#d4af37",
+                            shadow_offsets=[(1, 1)])
+    stages["text"] = _measure(text, repeat)
+
+    # 描画全体（書き出しなし）と書き出し
+    rendered = []
+    stages["render"] = _measure(
+        lambda i: rendered.append(ig._render_quote_image(quote, author, random.Random(i), use_photo=use_photo)),
+        repeat)
+    render_stats = dict(ig.last_render_stats)
+    final = rendered[-1]
+    del rendered[:-1]
+    stages["encode_png"] = _measure(lambda i: encode_image(final, "png"), repeat)
+    stages["encode_jpeg"] = _measure(lambda i: encode_image(final, "jpeg", max_bytes=JPEG_MAX_BYTES), repeat)
+
+    # 描画 + ファイル書き出し（描画キャッシュを除いた generate_quote_image 相当）
+    output_path = os.path.join(work_dir, f"{length}_{mode}.jpg")
+
+    def total(i):
+        img = ig._render_quote_image(quote, author, random.Random(i), use_photo=use_photo)
+        with contextlib.redirect_stdout(io.StringIO()):
+            save_image(img, output_path, "jpeg", max_bytes=JPEG_MAX_BYTES)
+    stages["total"] = _measure(total, repeat)
+
+    # ピークメモリ（tracemalloc は計測を遅くするので別に1回だけ描画）
+    tracemalloc.start()
+    try:
+        ig._render_quote_image(quote, author, random.Random(0), use_photo=use_photo)
+        _, traced_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "length": length,
+        "mode": mode,
+        "quote_chars": len(quote),
+        "lines": len(layout["lines"]),
+        "stages": stages,
+        "memory": {
+            "traced_peak_mb": round(traced_peak / (1024 * 1024), 2),
+            "max_rss_mb": _max_rss_mb(),
+            "pil_images": render_stats.get("pil_images"),
+            "pil_blocks": render_stats.get("pil_blocks"),
+            "canvas_bytes": render_stats.get("canvas_bytes"),
+        },
+    }
+
+
+def compare_results(baseline, results, threshold=0.25, min_delta_ms=1.0) -> list:
+    """前回の結果と比べて、中央値が threshold 以上遅くなった段階を返す
+
+    揺らぎで誤検知しないよう、差が min_delta_ms 未満のものは無視する。
+    """
+    previous = {(c["length"], c["mode"]): c["stages"] for c in baseline.get("cases", [])}
+    regressions = []
+    for case in results["cases"]:
+        old_stages = previous.get((case["length"], case["mode"]), {})
+        for stage, stats in case["stages"].items():
+            old = old_stages.get(stage)
+            if not old:
+                continue
+            before, after = old["median_ms"], stats["median_ms"]
+            if after - before >= min_delta_ms and after > before * (1 + threshold):
+                regressions.append({
+                    "length": case["length"],
+                    "mode": case["mode"],
+                    "stage": stage,
+                    "before_ms": before,
+                    "after_ms": after,
+                    "ratio": round(after / before, 2) if before else None,
+                })
+    return regressions
+
+
+def _git_commit():
+    try:
+        import subprocess
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(lengths, modes, repeat=5, latency=0.0) -> dict:
+    """代替サーバーと一時キャッシュを用意して全ケースを計測"""
+    server, api_url = start_stub_server(latency)
+    work_dir = tempfile.mkdtemp(prefix="quote_bench_")
+    # image_generator などは読み込み時・初回利用時に環境変数を見るので先に設定する
+    os.environ["WIKIMEDIA_API_URL"] = api_url
+    for name in ("PHOTO_CACHE_DIR", "LAYER_CACHE_DIR", "RENDER_CACHE_DIR"):
+        os.environ[name] = os.path.join(work_dir, name.lower())
+
+    try:
+        import PIL
+        import image_generator as ig
+        if ig.WIKIMEDIA_API_URL != api_url:
+            raise RuntimeError("image_generator が先に読み込まれているため代替サーバーを使えません")
+
+        cases = []
+        for length in lengths:
+            for mode in modes:
+                started = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    case = run_case(ig, length, mode, repeat, work_dir)
+                cases.append(case)
+                print(f"[OK] {length}/{mode}: 描画 {case['stages']['render']['median_ms']:.1f}ms "
+                      f"（計測 {time.perf_counter() - started:.1f}秒）")
+
+        from font_registry import get_stats
+        return {
+            "meta": {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "git_commit": _git_commit(),
+                "renderer_version": ig.RENDERER_VERSION,
+                "python": platform.python_version(),
+                "pillow": PIL.__version__,
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "font_path": get_stats()["font_path"],
+                "repeat": repeat,
+                "stub_latency_ms": latency * 1000,
+            },
+            "cases": cases,
+        }
+    finally:
+        server.shutdown()
+        server.server_close()
+        import shutil
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def print_table(results):
+    """段階別の中央値（ms）を表にして表示"""
+    stage_names = []
+    for case in results["cases"]:
+        for stage in case["stages"]:
+            if stage not in stage_names:
+                stage_names.append(stage)
+    header = f"{'case':<20}" + "".join(f"{name:>14}" for name in stage_names) + f"{'peak MB':>10}"
+    print(header)
+    print("-" * len(header))
+    for case in results["cases"]:
+        row = f"{case['length'] + '/' + case['mode']:<20}"
+        for name in stage_names:
+            stats = case["stages"].get(name)
+            row += f"{stats['median_ms']:>14.2f}" if stats else f"{'-':>14}"
+        row += f"{case['memory']['traced_peak_mb']:>10.1f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="名言画像生成のベンチマーク（オフライン）")
+    parser.add_argument("--repeat", type=int, default=5, help="各段階の計測回数")
+    parser.add_argument("--lengths", nargs="+", choices=list(QUOTES), default=list(QUOTES),
+                        help="計測する名言の長さ")
+    parser.add_argument("--modes", nargs="+", choices=BACKGROUND_MODES, default=list(BACKGROUND_MODES),
+                        help="計測する背景モード")
+    parser.add_argument("--latency", type=float, default=0.0, help="代替サーバーの応答遅延（ミリ秒）")
+    parser.add_argument("--output", default="benchmark_results.json", help="結果の保存先（JSON）")
+    parser.add_argument("--baseline", help="比較する前回の結果（JSON）")
+    parser.add_argument("--threshold", type=float, default=0.25, help="遅くなったと判定する割合")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.lengths, args.modes, repeat=args.repeat, latency=args.latency / 1000)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print()
+    print_table(results)
+    print(f"\n[OK] 結果を保存: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, threshold=args.threshold)
+        results["regressions"] = regressions
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        for r in regressions:
+            print(f"[WARN] {r['length']}/{r['mode']} {r['stage']}: "
+                  f"{r['before_ms']:.2f}ms → {r['after_ms']:.2f}ms（{r['ratio']}倍）")
+        if regressions:
+            sys.exit(1)
+        print("[OK] 前回から遅くなった段階はありません")
@@ -5,6 +5,7 @@ import sys
 import random
 import time
 import json
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,11 +20,14 @@ if max_delay_minutes > 0:
 
 from twitter_client import TwitterClient
 from content_generator import ContentGenerator
-from image_generator import generate_quote_image
+from image_generator import generate_quote_image, prefetch_backgrounds
 from trend_scraper import get_buzz_post_for_reference, scrape_trending_posts, TREND_QUERIES
+from ai_pool import AIPool
+from stage_graph import StageGraph
 
 try:
-    from ai_generator import generate_viral_post, generate_trend_post, generate_thread
+    from ai_generator import generate_viral_post, generate_trend_post, generate_thread_stream
+    import gemini_client
     AI_AVAILABLE = True
 except ImportError:
     AI_AVAILABLE = False
@@ -32,6 +36,60 @@ except ImportError:
 # 投稿タイプのローテーション記録ファイル
 ROTATION_FILE = os.path.join(os.path.dirname(__file__), "post_rotation.json")
 
+# 添付画像: Xで再圧縮されるので、見た目を損なわない範囲で小さいJPEGにしてアップロードを速くする
+QUOTE_IMAGE_PATH = "quote_image.jpg"
+QUOTE_IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", 300 * 1024))
+
+# 並行して進める各段階のタイムアウト（秒）
+STAGE_TIMEOUTS = {
+    "browser": 240,      # Chrome起動 + Cookieログイン（失敗時の自動ログイン込み）
+    "backgrounds": 60,   # 背景写真キャッシュの補充
+    "trends": 180,       # トレンド投稿の取得（ブラウザ）
+    "content": 180,      # 投稿内容の生成（AI・フォールバック込み）
+    "image": 120,        # 画像生成
+}
+# タイムアウトした投稿生成の結果を待つ秒数（間に合わなければ名言投稿に切り替える）
+CANCEL_GRACE = 30
+
+
+_ai_pool = None
+
+
+def _take_from_pool(kind):
+    """作り置きのAIコンテンツを1件取り出す（なければ None）。投稿成功後に _commit_pool() で確定"""
+    global _ai_pool
+    try:
+        if _ai_pool is None:
+            _ai_pool = AIPool()
+        data = _ai_pool.take(kind)
+    except Exception as e:
+        print(f"[WARN] AIプールの読み込み失敗: {e}")
+        return None
+    if data is not None:
+        print(f"[OK] AIプールから取り出しました（{kind}、残り {_ai_pool.count(kind)} 件）")
+    return data
+
+
+def _restore_pool():
+    """取り出した作り置きをプールに戻す（投稿に失敗したとき）"""
+    if _ai_pool is not None:
+        _ai_pool.restore()
+
+
+def _commit_pool():
+    """取り出した作り置きをプールから消す（投稿成功時のみ）"""
+    if _ai_pool is None:
+        return
+    try:
+        _ai_pool.save()
+    except OSError as e:
+        print(f"[WARN] AIプールの保存失敗: {e}")
+
+
+def _make_quote_image(quote: str, author: str) -> str:
+    """投稿用の名言画像を生成"""
+    return generate_quote_image(quote, author, QUOTE_IMAGE_PATH, max_bytes=QUOTE_IMAGE_MAX_BYTES)
+
 
 def _load_rotation() -> dict:
     """ローテーション状態を読み込む"""
@@ -69,41 +127,241 @@ def _should_use_trend() -> bool:
     return _get_post_type() == "trend"
 
 
-def _try_ai_post(use_trend: bool):
-    """AI生成で投稿を作成（成功時はcontent, image_pathを返す）"""
-    if not AI_AVAILABLE:
-        return None, None
+def _prefetch_backgrounds():
+    """背景写真キャッシュの不足分を先に取得（コンテンツ生成と並行）"""
+    fetched = prefetch_backgrounds()
+    if fetched:
+        print(f"[OK] 背景写真を {fetched} キーワード分先に取得しました")
+    return fetched
 
+
+def _scrape_trend_data():
+    """AIに渡すトレンド投稿を取得"""
+    print("[INFO] AI + トレンド参考モードで生成中...")
+    query = random.choice(TREND_QUERIES)
+    return scrape_trending_posts(search_query=query, max_posts=5)
+
+
+def _ai_ready() -> bool:
+    """その場でAI生成できるか（1日の上限・流量制限の待ち時間を呼ぶ前に確認）"""
+    if not AI_AVAILABLE:
+        return False
+    wait = gemini_client.expected_wait()
+    if wait > gemini_client.MAX_WAIT:
+        reason = "1日の上限に達しています" if wait == float("inf") else f"待ち時間 {wait:.0f}秒"
+        print(f"[INFO] Gemini APIを使いません（{reason}）")
+        return False
+    return True
+
+
+def _ai_post(ai_result, use_trend, live, trend_data=None):
+    """AI生成の投稿（作り置きがなければ、live ならその場で生成）。失敗時は None"""
+    if ai_result is not None:
+        return ai_result
+    if not live:
+        return None
     try:
         if use_trend:
-            # トレンド情報を取得してAIに渡す
-            print("[INFO] AI + トレンド参考モードで生成中...")
-            query = random.choice(TREND_QUERIES)
-            trend_data = scrape_trending_posts(search_query=query, max_posts=5)
-            ai_result = generate_trend_post(trend_data)
-        else:
-            print("[INFO] AIモードで投稿を生成中...")
-            ai_result = generate_viral_post()
-
-        content = ai_result["post_text"]
-        image_path = None
-
-        # 画像生成
-        if ai_result.get("image_quote"):
-            try:
-                image_path = generate_quote_image(
-                    ai_result["image_quote"],
-                    ai_result.get("image_author", ""),
-                )
-                print(f"[OK] AI画像を生成: {image_path}")
-            except Exception as e:
-                print(f"[WARN] AI画像生成失敗: {e}")
-
-        return content, image_path
-
+            return generate_trend_post(trend_data)
+        print("[INFO] AIモードで投稿を生成中...")
+        return generate_viral_post()
     except Exception as e:
         print(f"[WARN] AI生成失敗: {e}。従来モードにフォールバック。")
-        return None, None
+        return None
+
+
+def _quote_post(cancel=None):
+    """posts.txt の名言投稿（最終フォールバック）。cancel が set されたら履歴を進めずに None"""
+    generator = ContentGenerator()
+
+    remaining = generator.get_remaining_count()
+    print(f"未投稿の残り: {remaining} 件")
+
+    if remaining == 0:
+        # 尽きていても補充が間に合えば投稿を続ける
+        remaining = generator.wait_for_refill(cancel=cancel)
+
+    if cancel is not None and cancel.is_set():
+        print("[INFO] 投稿生成の中断を受けたため、名言を選ばずに終了します")
+        return None
+
+    if remaining == 0:
+        print("[WARN] 全投稿が使用済みです。posts.txt に新しい内容を追加してください。")
+        return {"content": None, "exhausted": True, "generator": generator}
+
+    content = generator.generate_post()
+    quote, author = None, ""
+    raw_post = generator.last_post or ""
+    if " - " in raw_post:
+        quote_part, author = raw_post.rsplit(" - ", 1)
+        quote = quote_part.replace("「", "").replace("」", "")
+    return {"content": content, "quote": quote, "author": author, "use_trend": False, "generator": generator}
+
+
+def _make_content(ai_result, use_trend, live, trend_data=None, cancel=None) -> dict:
+    """投稿内容を決める: AI → （トレンド回なら）従来のトレンド投稿 → 名言
+
+    cancel（タイムアウトで set される）を受けたら、ブラウザや投稿履歴に触れる前に None を返す。
+
+    Returns:
+        dict: {content, quote, author, use_trend, generator}
+    """
+    ai_post = _ai_post(ai_result, use_trend, live, trend_data)
+    if ai_post:
+        return {
+            "content": ai_post["post_text"],
+            "quote": ai_post.get("image_quote"),
+            "author": ai_post.get("image_author", ""),
+            "use_trend": use_trend,
+        }
+
+    if cancel is not None and cancel.is_set():
+        return None
+
+    # === AI失敗時: 従来モードにフォールバック ===
+    print("[INFO] 従来モードで投稿を生成します...")
+    if use_trend:
+        try:
+            trend_result = get_buzz_post_for_reference()
+            if trend_result:
+                return {
+                    "content": trend_result["post_text"],
+                    "quote": trend_result.get("image_quote"),
+                    "author": trend_result.get("image_author", ""),
+                    "use_trend": True,
+                }
+        except Exception as e:
+            print(f"[WARN] トレンド処理エラー: {e}")
+
+    return _quote_post(cancel)
+
+
+def _post_image(content, cancel=None):
+    """投稿に添付する画像を生成（失敗時・中断を受けたときは None）"""
+    if not content or not content.get("quote"):
+        return None
+    if cancel is not None and cancel.is_set():
+        # 後から書くと、代わりに作り直した画像（同じファイル）を上書きしてしまう
+        return None
+    try:
+        image_path = _make_quote_image(content["quote"], content.get("author", ""))
+        print(f"[OK] 投稿画像を生成: {image_path}")
+        return image_path
+    except Exception as e:
+        print(f"[WARN] 画像生成失敗: {e}")
+        return None
+
+
+def _thread_content(thread_result, on_image):
+    """スレッドの内容（作り置きがなければその場でストリーミング生成）
+
+    画像用の一言が決まった時点で on_image(image_quote, image_author) を呼ぶ。
+    """
+    if thread_result is None:
+        print("[INFO] AIスレッドを生成中...")
+        thread_result = generate_thread_stream(
+            on_tweet=lambda i, tweet: print(f"[INFO] ツイート{i + 1}を受信（{len(tweet)}文字）"),
+            on_image=on_image,
+        )
+    else:
+        on_image(thread_result.get("image_quote"), thread_result.get("image_author", ""))
+    if not thread_result.get("tweets"):
+        raise ValueError("tweetsリストがありません")
+    return {
+        "tweets": thread_result["tweets"],
+        "quote": thread_result.get("image_quote"),
+        "author": thread_result.get("image_author", ""),
+    }
+
+
+def _add_browser_stage(graph, client):
+    """ブラウザ準備の段階（タイムアウト後に準備が終わったブラウザは閉じる）
+
+    タイムアウトすると _posting_client() が別の TwitterClient を作るので、
+    元の準備が後から終わってもそのブラウザは使われない。
+    """
+    graph.add("browser", client.prepare, timeout=STAGE_TIMEOUTS["browser"],
+              on_late=lambda prepared: client.close())
+
+
+def _late_content(graph):
+    """タイムアウトした投稿生成が CANCEL_GRACE 秒以内に返した投稿内容（なければ None）
+
+    中断より先に名言を選び終えていた場合はその内容を使う（履歴が二重に進まないように）。
+    まだ動いていても、中断を受けた生成は履歴に触れずに終わるので名言投稿に切り替えてよい。
+    """
+    if graph.status("content") != "timeout":
+        return None
+    if not graph.join("content", CANCEL_GRACE):
+        print("[WARN] タイムアウトした投稿生成がまだ終わりません。名言投稿に切り替えます")
+        return None
+    return graph.stages["content"].late_value
+
+
+def _posting_client(graph, client):
+    """事前準備したブラウザを使う（準備がタイムアウトしたら新しく作り直す）
+
+    スレッドの生成に失敗して通常投稿にフォールバックするときは、ログイン済みの
+    ブラウザをそのまま使い回す（prepare() はすぐ返る）。スレッドを投稿しようとした後は
+    post_thread() がブラウザを閉じているので、通常投稿の prepare() で起動し直す。
+    """
+    if graph.status("browser") == "timeout":
+        return TwitterClient()
+    return client
+
+
+def _run_thread(client):
+    """スレッド投稿。(成功したか, 通常投稿に使う TwitterClient) を返す"""
+    thread_result = _take_from_pool("thread")
+    if thread_result is None:
+        if not _ai_ready():
+            return False, client
+        gemini_client.prewarm()
+
+    # 画像はスレッド全体の生成を待たず、画像用の一言が届いた時点で作り始める
+    image_ready = threading.Event()
+    image_text = {}
+
+    def on_image(quote, author):
+        image_text.update(quote=quote, author=author)
+        image_ready.set()
+
+    def content():
+        try:
+            return _thread_content(thread_result, on_image)
+        finally:
+            image_ready.set()
+
+    def image(backgrounds, cancel):
+        image_ready.wait()
+        return _post_image(image_text, cancel)
+
+    graph = StageGraph()
+    _add_browser_stage(graph, client)
+    graph.add("backgrounds", _prefetch_backgrounds, timeout=STAGE_TIMEOUTS["backgrounds"])
+    graph.add("content", content, timeout=STAGE_TIMEOUTS["content"])
+    graph.add("image", image, deps=("backgrounds",),
+              timeout=STAGE_TIMEOUTS["content"] + STAGE_TIMEOUTS["image"], cancellable=True)
+    results = graph.run()
+    graph.report()
+
+    client = _posting_client(graph, client)
+    thread = results["content"]
+    if not thread:
+        # 準備済みのブラウザは通常投稿でそのまま使う
+        print("[WARN] スレッド生成失敗。通常投稿にフォールバック。")
+        _restore_pool()
+        return False, client
+
+    result = client.post_thread(thread["tweets"], image_path=results["image"])
+    if result["success"]:
+        _commit_pool()
+        _save_rotation({"last_type": "thread"})
+        print(f"[OK] スレッド投稿完了（{result.get('posted_count', 0)}件）")
+        return True, client
+    print(f"[WARN] スレッド投稿失敗: {result.get('error')}。通常投稿にフォールバック。")
+    _restore_pool()
+    return False, client
 
 
 def main():
@@ -111,93 +369,67 @@ def main():
     use_trend = (post_type == "trend")
     print(f"[INFO] 今回の投稿タイプ: {post_type}")
 
+    client = TwitterClient()
+
     # === スレッド投稿モード ===
     if post_type == "thread" and AI_AVAILABLE:
-        try:
-            print("[INFO] AIスレッドを生成中...")
-            thread_result = generate_thread()
-            tweets = thread_result.get("tweets", [])
-            if tweets:
-                image_path = None
-                if thread_result.get("image_quote"):
-                    try:
-                        image_path = generate_quote_image(
-                            thread_result["image_quote"],
-                            thread_result.get("image_author", ""),
-                        )
-                    except Exception as e:
-                        print(f"[WARN] スレッド画像生成失敗: {e}")
-
-                client = TwitterClient()
-                result = client.post_thread(tweets, image_path=image_path)
-                if result["success"]:
-                    _save_rotation({"last_type": "thread"})
-                    print(f"[OK] スレッド投稿完了（{result.get('posted_count', 0)}件）")
-                    sys.exit(0)
-                else:
-                    print(f"[WARN] スレッド投稿失敗: {result.get('error')}。通常投稿にフォールバック。")
-        except Exception as e:
-            print(f"[WARN] スレッド生成失敗: {e}。通常投稿にフォールバック。")
+        posted, client = _run_thread(client)
+        if posted:
+            sys.exit(0)
         post_type = "quote"
         use_trend = False
 
-    # === AI生成を最優先 ===
-    content, image_path = _try_ai_post(use_trend)
-
-    # === AI失敗時: 従来モードにフォールバック ===
-    if not content:
-        print("[INFO] 従来モードで投稿を生成します...")
-
-        if use_trend:
-            try:
-                trend_result = get_buzz_post_for_reference()
-                if trend_result:
-                    content = trend_result["post_text"]
-                    try:
-                        image_path = generate_quote_image(
-                            trend_result["image_quote"],
-                            trend_result.get("image_author", ""),
-                        )
-                    except Exception as e:
-                        print(f"[WARN] トレンド画像生成失敗: {e}")
-            except Exception as e:
-                print(f"[WARN] トレンド処理エラー: {e}")
-
-    if not content:
-        # 名言投稿（最終フォールバック）
-        generator = ContentGenerator()
-
-        remaining = generator.get_remaining_count()
-        print(f"未投稿の残り: {remaining} 件")
-
-        if remaining == 0:
-            print("[WARN] 全投稿が使用済みです。posts.txt に新しい内容を追加してください。")
+    # === AI生成を最優先（作り置き → その場で生成 → 従来モード） ===
+    # ブラウザ起動・背景写真の取得は投稿内容の生成と並行して進める
+    ai_result = _take_from_pool("trend" if use_trend else "viral")
+    live_ai = ai_result is None and _ai_ready()
+    if live_ai:
+        gemini_client.prewarm()
+
+    graph = StageGraph()
+    _add_browser_stage(graph, client)
+    graph.add("backgrounds", _prefetch_backgrounds, timeout=STAGE_TIMEOUTS["backgrounds"])
+    if live_ai and use_trend:
+        graph.add("trends", _scrape_trend_data, timeout=STAGE_TIMEOUTS["trends"])
+        graph.add("content", lambda trends, cancel: _make_content(None, True, True, trends, cancel),
+                  deps=("trends",), timeout=STAGE_TIMEOUTS["content"], cancellable=True)
+    else:
+        graph.add("content", lambda cancel: _make_content(ai_result, use_trend, live_ai, cancel=cancel),
+                  timeout=STAGE_TIMEOUTS["content"], cancellable=True)
+    graph.add("image", lambda content, backgrounds, cancel: _post_image(content, cancel),
+              deps=("content", "backgrounds"), timeout=STAGE_TIMEOUTS["image"], cancellable=True)
+    results = graph.run()
+    graph.report()
+
+    content = results["content"]
+    image_path = results["image"]
+    if content is None:
+        # 生成段階が失敗・タイムアウトしたら名言投稿で続ける
+        content = _late_content(graph) or _quote_post()
+        image_path = _post_image(content)
+
+    generator = content.get("generator")
+    try:
+        if content.get("exhausted"):
+            client.close()
             sys.exit(0)
-
-        content = generator.generate_post()
-        if not content:
+        if not content["content"]:
             print("[ERROR] 投稿内容を取得できませんでした")
+            client.close()
             sys.exit(1)
+        use_trend = content["use_trend"]
 
-        try:
-            raw_post = generator.history[-1] if generator.history else ""
-            if " - " in raw_post:
-                quote_part, author_part = raw_post.rsplit(" - ", 1)
-                quote_text = quote_part.replace("「", "").replace("」", "")
-                image_path = generate_quote_image(quote_text, author_part)
-                print(f"[OK] 名言画像を生成: {image_path}")
-        except Exception as e:
-            print(f"[WARN] 画像生成失敗: {e}")
-
-        if use_trend:
-            use_trend = False
+        print(f"投稿内容: {content['content']}")
 
-    print(f"投稿内容: {content}")
-
-    client = TwitterClient()
-    result = client.post_tweet(content, image_path=image_path)
+        client = _posting_client(graph, client)
+        result = client.post_tweet(content["content"], image_path=image_path)
+    finally:
+        if generator is not None:
+            # どの終わり方でも、始まった名言の補充を書き終えてから終了する
+            generator.close()
 
     if result["success"]:
+        _commit_pool()
         _save_rotation({"last_type": "trend" if use_trend else "quote"})
         print("[OK] 投稿完了!")
         sys.exit(0)
@@ -1,13 +1,23 @@
 """テキストファイルから投稿内容を読み込むモジュール（重複防止付き・API自動補充）"""
 
 import os
-import json
 import random
-import urllib.request
-
-DEFAULT_HISTORY_FILE = os.path.join(os.path.dirname(__file__), "post_history.json")
-MEIGEN_API_URL = "https://meigen.doodlenote.net/api/json.php?c=10"
-AUTO_REFILL_THRESHOLD = 5  # 残りがこの数以下になったら自動補充
+import time
+import zlib
+import threading
+from collections import Counter
+
+from history_log import HistoryLog
+from shuffle_bag import ShuffleBag
+from quote_refill import RefillWorker, REFILL_BUFFER
+from dedup_index import DedupIndex, DEFAULT_THRESHOLD
+
+DEFAULT_HISTORY_FILE = os.path.join(os.path.dirname(__file__), "post_history.jsonl")
+DEFAULT_BAG_FILE = os.path.join(os.path.dirname(__file__), "post_bag.bin")
+# 直近この件数の投稿と同じ著者はなるべく避ける（0で無効, 環境変数 AUTHOR_COOLDOWN）
+AUTHOR_COOLDOWN = 0
+# 未投稿が尽きたとき、諦める前に名言の補充を待つ秒数
+EXHAUSTED_REFILL_WAIT = 60
 
 # 共感フック（冒頭に付ける一言）
 HOOKS = [
@@ -67,12 +77,112 @@ HASHTAGS = [
 ]
 
 
+class PostIndex:
+    """投稿と投稿履歴の索引
+
+    存在確認・未投稿数を O(1) で返す（未投稿からの選択はシャッフルバッグが行う）。
+    投稿の追加（add_posts）と投稿済みの記録（mark_posted）のたびに差分で更新する。
+    投稿IDは posts.txt に初めて出てきた順の通し番号（シャッフルバッグ用）。
+    """
+
+    def __init__(self, posts=(), history=()):
+        self.ids = {}                 # 投稿 -> 投稿ID
+        self.by_id = []               # 投稿ID -> 投稿
+        self.post_counts = Counter()  # 投稿 -> posts.txt 内の出現数
+        self.posted = set(history)
+        self.total = 0                # posts.txt の件数
+        self.remaining = 0            # 未投稿の件数（重複行も数える）
+        self._unposted = set()        # 未投稿（重複なし）
+        self.add_posts(posts)
+
+    def __contains__(self, post):
+        """posts.txt か履歴のどちらかにあれば True"""
+        return post in self.post_counts or post in self.posted
+
+    def all_texts(self):
+        """posts.txt と履歴の投稿（重複なし）"""
+        yield from self.post_counts
+        yield from (post for post in self.posted if post not in self.post_counts)
+
+    def add_posts(self, posts):
+        """投稿を追加（未投稿なら未投稿として数える）"""
+        for post in posts:
+            if post not in self.posted:
+                self._unposted.add(post)
+                self.remaining += 1
+            if post not in self.ids:
+                self.ids[post] = len(self.by_id)
+                self.by_id.append(post)
+            self.post_counts[post] += 1
+            self.total += 1
+
+    def mark_posted(self, post):
+        """投稿済みにして未投稿から外す"""
+        if post in self.posted:
+            return
+        self.posted.add(post)
+        self.remaining -= self.post_counts.get(post, 0)
+        self._unposted.discard(post)
+
+    # --- シャッフルバッグ用 ---
+
+    @property
+    def id_count(self) -> int:
+        return len(self.by_id)
+
+    @property
+    def unposted_count(self) -> int:
+        """未投稿の件数（重複なし）"""
+        return len(self._unposted)
+
+    def unposted_ids(self, start=0) -> list:
+        return [i for i in range(start, len(self.by_id)) if self.by_id[i] not in self.posted]
+
+    def is_posted_id(self, post_id) -> bool:
+        return self.by_id[post_id] in self.posted
+
+    def post_of(self, post_id):
+        return self.by_id[post_id]
+
+    def fingerprint(self, count) -> int:
+        """先頭 count 件のチェックサム（posts.txt の途中が書き換えられたら変わる）"""
+        return zlib.crc32("\n".join(self.by_id[:count]).encode("utf-8"))
+
+
 class ContentGenerator:
     def __init__(self):
         self.file_path = os.getenv("POSTS_FILE", "posts.txt")
-        self.history_file = os.getenv("HISTORY_FILE", DEFAULT_HISTORY_FILE)
-        self.posts = self._load_posts()
-        self.history = self._load_history()
+        self.history_log = HistoryLog(os.getenv("HISTORY_FILE", DEFAULT_HISTORY_FILE))
+        self.history_file = self.history_log.path
+        self.last_post = None  # 直前に選んだ投稿（整形前の1行）
+        self.db = None
+        # 補充ワーカーのスレッドと投稿処理が同時に索引を触らないようにする
+        self._lock = threading.RLock()
+
+        if os.getenv("POST_DB"):
+            # SQLite版: 投稿・履歴はデータベースだけで管理する（posts / history は読み込まない）
+            from post_db import PostDatabase
+            self.db = PostDatabase(os.getenv("POST_DB"))
+            if not self.db.total:
+                self.db.import_files(self.file_path, self.history_log)
+            self.posts = self.history = None
+            self.index = self.db
+            print(f"データベースから読み込みました（{self.db.total} 件）: {self.db.path}")
+        else:
+            self.posts = self._load_posts()
+            self.history = self._load_history()
+            self.index = PostIndex(self.posts, self.history)
+
+        # 未投稿をシャッフル済みで保存した袋（再起動しても続きから取り出す）
+        self.bag = ShuffleBag(os.getenv("BAG_FILE", DEFAULT_BAG_FILE))
+        self.bag.sync(self.index)
+        self.author_cooldown = int(os.getenv("AUTHOR_COOLDOWN", AUTHOR_COOLDOWN))
+
+        # 未投稿が refill_buffer 件を下回ったら裏で名言APIから補充
+        self.refill_buffer = int(os.getenv("REFILL_BUFFER", REFILL_BUFFER))
+        self.refill = RefillWorker(needed=self._refill_needed, deliver=self._add_fetched)
+        self.dedup_threshold = float(os.getenv("DEDUP_THRESHOLD", DEFAULT_THRESHOLD))
+        self._dedup = None  # 初めて補充するときに作る
 
     def _load_posts(self) -> list:
         """投稿ファイルを読み込む"""
@@ -86,84 +196,138 @@ class ContentGenerator:
         print(f"投稿ファイルから {len(posts)} 件読み込みました")
         return posts
 
-    def _fetch_from_api(self, count=10) -> list:
-        """名言APIから新しい名言を取得"""
-        try:
-            url = f"https://meigen.doodlenote.net/api/json.php?c={count}"
-            resp = urllib.request.urlopen(url, timeout=10)
-            data = json.loads(resp.read().decode("utf-8"))
-            quotes = []
-            for item in data:
-                text = f"「{item['meigen']}」 - {item['auther']}"
-                if text not in self.posts and text not in self.history:
-                    quotes.append(text)
-            print(f"[API] {len(quotes)} 件の新しい名言を取得しました")
-            return quotes
-        except Exception as e:
-            print(f"[WARN] 名言APIの取得に失敗: {e}")
-            return []
+    def _refill_needed(self) -> int:
+        """補充ワーカー用: あと何件あれば refill_buffer に届くか"""
+        with self._lock:
+            return self.refill_buffer - self.get_remaining_count()
+
+    def _dedup_index(self) -> DedupIndex:
+        """posts.txt と履歴全体のほぼ重複検出用の索引（初回のみ作る）"""
+        if self._dedup is None:
+            self._dedup = DedupIndex(self.dedup_threshold)
+            self._dedup.add_all(self.index.all_texts())
+        return self._dedup
+
+    def _add_fetched(self, quotes) -> int:
+        """APIから取得した名言のうち新しいものだけを追加（補充ワーカーから呼ばれる）
+
+        括弧・句読点・著者名の表記ゆれだけが違う名言もほぼ重複として除く。
+        """
+        with self._lock:
+            dedup = self._dedup_index()
+            new_posts = []
+            for text in quotes:
+                if text in self.index:
+                    continue
+                duplicate = dedup.add_if_new(text)
+                if duplicate is not None:
+                    print(f"[INFO] ほぼ重複のため除外（類似度 {duplicate[1]:.2f}）: {text}")
+                    continue
+                new_posts.append(text)
+            if new_posts:
+                self._append_to_file(new_posts)
+            return len(new_posts)
 
     def _append_to_file(self, new_posts: list):
-        """新しい投稿をposts.txtに追加"""
+        """新しい投稿をposts.txtに追加（SQLite版ではデータベースに source=api で追加）"""
+        if self.db is not None:
+            added = self.db.add_posts(new_posts, source="api")
+            self.bag.sync(self.index)
+            print(f"[OK] データベースに {len(added)} 件追加しました（合計 {self.db.total} 件）")
+            return
         with open(self.file_path, "a", encoding="utf-8") as f:
             for post in new_posts:
                 f.write(post + "\n")
         self.posts.extend(new_posts)
+        self.index.add_posts(new_posts)
+        self.bag.sync(self.index)
         print(f"[OK] posts.txt に {len(new_posts)} 件追加しました（合計 {len(self.posts)} 件）")
 
     def auto_refill(self):
-        """残りが少なくなったらAPIから自動補充"""
+        """残りが少なくなったら裏で補充を始める（待たずにすぐ戻る）"""
         remaining = self.get_remaining_count()
-        if remaining <= AUTO_REFILL_THRESHOLD:
-            print(f"[INFO] 残り {remaining} 件。APIから名言を自動補充します...")
-            new_posts = self._fetch_from_api(20)
-            if new_posts:
-                self._append_to_file(new_posts)
-            else:
-                print("[WARN] APIから名言を取得できませんでした")
+        if remaining < self.refill_buffer:
+            print(f"[INFO] 残り {remaining} 件。バックグラウンドで名言を補充します")
+            self.refill.kick()
+
+    def wait_for_refill(self, timeout=EXHAUSTED_REFILL_WAIT, cancel=None) -> int:
+        """未投稿がないとき: 補充を始め、1件以上届くか timeout 秒たつまで待って残り件数を返す
+
+        cancel（threading.Event）が set されたら待つのをやめる。
+        """
+        if self.get_remaining_count() == 0:
+            print(f"[INFO] 未投稿がありません。名言の補充を最大 {timeout} 秒待ちます")
+            self.refill.kick()
+            deadline = time.monotonic() + timeout
+            while self.get_remaining_count() == 0 and time.monotonic() < deadline:
+                if cancel is not None and cancel.is_set():
+                    break
+                time.sleep(0.2)
+        return self.get_remaining_count()
+
+    def close(self, timeout=30):
+        """補充ワーカーを止める（補充中なら書き終えるまで待つ。プロセス終了前に呼ぶ）"""
+        self.refill.stop(timeout)
 
     def _load_history(self) -> list:
-        """投稿履歴を読み込む"""
-        if not os.path.exists(self.history_file):
-            return []
+        """投稿履歴を読み込む（旧形式の post_history.json は自動で移行）"""
         try:
-            with open(self.history_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except:
+            return self.history_log.load()
+        except OSError as e:
+            print(f"[WARN] 投稿履歴の読み込みに失敗: {e}")
             return []
 
-    def _save_history(self):
-        """投稿履歴を保存"""
-        with open(self.history_file, "w", encoding="utf-8") as f:
-            json.dump(self.history, f, ensure_ascii=False, indent=2)
+    def _record_history(self, post):
+        """投稿済みとして履歴に1行追記"""
+        self.last_post = post
+        self.index.mark_posted(post)
+        if self.db is None:
+            self.history.append(post)
+            self.history_log.append(post)
+
+    def _recent_posts(self, count) -> list:
+        if self.db is not None:
+            return self.db.recent(count)
+        return self.history[-count:]
+
+    def _pick(self):
+        """シャッフルバッグから未投稿を1件取り出す
+
+        author_cooldown > 0 なら直近の投稿と同じ著者を引いたときに引き直す（最大数回）。
+        """
+        accept = None
+        if self.author_cooldown > 0:
+            recent_authors = {
+                post.rsplit(" - ", 1)[1] for post in self._recent_posts(self.author_cooldown) if " - " in post
+            }
+            if recent_authors:
+                def accept(post):
+                    return " - " not in post or post.rsplit(" - ", 1)[1] not in recent_authors
+
+        post = self.bag.pick(self.index, accept=accept)
+        if post is None and self.index.unposted_count:
+            # 袋が壊れていた等で空なら作り直す
+            self.bag.rebuild(self.index)
+            post = self.bag.pick(self.index, accept=accept)
+        return post
 
     def generate_post(self) -> str:
         """まだ投稿していない内容をランダムに選択する"""
-        if not self.posts:
+        if not self.index.total:
             return ""
 
-        # 自動補充チェック
+        # 補充が必要なら裏で始める（ここではネットワークを待たない）
         self.auto_refill()
 
-        # 未投稿のものだけ抽出
-        available = [p for p in self.posts if p not in self.history]
-
-        if not available:
-            print("[WARN] 全ての投稿が使用済みです")
-            # 最後の手段: APIから取得して即使う
-            new_posts = self._fetch_from_api(10)
-            if new_posts:
-                self._append_to_file(new_posts)
-                available = new_posts
-            else:
+        # 未投稿のものから選ぶ
+        with self._lock:
+            post = self._pick()
+            if post is None:
+                print("[WARN] 全ての投稿が使用済みです（補充が終わるまで投稿できません）")
                 return ""
+            self._record_history(post)
 
-        post = random.choice(available)
-        self.history.append(post)
-        self._save_history()
-
-        remaining = len(self.posts) - len(self.history)
-        print(f"残り未投稿: {remaining} 件")
+        print(f"残り未投稿: {self.index.remaining} 件")
 
         # フォーマット整形 + ハッシュタグ追加
         formatted = self._format_post(post)
@@ -201,7 +365,7 @@ class ContentGenerator:
 
     def get_remaining_count(self) -> int:
         """未投稿の数を返す"""
-        return len([p for p in self.posts if p not in self.history])
+        return self.index.remaining
 
 
 if __name__ == "__main__":
@@ -0,0 +1,185 @@
+"""名言の重複（ほぼ同じ文）を見つける索引
+
+括弧・空白・句読点の違いを正規化で吸収したうえで、文字n-gramの MinHash + LSH で
+似た名言の候補だけを引き、候補との類似度（Jaccard係数）を実際に計算して判定する。
+コーパス全体と比較せずに済むので、件数が増えても1件あたりの確認はほぼ一定時間。
+
+著者名は「アルベルト・アインシュタイン」→「アインシュタイン」のように正規化して比べる。
+著者が違う場合は、より高い類似度（DIFFERENT_AUTHOR_THRESHOLD）でなければ重複としない
+（正規化後に完全に一致する名言は著者に関係なく重複とする）。
+"""
+
+import re
+import zlib
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.8           # これ以上似ていれば重複（環境変数 DEDUP_THRESHOLD）
+DIFFERENT_AUTHOR_THRESHOLD = 0.95  # 著者が違うときの判定基準
+NGRAM = 2                          # 日本語の短文なので文字2-gram
+NUM_PERM = 64
+BANDS = 16                         # 16バンド × 4行: 類似度0.5前後から候補になる
+
+_MERSENNE = (1 << 31) - 1
+_perm_rng = np.random.default_rng(20240601)
+_PERM_A = _perm_rng.integers(1, _MERSENNE, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _perm_rng.integers(0, _MERSENNE, size=NUM_PERM, dtype=np.uint64)
+
+# 表記ゆれする著者名（正規化後の名前 → 代表の名前）
+AUTHOR_ALIASES = {
+    "ガンディー": "ガンジー",
+    "ジョブス": "ジョブズ",
+}
+
+_QUOTE_MARKS = "「」『』\"'“”‘’()（）[]［］【】〈〉《》"
+_AUTHOR_SEPARATORS = re.compile(r"[・･=＝.\s]+")
+
+
+def normalize_quote(text) -> str:
+    """括弧・空白・句読点・記号を除き、全角半角と大文字小文字をそろえる"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(
+        ch for ch in text
+        if ch not in _QUOTE_MARKS and not ch.isspace() and unicodedata.category(ch)[0] not in "PS"
+    )
+
+
+def normalize_author(name) -> str:
+    """著者名を比較用にそろえる（区切りのある名前は最後の部分＝姓で代表させる）"""
+    if not name:
+        return ""
+    name = unicodedata.normalize("NFKC", name).strip()
+    parts = [p for p in _AUTHOR_SEPARATORS.split(name) if p]
+    if not parts:
+        return ""
+    key = parts[-1]
+    return AUTHOR_ALIASES.get(key, key)
+
+
+def split_post(text):
+    """「名言」 - 著者 を (名言, 著者) に分ける"""
+    if " - " in text:
+        quote, author = text.rsplit(" - ", 1)
+        return quote, author
+    return text, ""
+
+
+def shingles(normalized, n=NGRAM) -> set:
+    if len(normalized) <= n:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + n] for i in range(len(normalized) - n + 1)}
+
+
+def minhash(shingle_set) -> np.ndarray:
+    """MinHash の署名（NUM_PERM 個の最小ハッシュ値）"""
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) & _MERSENNE for s in shingle_set),
+        dtype=np.uint64, count=len(shingle_set),
+    )
+    if hashes.size == 0:
+        return np.zeros(NUM_PERM, dtype=np.uint64)
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _MERSENNE).min(axis=1)
+
+
+def jaccard(a, b) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class DedupIndex:
+    """名言のほぼ重複を探す索引（追加・検索とも候補数に比例する時間）"""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._texts = []
+        self._shingles = []
+        self._authors = []
+        self._exact = {}                                         # 正規化した名言 -> ID
+        self._buckets = [defaultdict(list) for _ in range(BANDS)]  # バンドのハッシュ -> ID
+
+    def __len__(self):
+        return len(self._texts)
+
+    def _prepare(self, text):
+        quote, author = split_post(text)
+        normalized = normalize_quote(quote)
+        sh = shingles(normalized)
+        signature = minhash(sh)
+        rows = NUM_PERM // BANDS
+        keys = [signature[b * rows:(b + 1) * rows].tobytes() for b in range(BANDS)]
+        return normalized, sh, normalize_author(author), keys
+
+    def add(self, text):
+        """名言を索引に追加"""
+        normalized, sh, author, keys = self._prepare(text)
+        self._insert(text, normalized, sh, author, keys)
+
+    def _insert(self, text, normalized, sh, author, keys):
+        doc_id = len(self._texts)
+        self._texts.append(text)
+        self._shingles.append(sh)
+        self._authors.append(author)
+        self._exact.setdefault(normalized, doc_id)
+        for band, key in enumerate(keys):
+            self._buckets[band][key].append(doc_id)
+
+    def add_all(self, texts):
+        for text in texts:
+            self.add(text)
+
+    def find_duplicate(self, text):
+        """似た名言があれば (既存の名言, 類似度) を返す（なければ None）"""
+        return self._find(*self._prepare(text))
+
+    def _find(self, normalized, sh, author, keys):
+        doc_id = self._exact.get(normalized)
+        if doc_id is not None:
+            return self._texts[doc_id], 1.0
+
+        candidates = set()
+        for band, key in enumerate(keys):
+            candidates.update(self._buckets[band].get(key, ()))
+
+        best = None
+        for doc_id in candidates:
+            similarity = jaccard(sh, self._shingles[doc_id])
+            other = self._authors[doc_id]
+            required = self.threshold
+            if author and other and author != other:
+                required = max(required, DIFFERENT_AUTHOR_THRESHOLD)
+            if similarity >= required and (best is None or similarity > best[1]):
+                best = (self._texts[doc_id], similarity)
+        return best
+
+    def add_if_new(self, text):
+        """重複がなければ追加して None、あれば (既存の名言, 類似度) を返す"""
+        prepared = self._prepare(text)
+        duplicate = self._find(*prepared)
+        if duplicate is None:
+            self._insert(text, *prepared)
+        return duplicate
+
+
+if __name__ == "__main__":
+    # posts.txt の中のほぼ重複を一覧表示
+    import os
+    import sys
+    import time
+
+    posts_file = sys.argv[1] if len(sys.argv) > 1 else os.getenv("POSTS_FILE", "posts.txt")
+    threshold = float(os.getenv("DEDUP_THRESHOLD", DEFAULT_THRESHOLD))
+    with open(posts_file, "r", encoding="utf-8") as f:
+        posts = [line.strip() for line in f if line.strip()]
+
+    index = DedupIndex(threshold)
+    started = time.perf_counter()
+    found = 0
+    for post in posts:
+        duplicate = index.add_if_new(post)
+        if duplicate is not None:
+            found += 1
+            print(f"[重複 {duplicate[1]:.2f}] {post}\n            ≒ {duplicate[0]}")
+    print(f"{len(posts)} 件中 {found} 件が重複（{time.perf_counter() - started:.2f}秒）")
@@ -0,0 +1,78 @@
+"""プロセス全体で共有するフォント管理モジュール
+
+フォントファイルの探索と ImageFont.truetype の読み込みは初回利用時に1回だけ行い、
+以降は同じフォントオブジェクトを使い回す。読み込みにかかった時間は get_stats() で確認できる。
+"""
+
+import os
+import time
+import threading
+
+from PIL import ImageFont
+
+# フォントパス（Windows / Linux CI 両対応）
+_FONT_CANDIDATES = [
+    "C:/Windows/Fonts/NotoSansJP-VF.ttf",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+]
+
+_lock = threading.Lock()
+_font_path = None
+_font_path_resolved = False
+_fonts = {}  # size -> フォント
+_stats = {"loads": 0, "hits": 0, "load_seconds": 0.0, "load_seconds_by_size": {}}
+
+
+def font_path():
+    """使用するフォントファイルのパス（見つからなければNone）
+
+    環境変数 FONT_PATH で上書きできる。探索は初回のみ。
+    """
+    global _font_path, _font_path_resolved
+    if not _font_path_resolved:
+        candidates = [os.getenv("FONT_PATH")] + _FONT_CANDIDATES
+        _font_path = next((f for f in candidates if f and os.path.exists(f)), None)
+        _font_path_resolved = True
+        if _font_path is None:
+            print("[WARN] 日本語フォントが見つかりません。デフォルトフォントを使用します")
+    return _font_path
+
+
+def get_font(size):
+    """指定サイズのフォントを返す（2回目以降はキャッシュ）"""
+    font = _fonts.get(size)
+    if font is not None:
+        _stats["hits"] += 1
+        return font
+
+    with _lock:
+        font = _fonts.get(size)
+        if font is not None:
+            _stats["hits"] += 1
+            return font
+        started = time.perf_counter()
+        path = font_path()
+        font = ImageFont.truetype(path, size) if path else ImageFont.load_default()
+        elapsed = time.perf_counter() - started
+        _fonts[size] = font
+        _stats["loads"] += 1
+        _stats["load_seconds"] += elapsed
+        _stats["load_seconds_by_size"][size] = elapsed
+    return font
+
+
+def preload(sizes):
+    """フォントをまとめて読み込んでおく（ワーカー起動時など）"""
+    for size in sizes:
+        get_font(size)
+
+
+def get_stats() -> dict:
+    """読み込み回数・キャッシュヒット数・読み込み時間"""
+    with _lock:
+        stats = dict(_stats)
+        stats["load_seconds_by_size"] = dict(_stats["load_seconds_by_size"])
+        stats["font_path"] = _font_path
+        return stats
@@ -0,0 +1,198 @@
+"""Gemini API の共通クライアント（ai_generator / auto_reply で共有）
+
+google.generativeai の読み込み・APIキーの設定・モデルの生成は初回だけ行い、
+以降の呼び出しは同じモデル（と接続）を使い回す。
+モデル名は環境変数 GEMINI_MODEL、生成設定は GENERATION_SETTINGS で一括管理する。
+各呼び出しの所要時間（ストリーミングなら最初の片が届くまでの時間も）は get_stats() で確認できる。
+呼び出しは rate_limiter の流量制限と1日の上限を守る（呼ぶ前の待ち時間は expected_wait()）。
+"""
+
+import os
+import time
+import threading
+
+from rate_limiter import get_limiter
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# 用途ごとの生成設定
+GENERATION_SETTINGS = {
+    "post": {"temperature": 1.0, "max_output_tokens": 500},
+    "thread": {"temperature": 1.0, "max_output_tokens": 800},
+    "reply": {"temperature": 1.0, "max_output_tokens": 150},
+}
+
+# 流量制限でこれ以上待つなら呼ばずに QuotaExceeded（環境変数 GEMINI_MAX_WAIT）
+MAX_WAIT = 120.0
+# 1リクエストの上限秒数（環境変数 GEMINI_TIMEOUT）。応答が止まっても呼び出し側が先に進めるように
+REQUEST_TIMEOUT = 60.0
+
+_lock = threading.Lock()
+_genai = None
+_models = {}  # モデル名 -> GenerativeModel
+_stats = {"calls": 0, "errors": 0, "seconds": 0.0, "setup_seconds": 0.0, "by_kind": {}}
+
+
+def _load_genai():
+    """google.generativeai を読み込んでAPIキーを設定（初回のみ。読み込みが遅いので遅延させる）"""
+    global _genai
+    if _genai is not None:
+        return _genai
+    try:
+        import google.generativeai as genai
+    except ImportError:
+        raise ImportError("google-generativeai がインストールされていません")
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY が設定されていません")
+    genai.configure(api_key=api_key)
+    _genai = genai
+    return genai
+
+
+def model_name() -> str:
+    return os.getenv("GEMINI_MODEL", DEFAULT_MODEL)
+
+
+def get_model():
+    """共有のモデルを返す（初回だけ生成）"""
+    name = model_name()
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _lock:
+        model = _models.get(name)
+        if model is None:
+            started = time.perf_counter()
+            genai = _load_genai()
+            model = genai.GenerativeModel(name)
+            _models[name] = model
+            _stats["setup_seconds"] += time.perf_counter() - started
+    return model
+
+
+def prewarm():
+    """モデルの準備を裏で始めておく（失敗しても何もしない）"""
+    def worker():
+        try:
+            get_model()
+        except Exception:
+            pass
+
+    thread = threading.Thread(target=worker, name="gemini-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def generation_config(kind, **overrides):
+    """用途 kind の生成設定（overrides で一部だけ上書き）"""
+    settings = dict(GENERATION_SETTINGS[kind])
+    settings.update(overrides)
+    return _load_genai().GenerationConfig(**settings)
+
+
+def expected_wait() -> float:
+    """今呼ぶと流量制限で何秒待つか（1日の上限に達していれば inf）"""
+    return get_limiter().expected_wait()
+
+
+def remaining_today() -> int:
+    """今日あと何回呼べるか"""
+    return get_limiter().remaining_today()
+
+
+def _request_options() -> dict:
+    return {"timeout": float(os.getenv("GEMINI_TIMEOUT", REQUEST_TIMEOUT))}
+
+
+def _acquire():
+    get_limiter().acquire(max_wait=float(os.getenv("GEMINI_MAX_WAIT", MAX_WAIT)))
+
+
+def _is_rate_limited(error) -> bool:
+    return (
+        getattr(error, "code", None) == 429
+        or type(error).__name__ == "ResourceExhausted"
+        or "429" in str(error)
+    )
+
+
+def _record_usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    get_limiter().record_tokens(getattr(usage, "total_token_count", 0))
+
+
+def generate(prompt, kind="post", **overrides) -> str:
+    """プロンプトを送って応答テキストを返す（所要時間を記録）"""
+    model = get_model()
+    config = generation_config(kind, **overrides)
+    _acquire()
+
+    started = time.perf_counter()
+    try:
+        response = model.generate_content(prompt, generation_config=config, request_options=_request_options())
+        text = response.text
+    except Exception as e:
+        _record(kind, time.perf_counter() - started, error=True)
+        if _is_rate_limited(e):
+            get_limiter().pause()
+        raise
+    elapsed = _record(kind, time.perf_counter() - started)
+    _record_usage(response)
+    print(f"[INFO] Gemini応答 {elapsed:.2f}秒（{kind}）")
+    return text
+
+
+def generate_stream(prompt, kind="post", **overrides):
+    """応答をストリーミングで受け取り、届いたテキスト片から順に返す（ジェネレーター）"""
+    model = get_model()
+    config = generation_config(kind, **overrides)
+    _acquire()
+
+    started = time.perf_counter()
+    first = None
+    try:
+        response = model.generate_content(prompt, generation_config=config, stream=True,
+                                          request_options=_request_options())
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # 本文のない片（終了理由だけ等）は読み飛ばす
+                continue
+            if first is None:
+                first = time.perf_counter() - started
+            yield text
+    except Exception as e:
+        _record(kind, time.perf_counter() - started, error=True)
+        if _is_rate_limited(e):
+            get_limiter().pause()
+        raise
+    elapsed = _record(kind, time.perf_counter() - started, first=first)
+    _record_usage(response)
+    print(f"[INFO] Gemini応答 {elapsed:.2f}秒（{kind}、最初の片 {first or 0:.2f}秒）")
+
+
+def _record(kind, elapsed, error=False, first=None):
+    with _lock:
+        _stats["calls"] += 1
+        _stats["seconds"] += elapsed
+        if error:
+            _stats["errors"] += 1
+        kind_stats = _stats["by_kind"].setdefault(kind, {"calls": 0, "seconds": 0.0, "last_seconds": 0.0})
+        kind_stats["calls"] += 1
+        kind_stats["seconds"] += elapsed
+        kind_stats["last_seconds"] = elapsed
+        if first is not None:
+            kind_stats["first_chunk_seconds"] = first
+    return elapsed
+
+
+def get_stats() -> dict:
+    """呼び出し回数・合計時間・準備にかかった時間（用途別の内訳つき）"""
+    with _lock:
+        stats = dict(_stats)
+        stats["by_kind"] = {k: dict(v) for k, v in _stats["by_kind"].items()}
+        stats["model"] = model_name()
+        return stats
@@ -0,0 +1,200 @@
+"""追記型の投稿履歴ログ（1行1件のJSON Lines）
+
+投稿のたびに1行だけ追記して fsync するので、履歴が増えても書き込みコストは一定で、
+途中で落ちても壊れるのは最後の1行だけ（読み込み時に読み飛ばす）。
+重複や壊れた行が溜まったら一時ファイル経由で書き直す（コンパクション）。
+旧形式の post_history.json（JSON配列）は初回読み込み時に一度だけ移行する。
+"""
+
+import os
+import json
+import time
+
+DEFAULT_HISTORY_LOG = os.path.join(os.path.dirname(__file__), "post_history.jsonl")
+COMPACT_WASTE_RATIO = 0.2   # 重複・壊れた行がこの割合を超えたら書き直す
+COMPACT_MIN_WASTE = 20      # ただしこの行数未満なら書き直さない
+_READ_BLOCK = 64 * 1024     # 末尾から読むときのブロックサイズ
+
+
+def _fsync_dir(path):
+    """ファイルの作成・置き換えをディレクトリごとディスクに反映（Windowsでは何もしない）"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _parse_line(raw):
+    """1行（bytes）を (投稿テキスト, 投稿時刻) にする（空行・壊れた行は (None, None)）"""
+    if not raw.strip():
+        return None, None
+    try:
+        record = json.loads(raw.decode("utf-8"))
+    except ValueError:
+        return None, None
+    if isinstance(record, str):
+        return record, None
+    if isinstance(record, dict) and isinstance(record.get("post"), str):
+        return record["post"], record.get("at")
+    return None, None
+
+
+def _encode_record(post, posted_at) -> bytes:
+    """1件分の行（posted_at は UNIX秒, 不明なら None）"""
+    record = {"post": post, "at": posted_at}
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class HistoryLog:
+    """投稿履歴（投稿済みテキストの並び）の追記型ログ"""
+
+    def __init__(self, path=None, legacy_path=None):
+        path = path or DEFAULT_HISTORY_LOG
+        if path.endswith(".json"):
+            # HISTORY_FILE に旧形式のパスが指定されていても .jsonl を使う
+            path += "l"
+        self.path = path
+        if legacy_path is None:
+            legacy_path = os.path.splitext(self.path)[0] + ".json"
+        self.legacy_path = legacy_path
+
+    def load(self) -> list:
+        """全履歴を古い順に返す（必要なら移行・コンパクションも行う）"""
+        return [post for post, _ in self.entries()]
+
+    def entries(self) -> list:
+        """全履歴を [(投稿, 投稿時刻), ...] の古い順で返す（重複・壊れた行は除く）"""
+        if not os.path.exists(self.path):
+            return self._migrate_legacy()
+
+        entries, seen = [], set()
+        lines = waste = 0
+        with open(self.path, "rb") as f:
+            for raw in f:
+                if not raw.strip():
+                    continue
+                lines += 1
+                post, posted_at = _parse_line(raw)
+                if post is None or post in seen:
+                    waste += 1
+                    continue
+                seen.add(post)
+                entries.append((post, posted_at))
+
+        if waste >= COMPACT_MIN_WASTE and waste > lines * COMPACT_WASTE_RATIO:
+            self.compact()
+        elif waste:
+            print(f"[INFO] 投稿履歴に重複・破損行が {waste} 件あります（読み飛ばしました）")
+        return entries
+
+    def append(self, post):
+        """1件追記して fsync する"""
+        data = _encode_record(post, int(time.time()))
+        created = not os.path.exists(self.path)
+        with open(self.path, "ab") as f:
+            # 前回の書き込みが途中で切れていたら改行で区切ってから追記
+            if f.tell() > 0 and not self._ends_with_newline():
+                data = b"\n" + data
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if created:
+            _fsync_dir(self.path)
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def recent(self, count) -> list:
+        """直近 count 件を古い順に返す（ファイルの末尾から必要な分だけ読む）"""
+        if count <= 0 or not os.path.exists(self.path):
+            return []
+        posts = []
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            pending = b""
+            while position > 0 and len(posts) < count:
+                size = min(_READ_BLOCK, position)
+                position -= size
+                f.seek(position)
+                chunk = f.read(size) + pending
+                lines = chunk.split(b"\n")
+                # 先頭は行の途中かもしれないので次のブロックに回す
+                pending = lines.pop(0) if position > 0 else b""
+                for raw in reversed(lines):
+                    post, _ = _parse_line(raw)
+                    if post is not None:
+                        posts.append(post)
+                        if len(posts) >= count:
+                            break
+        posts.reverse()
+        return posts
+
+    def compact(self):
+        """重複・壊れた行を除いて書き直す（一時ファイル経由で置き換え）"""
+        records, seen = [], set()
+        with open(self.path, "rb") as f:
+            for raw in f:
+                post, posted_at = _parse_line(raw)
+                if post is None or post in seen:
+                    continue
+                seen.add(post)
+                records.append(_encode_record(post, posted_at))
+        self._write_all(records)
+        print(f"[OK] 投稿履歴をコンパクションしました（{len(records)} 件）")
+
+    def rewrite(self, entries):
+        """[(投稿, 投稿時刻), ...] で履歴全体を置き換える（エクスポート用）"""
+        self._write_all([_encode_record(post, posted_at) for post, posted_at in entries])
+
+    def _write_all(self, records):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.writelines(records)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_dir(self.path)
+
+    def _migrate_legacy(self) -> list:
+        """旧形式（JSON配列）の履歴を移行して entries() の形で返す。移行後の旧ファイルは .bak に改名"""
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return []
+        try:
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] 旧形式の投稿履歴を読み込めません: {e}")
+            return []
+
+        entries, seen = [], set()
+        for post in legacy if isinstance(legacy, list) else []:
+            if isinstance(post, str) and post not in seen:
+                seen.add(post)
+                # 旧形式には投稿時刻がないので None にする
+                entries.append((post, None))
+        self.rewrite(entries)
+        os.replace(self.legacy_path, self.legacy_path + ".bak")
+        print(f"[OK] 投稿履歴を {os.path.basename(self.path)} に移行しました（{len(entries)} 件）")
+        return entries
+
+
+if __name__ == "__main__":
+    import sys
+
+    log = HistoryLog(os.getenv("HISTORY_FILE") or None)
+    if "--compact" in sys.argv:
+        log.load()
+        log.compact()
+    history = log.load()
+    print(f"投稿履歴: {len(history)} 件（{log.path}）")
+    for post in log.recent(5):
+        print(f"  {post}")
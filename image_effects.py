@@ -0,0 +1,168 @@
+"""背景エフェクトをNumPy配列で計算するモジュール
+
+各関数は配列を受け取って配列を返す（PILはボケの同心円マップを一度描くときだけ使う）。out 引数や dst を取る関数は
+渡された配列を直接書き換える。画像は (height, width, 3|4) の uint8 配列、
+マスクは (height, width) の uint8 配列。
+"""
+
+import random
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+def gradient_array(width, height, color1, color2):
+    """滑らかな対角線グラデーション（uint8, HxWx3）"""
+    # 対角線グラデーション + 微妙なカーブ
+    xs = np.arange(width, dtype=np.float64) / width * 0.6
+    ys = np.arange(height, dtype=np.float64) / height * 0.4
+    ratio = (ys[:, None] + xs[None, :]) ** 0.9  # 非線形で自然なグラデーション
+    c1 = np.asarray(color1, dtype=np.float64)
+    c2 = np.asarray(color2, dtype=np.float64)
+    # int() と同じく切り捨て（値は常に正）
+    out = c1 + (c2 - c1) * ratio[:, :, None]
+    return out.astype(np.uint8)
+
+
+def vignette_mask(width, height):
+    """ビネット用の明るさマスク（中央255 → 四隅ほど暗い, uint8, HxW）"""
+    cx, cy = width / 2, height / 2
+    max_dist = np.sqrt(cx ** 2 + cy ** 2)
+    dx = np.arange(width, dtype=np.float64) - cx
+    dy = np.arange(height, dtype=np.float64) - cy
+    ratio = np.sqrt(dx[None, :] ** 2 + dy[:, None] ** 2) / max_dist
+    # 中央は明るく、端は暗く
+    brightness = 255 * (1.0 - ratio * ratio * 0.6)
+    return np.clip(brightness.astype(np.int32), 0, 255).astype(np.uint8)
+
+
+# 一時配列を小さく抑えるため、行単位で分割して処理する
+_CHUNK_ROWS = 64
+
+
+def apply_vignette(arr, mask=None, out=None):
+    """ビネットを適用する
+
+    out を省略すると新しい配列を返す。out に arr 自身（やそのRGBビュー）を渡せば上書きする。
+    """
+    height, width = arr.shape[:2]
+    if mask is None:
+        mask = vignette_mask(width, height)
+    if out is None:
+        out = np.empty((height, width, 3), dtype=np.uint8)
+    for y0 in range(0, height, _CHUNK_ROWS):
+        y1 = min(y0 + _CHUNK_ROWS, height)
+        scale = mask[y0:y1].astype(np.float64) / 255.0
+        out[y0:y1] = arr[y0:y1, :, :3] * scale[:, :, None]
+    return out
+
+
+def add_noise(arr, intensity=8, rng=None, out=None):
+    """微細なノイズテクスチャ（RGB共通の輝度ノイズ）を加える
+
+    rng: numpy.random.Generator。省略時は random モジュールから種を取る
+    out を省略すると新しい配列を返す。out に arr 自身を渡せば上書きする。
+    """
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+    height, width = arr.shape[:2]
+    if out is None:
+        out = np.empty((height, width, 3), dtype=np.uint8)
+    noise = rng.integers(-intensity, intensity + 1, size=(height, width, 1), dtype=np.int8)
+    for y0 in range(0, height, _CHUNK_ROWS):
+        y1 = min(y0 + _CHUNK_ROWS, height)
+        rows = arr[y0:y1, :, :3].astype(np.int16)
+        rows += noise[y0:y1]
+        np.clip(rows, 0, 255, out=rows)
+        out[y0:y1] = rows
+    return out
+
+
+def alpha_blend(dst, src, x, y):
+    """RGBA配列 src を dst の (x, y) の位置にアルファ合成する（dstを直接更新）
+
+    dst の不透明な背景を前提に、src が重なる範囲だけを計算する。はみ出した部分は捨てる。
+    """
+    src_h, src_w = src.shape[:2]
+    dst_h, dst_w = dst.shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + src_w, dst_w), min(y + src_h, dst_h)
+    if x0 >= x1 or y0 >= y1:
+        return dst
+    patch = src[y0 - y:y1 - y, x0 - x:x1 - x]
+    region = dst[y0:y1, x0:x1, :3]
+    alpha = patch[:, :, 3:4].astype(np.uint16)
+    region[...] = (patch[:, :, :3] * alpha + region * (255 - alpha) + 127) // 255
+    return dst
+
+
+# ボケの同心円の間隔（ImageDraw で半径を3ずつ縮めながら円を重ねていた）
+BOKEH_RADIUS_STEP = 3
+
+
+@lru_cache(maxsize=128)
+def _bokeh_rings(radius):
+    """半径 radius の光の同心円マップ（(2r+1)x(2r+1), 各画素を最後に塗った円の半径, 0 は範囲外）
+
+    元の描き方（半径を BOKEH_RADIUS_STEP ずつ縮めながら ImageDraw.ellipse で塗り重ねる）を
+    そのまま小さな画像で1回だけ行い、円の縁の画素まで同じにする。半径は 30〜120 程度なので
+    半径ごとにキャッシュしても数十枚で済む。
+    """
+    size = 2 * radius + 1
+    rings = Image.new("L", (size, size), 0)
+    draw = ImageDraw.Draw(rings)
+    for i in range(radius, 0, -BOKEH_RADIUS_STEP):
+        draw.ellipse([(radius - i, radius - i), (radius + i, radius + i)], fill=i)
+    rings = np.asarray(rings)
+    rings.setflags(write=False)
+    return rings
+
+
+def draw_bokeh(dst, lights, color):
+    """ボケの光 [(x, y, 半径, 最大アルファ), ...] を dst に合成する（dstを直接更新）
+
+    ImageDraw で1枚のオーバーレイに円を塗ってから合成していたときと同じく、
+    光が重なったところは後の光が前の光を上書きする（足し合わせない）。
+    オーバーレイは全部の光を囲む範囲のアルファだけを持つ（色は全部の光で共通）。
+    """
+    height, width = dst.shape[:2]
+    boxes = [
+        (max(x - r, 0), max(y - r, 0), min(x + r + 1, width), min(y + r + 1, height))
+        for x, y, r, _ in lights
+    ]
+    boxes = [box for box in boxes if box[0] < box[2] and box[1] < box[3]]
+    if not boxes:
+        return dst
+    ux0, uy0 = min(b[0] for b in boxes), min(b[1] for b in boxes)
+    ux1, uy1 = max(b[2] for b in boxes), max(b[3] for b in boxes)
+    overlay = np.zeros((uy1 - uy0, ux1 - ux0), dtype=np.uint8)
+
+    for x, y, radius, alpha in lights:
+        rings = _bokeh_rings(radius)
+        # 円ごとのアルファ（外側ほど明るい）。元の int(alpha * (i / radius) ** 0.5) と同じ値
+        levels = np.array([int(alpha * (i / radius) ** 0.5) for i in range(radius + 1)], dtype=np.uint8)
+        x0, y0 = max(x - radius, ux0), max(y - radius, uy0)
+        x1, y1 = min(x + radius + 1, ux1), min(y + radius + 1, uy1)
+        if x0 >= x1 or y0 >= y1:
+            continue
+        part = (slice(y0 - (y - radius), y1 - (y - radius)), slice(x0 - (x - radius), x1 - (x - radius)))
+        ring = rings[part]
+        covered = ring > 0
+        target = overlay[y0 - uy0:y1 - uy0, x0 - ux0:x1 - ux0]
+        target[covered] = levels[ring[covered]]
+
+    # アルファ0の画素は合成しても変わらないので、光が覆う画素だけ計算する
+    lit = overlay > 0
+    a = overlay[lit][:, None].astype(np.uint16)
+    color = np.asarray(color, dtype=np.uint16)
+    if dst.shape[2] == 4:
+        # RGBA は1画素を uint32 として取り出す（チャンネルごとに拾うより速い）
+        packed = dst[uy0:uy1, ux0:ux1].view(np.uint32)[:, :, 0]
+        pixels = packed[lit].view(np.uint8).reshape(-1, 4)
+        pixels[:, :3] = (color * a + pixels[:, :3] * (255 - a) + 127) // 255
+        packed[lit] = pixels.view(np.uint32).ravel()
+    else:
+        region = dst[uy0:uy1, ux0:ux1]
+        region[lit] = (color * a + region[lit] * (255 - a) + 127) // 255
+    return dst
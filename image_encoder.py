@@ -0,0 +1,136 @@
+"""名言画像の書き出しモジュール（形式・容量上限・圧縮の手間を指定）
+
+PNG / JPEG / WebP で書き出す。JPEG・WebP は容量上限（max_bytes）に収まる
+一番高い品質を二分探索で選ぶ。effort（0〜9）を上げるほど圧縮に時間をかけて小さくする。
+"""
+
+import io
+import os
+import time
+
+# 拡張子 → Pillowの保存形式
+FORMATS = {
+    "png": "PNG",
+    "jpg": "JPEG",
+    "jpeg": "JPEG",
+    "webp": "WEBP",
+}
+
+DEFAULT_EFFORT = 6
+MIN_QUALITY = 60   # これより下げると文字のにじみが目立つ
+MAX_QUALITY = 95
+
+
+def format_for_path(path, default="png") -> str:
+    """ファイル名の拡張子から形式名（png/jpeg/webp）を決める"""
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    fmt = ext if ext in FORMATS else default
+    return "jpeg" if fmt == "jpg" else fmt
+
+
+def _save_options(fmt, quality, effort):
+    """形式ごとの保存オプション"""
+    if fmt == "png":
+        # effort 0〜9 をそのまま zlib の圧縮レベルに使う
+        return {"compress_level": effort, "optimize": effort >= 9}
+    if fmt == "jpeg":
+        return {
+            "quality": quality,
+            # 文字の輪郭を保つため色差の間引きはしない（4:4:4）
+            "subsampling": 0,
+            "optimize": effort >= 3,
+            "progressive": effort >= 6,
+        }
+    if fmt == "webp":
+        return {"quality": quality, "method": min(6, effort * 6 // 9)}
+    raise ValueError(f"未対応の画像形式: {fmt}")
+
+
+def _encode(img, fmt, quality, effort) -> bytes:
+    out = io.BytesIO()
+    img.save(out, FORMATS[fmt], **_save_options(fmt, quality, effort))
+    return out.getvalue()
+
+
+def resolve_effort(effort=None) -> int:
+    """圧縮の手間 0〜9（省略時は環境変数 IMAGE_ENCODE_EFFORT）"""
+    if effort is None:
+        effort = int(os.getenv("IMAGE_ENCODE_EFFORT", DEFAULT_EFFORT))
+    return max(0, min(9, effort))
+
+
+def encode_image(img, fmt="png", max_bytes=None, effort=None):
+    """画像をエンコードして (バイト列, 統計) を返す
+
+    Args:
+        img: PIL画像（RGB）
+        fmt: "png" / "jpeg" / "webp"
+        max_bytes: 容量上限。JPEG・WebPは上限に収まる最高品質を探す（Noneなら MAX_QUALITY）
+        effort: 0〜9。大きいほど時間をかけて小さくする
+
+    Returns:
+        tuple: (bytes, {format, bytes, quality, attempts, seconds, within_budget})
+    """
+    fmt = "jpeg" if fmt == "jpg" else fmt
+    if fmt not in FORMATS:
+        raise ValueError(f"未対応の画像形式: {fmt}")
+    effort = resolve_effort(effort)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    started = time.perf_counter()
+    attempts = 0
+    quality = None
+
+    if fmt == "png":
+        data = _encode(img, fmt, None, effort)
+        attempts = 1
+    else:
+        quality = MAX_QUALITY
+        data = _encode(img, fmt, quality, effort)
+        attempts = 1
+        if max_bytes and len(data) > max_bytes:
+            # 上限に収まる最高品質を二分探索（見つからなければ最低品質）
+            low, high = MIN_QUALITY, MAX_QUALITY - 1
+            best = None
+            while low <= high:
+                mid = (low + high) // 2
+                candidate = _encode(img, fmt, mid, effort)
+                attempts += 1
+                if len(candidate) <= max_bytes:
+                    best = (mid, candidate)
+                    low = mid + 1
+                else:
+                    high = mid - 1
+            if best is None:
+                quality = MIN_QUALITY
+                data = _encode(img, fmt, quality, effort)
+                attempts += 1
+            else:
+                quality, data = best
+
+    stats = {
+        "format": fmt,
+        "bytes": len(data),
+        "quality": quality,
+        "effort": effort,
+        "attempts": attempts,
+        "seconds": time.perf_counter() - started,
+        "within_budget": max_bytes is None or len(data) <= max_bytes,
+    }
+    return data, stats
+
+
+def save_image(img, path, fmt=None, max_bytes=None, effort=None) -> dict:
+    """画像をファイルに書き出して統計を返す（形式は省略時に拡張子から決める）"""
+    if fmt is None:
+        fmt = format_for_path(path)
+    data, stats = encode_image(img, fmt, max_bytes=max_bytes, effort=effort)
+    with open(path, "wb") as f:
+        f.write(data)
+
+    quality = f" q={stats['quality']}" if stats["quality"] is not None else ""
+    budget = "" if stats["within_budget"] else "（容量上限超過）"
+    print(f"[INFO] 画像を書き出し: {stats['format']}{quality} {stats['bytes'] / 1024:.0f}KB "
+          f"{stats['seconds'] * 1000:.0f}ms{budget}")
+    return stats
@@ -1,26 +1,43 @@
 """名言を画像化するモジュール（高品質版 + 人物写真付き）"""
 
 import os
+import sys
+import time
+import uuid
 import random
-import math
+import threading
 import urllib.request
 import urllib.parse
 import json
 import io
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+import shutil
+import hashlib
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    TimeoutError as FuturesTimeoutError,
+)
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+from image_effects import gradient_array, apply_vignette, add_noise, draw_bokeh
+from layer_cache import get_layers
+from photo_cache import get_photo_cache
+from text_layout import wrap_lines, glyph_metrics
+from font_registry import get_font, preload
+from image_encoder import format_for_path, save_image, resolve_effort
 
 # 画像サイズ（X推奨: 16:9）
 WIDTH = 1200
 HEIGHT = 675
 
-# フォントパス（Windows / Linux CI 両対応）
-_FONT_CANDIDATES = [
-    "C:/Windows/Fonts/NotoSansJP-VF.ttf",
-    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
-    "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
-    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
-]
-FONT_PATH = next((f for f in _FONT_CANDIDATES if os.path.exists(f)), None)
+# 使用するフォントサイズ（本文・著者・装飾の引用符・ブランド）
+FONT_SIZE_QUOTE = 46
+FONT_SIZE_AUTHOR = 26
+FONT_SIZE_DECO = 140
+FONT_SIZE_BRAND = 18
+FONT_SIZES = (FONT_SIZE_QUOTE, FONT_SIZE_AUTHOR, FONT_SIZE_DECO, FONT_SIZE_BRAND)
 
 # 配色パターン
 COLOR_SCHEMES = [
@@ -35,178 +52,230 @@ COLOR_SCHEMES = [
 ]
 
 
-def _create_gradient(width, height, color1, color2):
-    """滑らかなグラデーション背景"""
-    img = Image.new("RGB", (width, height))
-    pixels = img.load()
-    for y in range(height):
-        for x in range(width):
-            # 対角線グラデーション + 微妙なカーブ
-            ratio = (x / width * 0.6 + y / height * 0.4)
-            ratio = ratio ** 0.9  # 非線形で自然なグラデーション
-            r = int(color1[0] + (color2[0] - color1[0]) * ratio)
-            g = int(color1[1] + (color2[1] - color1[1]) * ratio)
-            b = int(color1[2] + (color2[2] - color1[2]) * ratio)
-            pixels[x, y] = (r, g, b)
-    return img
+def _add_light_bokeh(buf, glow_color, count=5, rng=random):
+    """光のボケ効果（光の範囲だけのオーバーレイに描いてから合成）"""
+    height, width = buf.shape[:2]
+    lights = []
+    for _ in range(count):
+        x = rng.randint(0, width)
+        y = rng.randint(0, height)
+        radius = rng.randint(30, 120)
+        alpha = rng.randint(8, 25)
+        lights.append((x, y, radius, alpha))
+    draw_bokeh(buf, lights, glow_color)
 
 
-def _add_vignette(img):
-    """ビネット効果（四隅を暗く）"""
-    width, height = img.size
-    vignette = Image.new("L", (width, height), 0)
-    pixels = vignette.load()
-    cx, cy = width / 2, height / 2
-    max_dist = math.sqrt(cx ** 2 + cy ** 2)
-    for y in range(height):
-        for x in range(width):
-            dist = math.sqrt((x - cx) ** 2 + (y - cy) ** 2)
-            ratio = dist / max_dist
-            # 中央は明るく、端は暗く
-            brightness = int(255 * (1.0 - ratio * ratio * 0.6))
-            pixels[x, y] = max(0, min(255, brightness))
-    # ビネットを適用
-    result = Image.new("RGB", (width, height))
-    img_pixels = img.load()
-    vig_pixels = vignette.load()
-    res_pixels = result.load()
-    for y in range(height):
-        for x in range(width):
-            r, g, b = img_pixels[x, y]
-            v = vig_pixels[x, y] / 255.0
-            res_pixels[x, y] = (int(r * v), int(g * v), int(b * v))
-    return result
-
-
-def _add_light_bokeh(img, glow_color, count=5):
-    """光のボケ効果"""
-    overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
-    draw = ImageDraw.Draw(overlay)
-    width, height = img.size
-    for _ in range(count):
-        x = random.randint(0, width)
-        y = random.randint(0, height)
-        radius = random.randint(30, 120)
-        alpha = random.randint(8, 25)
-        r, g, b = glow_color
-        # 複数の円を重ねてソフトなボケ感
-        for i in range(radius, 0, -3):
-            a = int(alpha * (i / radius) ** 0.5)
-            draw.ellipse(
-                [(x - i, y - i), (x + i, y + i)],
-                fill=(r, g, b, a)
-            )
-    # RGBに変換して合成
-    img_rgba = img.convert("RGBA")
-    result = Image.alpha_composite(img_rgba, overlay)
-    return result.convert("RGB")
-
-
-def _add_noise_texture(img, intensity=8):
-    """微細なノイズテクスチャ"""
-    width, height = img.size
-    pixels = img.load()
-    for y in range(height):
-        for x in range(width):
-            r, g, b = pixels[x, y]
-            noise = random.randint(-intensity, intensity)
-            pixels[x, y] = (
-                max(0, min(255, r + noise)),
-                max(0, min(255, g + noise)),
-                max(0, min(255, b + noise)),
-            )
-    return img
+def _composite_region(img, overlay, x, y):
+    """overlay を img の (x, y) に合成（重なる範囲だけ・キャンバス外は切り捨て）"""
+    src_x, src_y = max(0, -x), max(0, -y)
+    if src_x >= overlay.width or src_y >= overlay.height:
+        return
+    img.alpha_composite(overlay, dest=(max(0, x), max(0, y)), source=(src_x, src_y))
 
 
 def _draw_glass_card(img, x1, y1, x2, y2, opacity=40):
-    """半透明のガラスカード効果"""
-    overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
+    """半透明のガラスカード効果（カードの範囲だけ合成）"""
+    overlay = Image.new("RGBA", (x2 - x1 + 1, y2 - y1 + 1), (0, 0, 0, 0))
     draw = ImageDraw.Draw(overlay)
     # カード本体（半透明の黒）
     draw.rounded_rectangle(
-        [(x1, y1), (x2, y2)],
+        [(0, 0), (x2 - x1, y2 - y1)],
         radius=20,
         fill=(0, 0, 0, opacity),
     )
     # カード上部のハイライトライン
     draw.rounded_rectangle(
-        [(x1, y1), (x2, y1 + 2)],
+        [(0, 0), (x2 - x1, 2)],
         radius=1,
         fill=(255, 255, 255, 15),
     )
-    img_rgba = img.convert("RGBA")
-    result = Image.alpha_composite(img_rgba, overlay)
-    return result.convert("RGB")
-
-
-def _fetch_luxury_background() -> Image.Image | None:
-    """Wikimedia Commonsからリッチな背景写真を取得"""
-    # 成功・富をイメージさせる検索キーワード
-    LUXURY_QUERIES = [
-        "Lamborghini Aventador",
-        "Ferrari 488",
-        "Rolls-Royce Phantom",
-        "Porsche 911 GT3",
-        "McLaren 720S",
-        "Bugatti Chiron",
-        "Dubai Marina skyline",
-        "Manhattan skyline night",
-        "Tokyo skyline night",
-        "Singapore Marina Bay",
-        "luxury penthouse interior",
-        "private jet interior",
-        "luxury yacht",
-        "Rolex watch",
-        "Monaco harbour",
-        "Beverly Hills mansion",
-        "Swiss watch collection",
-        "gold bars",
-        "Wall Street",
-        "Shanghai skyline",
-    ]
+    _composite_region(img, overlay, x1, y1)
+
+
+SOFT_SHADOW_BLUR = 4  # ソフトシャドウのぼかし半径
+
+
+def _draw_text_block(img, items, font, fill, shadow_offsets, shadow_style="hard",
+                     shadow_color=(0, 0, 0)):
+    """複数行のテキストを1枚のマスクに1回だけラスタライズし、影 → 本文の順で合成
+
+    items: [(x, y, text), ...]（img上の描画位置）
+    影はマスクをずらして貼るだけなので、行数や影の数が増えても再ラスタライズしない。
+    shadow_style="soft" ならマスクをぼかした影にする。
+    """
+    if not items:
+        return
+    pad = SOFT_SHADOW_BLUR * 2 if shadow_style == "soft" else 0
+    boxes = []
+    for x, y, text in items:
+        left, top, right, bottom = font.getbbox(text)
+        boxes.append((x + left, y + top, x + right, y + bottom))
+    bx1 = min(b[0] for b in boxes) - pad
+    by1 = min(b[1] for b in boxes) - pad
+    bx2 = max(b[2] for b in boxes) + pad
+    by2 = max(b[3] for b in boxes) + pad
+    if bx2 <= bx1 or by2 <= by1:
+        return
+
+    mask = Image.new("L", (bx2 - bx1, by2 - by1), 0)
+    mask_draw = ImageDraw.Draw(mask)
+    for x, y, text in items:
+        mask_draw.text((x - bx1, y - by1), text, fill=255, font=font)
+
+    shadow_mask = mask
+    if shadow_style == "soft":
+        shadow_mask = mask.filter(ImageFilter.GaussianBlur(SOFT_SHADOW_BLUR))
+
+    size = mask.size
+    for dx, dy in shadow_offsets:
+        x, y = bx1 + dx, by1 + dy
+        img.paste(shadow_color, (x, y, x + size[0], y + size[1]), shadow_mask)
+    img.paste(fill, (bx1, by1, bx1 + size[0], by1 + size[1]), mask)
+
+
+# 成功・富をイメージさせる検索キーワード
+LUXURY_QUERIES = [
+    "Lamborghini Aventador",
+    "Ferrari 488",
+    "Rolls-Royce Phantom",
+    "Porsche 911 GT3",
+    "McLaren 720S",
+    "Bugatti Chiron",
+    "Dubai Marina skyline",
+    "Manhattan skyline night",
+    "Tokyo skyline night",
+    "Singapore Marina Bay",
+    "luxury penthouse interior",
+    "private jet interior",
+    "luxury yacht",
+    "Rolex watch",
+    "Monaco harbour",
+    "Beverly Hills mansion",
+    "Swiss watch collection",
+    "gold bars",
+    "Wall Street",
+    "Shanghai skyline",
+]
 
-    query = random.choice(LUXURY_QUERIES)
+
+# 背景候補ダウンロードの設定
+USER_AGENT = "QuoteBot/1.0 (educational project)"
+# 画像検索API（ベンチマークではローカルの代替サーバーに向ける）
+WIKIMEDIA_API_URL = os.getenv("WIKIMEDIA_API_URL", "https://commons.wikimedia.org/w/api.php")
+FETCH_DEADLINE = 20        # 全候補のダウンロードにかける最大秒数
+DOWNLOAD_TIMEOUT = 15      # 1リクエストあたりのタイムアウト
+_CHUNK_SIZE = 64 * 1024
+
+# 直近の背景取得にかかった時間（検索・各ダウンロード）。背景の補充は複数スレッドで
+# 同時に走るので、スレッドごとに持つ
+_fetch_local = threading.local()
+
+
+def last_fetch_timings() -> dict:
+    """このスレッドで直近の背景取得にかかった時間 {query, search, downloads}"""
+    return getattr(_fetch_local, "timings", {})
+
+
+def _download_candidate(url, cancel, deadline):
+    """候補画像を1枚ダウンロードしてデコード（cancelがセットされたら中断）"""
+    started = time.monotonic()
+    timeout = max(0.1, min(DOWNLOAD_TIMEOUT, deadline - started))
+    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    buf = io.BytesIO()
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        while True:
+            if cancel.is_set():
+                raise RuntimeError("cancelled")
+            if time.monotonic() > deadline:
+                raise TimeoutError("deadline exceeded")
+            chunk = resp.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            buf.write(chunk)
+    buf.seek(0)
+    bg_img = Image.open(buf)
+    bg_img.load()  # 壊れた画像はここで例外
+    return bg_img, time.monotonic() - started
+
+
+def _fetch_luxury_background(query=None, rng=random) -> Image.Image | None:
+    """Wikimedia Commonsからリッチな背景写真を取得
+
+    候補画像は並列にダウンロードし、最初に正しくデコードできたものを使う。
+    かかった時間は last_fetch_timings() で取得できる（呼んだスレッドごと）。
+    """
+    if query is None:
+        query = rng.choice(LUXURY_QUERIES)
+
+    timings = {"query": query, "search": None, "downloads": {}}
+    _fetch_local.timings = timings
 
     try:
         # Wikimedia Commons APIで画像検索
+        search_started = time.monotonic()
         encoded = urllib.parse.quote(query)
         api_url = (
-            f"https://commons.wikimedia.org/w/api.php?"
+            f"{WIKIMEDIA_API_URL}?"
             f"action=query&generator=search&gsrsearch={encoded}"
             f"&gsrnamespace=6&gsrlimit=5&prop=imageinfo"
             f"&iiprop=url|size&iiurlwidth=1200&format=json"
         )
-        req = urllib.request.Request(api_url, headers={
-            "User-Agent": "QuoteBot/1.0 (educational project)"
-        })
+        req = urllib.request.Request(api_url, headers={"User-Agent": USER_AGENT})
         resp = urllib.request.urlopen(req, timeout=10)
         data = json.loads(resp.read().decode("utf-8"))
+        timings["search"] = time.monotonic() - search_started
 
         pages = data.get("query", {}).get("pages", {})
         if not pages:
             return None
 
-        # ランダムに1つ選ぶ
+        # ランダムに並べ替え（同着時の優先順）
         page_list = list(pages.values())
-        random.shuffle(page_list)
+        rng.shuffle(page_list)
 
+        urls = []
         for page in page_list:
             imageinfo = page.get("imageinfo", [{}])[0]
             thumb_url = imageinfo.get("thumburl") or imageinfo.get("url")
-            if not thumb_url:
-                continue
+            if thumb_url:
+                urls.append(thumb_url)
+        if not urls:
+            return None
 
+        # 全候補を並列にダウンロード → 最初に成功したものを採用
+        cancel = threading.Event()
+        deadline = time.monotonic() + FETCH_DEADLINE
+        downloads = timings["downloads"]
+        bg_img = None
+        pool = ThreadPoolExecutor(max_workers=len(urls))
+        try:
+            futures = {pool.submit(_download_candidate, url, cancel, deadline): url for url in urls}
             try:
-                img_req = urllib.request.Request(thumb_url, headers={
-                    "User-Agent": "QuoteBot/1.0 (educational project)"
-                })
-                img_resp = urllib.request.urlopen(img_req, timeout=15)
-                img_data = img_resp.read()
-                bg_img = Image.open(io.BytesIO(img_data))
-                print(f"[OK] 背景画像を取得: {query}")
-                return bg_img
-            except Exception:
-                continue
+                for future in as_completed(futures, timeout=max(0.0, deadline - time.monotonic())):
+                    url = futures[future]
+                    try:
+                        img, seconds = future.result()
+                    except Exception as e:
+                        downloads[url] = None
+                        print(f"[WARN] 背景候補の取得失敗: {e}")
+                        continue
+                    downloads[url] = seconds
+                    img.info["source_url"] = url
+                    bg_img = img
+                    break
+            except FuturesTimeoutError:
+                print(f"[WARN] 背景候補のダウンロードが{FETCH_DEADLINE}秒以内に終わりませんでした")
+        finally:
+            cancel.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        timing_text = ", ".join(
+            f"{t:.2f}s" if t is not None else "失敗" for t in downloads.values()
+        )
+        print(f"[INFO] 背景検索 {timings['search']:.2f}s / ダウンロード [{timing_text}]")
+        if bg_img is not None:
+            print(f"[OK] 背景画像を取得: {query}")
+        return bg_img
 
     except Exception as e:
         print(f"[WARN] 背景画像取得失敗 ({query}): {e}")
@@ -242,73 +311,177 @@ def _prepare_background_photo(bg_img, width, height):
     return bg_img
 
 
-def _wrap_text(text, font, max_width, draw):
-    """テキストを指定幅で折り返す"""
-    lines = []
-    for paragraph in text.split("\n"):
-        if not paragraph.strip():
-            lines.append("")
-            continue
-        current_line = ""
-        for char in paragraph:
-            test_line = current_line + char
-            bbox = draw.textbbox((0, 0), test_line, font=font)
-            if bbox[2] - bbox[0] > max_width:
-                lines.append(current_line)
-                current_line = char
-            else:
-                current_line = test_line
-        if current_line:
-            lines.append(current_line)
-    return lines
-
-
-def generate_quote_image(quote: str, author: str, output_path: str = "quote_image.png") -> str:
-    """名言を高品質画像化する（リッチ背景写真付き）"""
-    scheme = random.choice(COLOR_SCHEMES)
-
-    # 背景写真を取得（スーパーカー、タワマン、豪邸など）
-    bg_photo = None
+def _fetch_prepared_background(query, rng=random):
+    """背景写真を取得して加工済みにする（キャッシュ補充用）"""
+    bg_img = _fetch_luxury_background(query, rng)
+    if bg_img is None:
+        return None
+    source = bg_img.info.get("source_url", "")
+    return _prepare_background_photo(bg_img, WIDTH, HEIGHT), source
+
+
+def _get_background_photo(rng=random):
+    """加工済みの背景写真を返す（ローカルキャッシュ優先、なければネットワーク）"""
+    query = rng.choice(LUXURY_QUERIES)
+    cache = get_photo_cache()
+    size = (WIDTH, HEIGHT)
+
+    photo = cache.get(query, size, rng=rng)
+    if photo is not None:
+        print(f"[OK] 背景画像をキャッシュから取得: {query}")
+        # バリエーションを増やすため裏で補充
+        cache.refill_async(query, lambda: _fetch_prepared_background(query), size)
+        return photo
+
+    result = _fetch_prepared_background(query, rng)
+    if result is not None:
+        photo, source = result
+        try:
+            cache.put(query, photo, source=source)
+        except OSError as e:
+            print(f"[WARN] 背景写真キャッシュ保存失敗: {e}")
+        return photo
+
+    # ネットワーク不通時: 別キーワードのキャッシュ写真で代用
+    photo = cache.get(None, size, rng=rng)
+    if photo is not None:
+        print("[INFO] 背景画像をキャッシュ（別キーワード）から代用")
+    return photo
+
+
+def prefetch_backgrounds(max_fetches=3):
+    """キャッシュに1枚もないキーワードの背景写真を先に取得しておく（投稿準備と並行して呼ぶ用）
+
+    どのキーワードを使うかは名言で決まるので、未取得のものを最大 max_fetches 件まとめて補充する。
+    取得したキーワード数を返す。
+    """
+    cache = get_photo_cache()
+    size = (WIDTH, HEIGHT)
+    missing = [q for q in LUXURY_QUERIES if cache.count(q, size) == 0]
+    missing = random.sample(missing, min(max_fetches, len(missing)))
+    threads = [cache.refill_async(q, lambda q=q: _fetch_prepared_background(q), size) for q in missing]
+    for thread in threads:
+        if thread is not None:
+            thread.join()
+    return len(missing)
+
+
+# 描画結果に影響する変更をしたら上げる（描画キャッシュを無効化）
+RENDERER_VERSION = "5"
+
+DEFAULT_RENDER_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".cache", "renders")
+RENDER_CACHE_MAX_FILES = 200
+
+# 直近の描画のメモリ統計
+#   canvas_copies: キャンバス全体サイズのバッファを確保した回数
+#   pil_images / pil_blocks: その間にPillowが確保した画像・メモリブロック数
+#   photo_background: 背景写真を使えたか（False ならグラデーション背景）
+#   cache_hit: 描画キャッシュから返した場合 True
+#   encode: 書き出しの統計（形式・サイズ・品質・所要時間）
+last_render_stats = {}
+
+
+def default_seed(quote: str, author: str) -> int:
+    """名言と著者から決まるシード（同じ名言なら同じ画像になる）"""
+    digest = hashlib.sha256(f"{quote}\0{author}".encode("utf-8")).hexdigest()
+    return int(digest[:16], 16)
+
+
+def render_key(quote: str, author: str, seed=None, **options) -> str:
+    """描画結果を一意に表すキー（名言・著者・シード・描画バージョン・オプション）"""
+    if seed is None:
+        seed = default_seed(quote, author)
+    payload = json.dumps({
+        "quote": quote,
+        "author": author,
+        "seed": seed,
+        "version": RENDERER_VERSION,
+        "options": options,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _render_cache_path(key, ext):
+    cache_dir = os.getenv("RENDER_CACHE_DIR", DEFAULT_RENDER_CACHE_DIR)
+    return os.path.join(cache_dir, key + ext)
+
+
+def _store_render(path, cache_path):
+    """描画結果をキャッシュに保存し、古いものを削除"""
+    cache_dir = os.path.dirname(cache_path)
     try:
-        bg_photo = _fetch_luxury_background()
-    except Exception as e:
-        print(f"[WARN] 背景写真取得失敗: {e}")
-
-    # 1. 背景を作成
-    if bg_photo:
-        # リッチ写真を背景に使用（ダーク加工済み）
-        img = _prepare_background_photo(bg_photo, WIDTH, HEIGHT)
-        # 写真背景の上にビネットを追加
-        img = _add_vignette(img)
-        has_photo_bg = True
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, cache_path)
+        entries = sorted(
+            (os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if not name.endswith(".tmp")),
+            key=os.path.getmtime,
+        )
+        for old_path in entries[:-RENDER_CACHE_MAX_FILES]:
+            os.remove(old_path)
+    except OSError as e:
+        print(f"[WARN] 描画キャッシュ保存失敗: {e}")
+
+
+def generate_quote_image(quote: str, author: str, output_path: str = "quote_image.png",
+                         shadow_style: str = "hard", seed=None, image_format=None,
+                         max_bytes=None, effort=None):
+    """名言を高品質画像化する（リッチ背景写真付き）
+
+    shadow_style: "hard"（多重ずらしの影）/ "soft"（ぼかした影）
+    seed: 乱数シード。省略時は名言と著者から決めるので、同じ名言は同じ画像になる
+    image_format: "png" / "jpeg" / "webp"（省略時は output_path の拡張子から）
+    max_bytes: 出力の容量上限（省略時は環境変数 IMAGE_MAX_BYTES、なければ無制限）
+    effort: 圧縮の手間 0〜9（省略時は環境変数 IMAGE_ENCODE_EFFORT）
+
+    同じ (名言, 著者, シード, 描画バージョン) の画像はキャッシュから即座に返す。
+    背景写真を取れずグラデーションで描いた画像はキャッシュしない（次は写真で描き直す）。
+    """
+    if seed is None:
+        seed = default_seed(quote, author)
+    if image_format is None:
+        image_format = format_for_path(output_path)
+    if max_bytes is None and os.getenv("IMAGE_MAX_BYTES"):
+        max_bytes = int(os.getenv("IMAGE_MAX_BYTES"))
+    # 環境変数で決まる値もキーに入れる（設定を変えたら古い描画を使わない）
+    effort = resolve_effort(effort)
+    key = render_key(quote, author, seed, shadow_style=shadow_style,
+                     image_format=image_format, max_bytes=max_bytes, effort=effort)
+    ext = ".jpg" if image_format == "jpeg" else f".{image_format}"
+    cache_path = _render_cache_path(key, ext)
+
+    if os.path.exists(cache_path):
+        if os.path.abspath(cache_path) != os.path.abspath(output_path):
+            shutil.copyfile(cache_path, output_path)
+        last_render_stats.clear()
+        last_render_stats["cache_hit"] = True
+        print(f"[OK] 描画キャッシュを使用: {key[:12]}")
+        return output_path
+
+    img = _render_quote_image(quote, author, random.Random(seed), shadow_style)
+    last_render_stats["encode"] = save_image(img, output_path, image_format, max_bytes=max_bytes, effort=effort)
+    if last_render_stats["photo_background"]:
+        _store_render(output_path, cache_path)
     else:
-        # フォールバック: グラデーション背景
-        img = _create_gradient(WIDTH, HEIGHT, scheme["grad1"], scheme["grad2"])
-        img = _add_vignette(img)
-        img = _add_light_bokeh(img, scheme["glow"], count=random.randint(4, 7))
-        has_photo_bg = False
+        print("[INFO] 背景写真なしで描画したため描画キャッシュには保存しません")
+    return output_path
 
-    # 2. ノイズテクスチャ（写真背景は軽め）
-    img = _add_noise_texture(img, intensity=4 if has_photo_bg else 6)
-
-    # フォント設定（大きめ・インパクト重視）
-    if FONT_PATH:
-        font_quote = ImageFont.truetype(FONT_PATH, 46)
-        font_author = ImageFont.truetype(FONT_PATH, 26)
-        font_deco = ImageFont.truetype(FONT_PATH, 140)
-        font_brand = ImageFont.truetype(FONT_PATH, 18)
-    else:
-        font_quote = ImageFont.load_default()
-        font_author = ImageFont.load_default()
-        font_deco = font_quote
-        font_brand = font_quote
 
-    # テキスト折り返し計算
-    temp_draw = ImageDraw.Draw(img)
+def compute_layout(quote: str, author: str) -> dict:
+    """フル解像度でのレイアウト（折り返し・カード位置・各テキストの座標）を計算
+
+    本番描画とプレビューの両方がこの結果を使うので、改行位置やカード範囲は常に一致する。
+    """
+    # フォント設定（大きめ・インパクト重視、プロセス内で共有）
+    font_quote = get_font(FONT_SIZE_QUOTE)
+    font_author = get_font(FONT_SIZE_AUTHOR)
+
+    # テキスト折り返し計算（各行の幅も同時に得る）
     card_margin = 70
     text_margin = 55
     max_text_width = WIDTH - (card_margin + text_margin) * 2
-    lines = _wrap_text(quote, font_quote, max_text_width, temp_draw)
+    lines = wrap_lines(quote, font_quote, max_text_width)
 
     # テキスト高さ計算
     line_height = 65
@@ -317,7 +490,7 @@ def generate_quote_image(quote: str, author: str, output_path: str = "quote_imag
     deco_height = 35
     total_content_height = quote_height + deco_height + author_height
 
-    # 3. ガラスカード（写真背景は濃く・グラデーション感）
+    # ガラスカード
     card_padding = 50
     card_x1 = card_margin
     card_y1 = (HEIGHT - total_content_height) // 2 - card_padding
@@ -325,77 +498,323 @@ def generate_quote_image(quote: str, author: str, output_path: str = "quote_imag
     card_y2 = (HEIGHT + total_content_height) // 2 + card_padding
     card_y1 = max(20, card_y1)
     card_y2 = min(HEIGHT - 20, card_y2)
-    card_opacity = 80 if has_photo_bg else 55
-    img = _draw_glass_card(img, card_x1, card_y1, card_x2, card_y2, opacity=card_opacity)
-
-    # カード左端にゴールドの縦ライン
-    overlay2 = Image.new("RGBA", img.size, (0, 0, 0, 0))
-    d2 = ImageDraw.Draw(overlay2)
-    d2.rectangle([(card_x1, card_y1 + 10), (card_x1 + 4, card_y2 - 10)], fill=(212, 175, 55, 180))
-    img_rgba = img.convert("RGBA")
-    img = Image.alpha_composite(img_rgba, overlay2).convert("RGB")
 
-    draw = ImageDraw.Draw(img)
-
-    # 4. 装飾的な引用符（薄く大きく）
-    try:
-        quote_overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
-        qd = ImageDraw.Draw(quote_overlay)
-        qd.text((card_x1 + 20, card_y1 - 20), "\u201C", fill=(212, 175, 55, 40), font=font_deco)
-        img_rgba = img.convert("RGBA")
-        img = Image.alpha_composite(img_rgba, quote_overlay).convert("RGB")
-        draw = ImageDraw.Draw(img)
-    except Exception:
-        pass
-
-    # 5. 名言テキスト描画（強いシャドウ + 白テキスト）
+    # 名言テキストの各行の位置
     start_y = (HEIGHT - total_content_height) // 2
     y = start_y
-    for line in lines:
+    quote_items = []
+    for line, text_width in lines:
         if line == "":
             y += line_height // 2
             continue
-        bbox = draw.textbbox((0, 0), line, font=font_quote)
-        text_width = bbox[2] - bbox[0]
         x = (WIDTH - text_width) // 2
-        # 多重シャドウでインパクトを出す
-        for dx, dy in [(3, 3), (2, 2), (1, 1)]:
-            draw.text((x + dx, y + dy), line, fill=(0, 0, 0, 200), font=font_quote)
-        draw.text((x, y), line, fill="#ffffff", font=font_quote)
+        quote_items.append((x, y, line))
         y += line_height
 
-    # 6. アクセント区切り線（ゴールド・幅広）
+    # アクセント区切り線
     sep_y = y + 12
     sep_width = 80
     sep_x = (WIDTH - sep_width) // 2
+
+    # 著者名
+    author_items = []
+    if author:
+        author_text = f"\u2015 {author}"
+        author_width = glyph_metrics(font_author).text_width(author_text)
+        author_items.append(((WIDTH - author_width) // 2, sep_y + 25, author_text))
+
+    return {
+        "lines": lines,
+        "card": (card_x1, card_y1, card_x2, card_y2),
+        "quote_mark": (card_x1 + 20, card_y1 - 20),
+        "quote_items": quote_items,
+        "separator": (sep_x, sep_y, sep_x + sep_width, sep_y + 3),
+        "author_items": author_items,
+    }
+
+
+def _draw_foreground(img, layout, has_photo_bg, shadow_style="hard", scale=1.0):
+    """カード・引用符・テキスト・アクセントラインを描画
+
+    scale < 1 のときは layout の座標を縮小して描く（プレビュー用）。
+    """
+    def s(v):
+        return int(round(v * scale))
+
+    def scaled_items(items):
+        return [(s(x), s(y), text) for x, y, text in items]
+
+    font_quote = get_font(max(1, s(FONT_SIZE_QUOTE)))
+    font_author = get_font(max(1, s(FONT_SIZE_AUTHOR)))
+    font_deco = get_font(max(1, s(FONT_SIZE_DECO)))
+    width, height = img.size
+
+    # 3. ガラスカード（写真背景は濃く・グラデーション感）
+    card_x1, card_y1, card_x2, card_y2 = (s(v) for v in layout["card"])
+    card_opacity = 80 if has_photo_bg else 55
+    _draw_glass_card(img, card_x1, card_y1, card_x2, card_y2, opacity=card_opacity)
+
+    # カード左端にゴールドの縦ライン
+    line_h = card_y2 - s(10) - (card_y1 + s(10)) + 1
+    if line_h > 0:
+        gold_line = Image.new("RGBA", (max(1, s(5)), line_h), (212, 175, 55, 180))
+        _composite_region(img, gold_line, card_x1, card_y1 + s(10))
+
+    # 4. 装飾的な引用符（薄く大きく、文字の範囲だけ合成）
+    try:
+        qx, qy = (s(v) for v in layout["quote_mark"])
+        left, top, right, bottom = font_deco.getbbox("\u201C")
+        if right > left and bottom > top:
+            quote_overlay = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0, 0))
+            qd = ImageDraw.Draw(quote_overlay)
+            qd.text((-left, -top), "\u201C", fill=(212, 175, 55, 40), font=font_deco)
+            _composite_region(img, quote_overlay, qx + left, qy + top)
+    except Exception:
+        pass
+
+    # 5. 名言テキスト描画（強いシャドウ + 白テキスト、全行を1回だけラスタライズ）
+    # 多重シャドウでインパクトを出す
+    _draw_text_block(img, scaled_items(layout["quote_items"]), font_quote, "#ffffff",
+                     shadow_offsets=[(s(3), s(3)), (s(2), s(2)), (s(1), s(1))], shadow_style=shadow_style)
+
+    draw = ImageDraw.Draw(img)
+
+    # 6. アクセント区切り線（ゴールド・幅広）
+    sep_x1, sep_y1, sep_x2, sep_y2 = (s(v) for v in layout["separator"])
     draw.rounded_rectangle(
-        [(sep_x, sep_y), (sep_x + sep_width, sep_y + 3)],
-        radius=2,
+        [(sep_x1, sep_y1), (sep_x2, sep_y2)],
+        radius=max(1, s(2)),
         fill="#d4af37",
     )
 
     # 7. 著者名（ゴールド）
-    y = sep_y + 25
-    if author:
-        author_text = f"\u2015 {author}"
-    else:
-        author_text = ""
-    if author_text:
-        bbox = draw.textbbox((0, 0), author_text, font=font_author)
-        author_width = bbox[2] - bbox[0]
-        draw.text(((WIDTH - author_width) // 2 + 1, y + 1), author_text, fill="#000000", font=font_author)
-        draw.text(((WIDTH - author_width) // 2, y), author_text, fill="#d4af37", font=font_author)
+    _draw_text_block(img, scaled_items(layout["author_items"]), font_author, "#d4af37",
+                     shadow_offsets=[(s(1), s(1))], shadow_style=shadow_style)
 
     # 8. 上下のゴールドアクセントライン（太め）
-    draw.rectangle([(0, 0), (WIDTH, 4)], fill="#d4af37")
-    draw.rectangle([(0, HEIGHT - 4), (WIDTH, HEIGHT)], fill="#d4af37")
+    draw.rectangle([(0, 0), (width, s(4))], fill="#d4af37")
+    draw.rectangle([(0, height - s(4)), (width, height)], fill="#d4af37")
 
-    # 保存
-    img.save(output_path, quality=95)
+
+def _render_quote_image(quote, author, rng, shadow_style="hard", use_photo=True):
+    """名言画像を描画してRGB画像を返す（乱数はすべて rng から取る）
+
+    use_photo=False なら背景写真を取得せずグラデーション背景にする
+    """
+    pil_stats_before = Image.core.get_stats()
+    scheme_index = rng.randrange(len(COLOR_SCHEMES))
+    scheme = COLOR_SCHEMES[scheme_index]
+    # 配色・サイズだけで決まるレイヤーはキャッシュから取得
+    layers = get_layers(COLOR_SCHEMES, WIDTH, HEIGHT)
+
+    # 背景写真を取得（スーパーカー、タワマン、豪邸など）
+    bg_photo = None
+    try:
+        if use_photo:
+            bg_photo = _get_background_photo(rng)
+    except Exception as e:
+        print(f"[WARN] 背景写真取得失敗: {e}")
+
+    # 作業バッファ（RGBA 1枚）: 背景・ボケ・ノイズはこの配列に直接書き込む
+    buf = np.empty((HEIGHT, WIDTH, 4), dtype=np.uint8)
+    buf[:, :, 3] = 255
+    rgb = buf[:, :, :3]
+    canvas_copies = 1
+
+    # 1. 背景を作成
+    if bg_photo:
+        # リッチ写真を背景に使用（ダーク加工済み）+ ビネット
+        apply_vignette(np.asarray(bg_photo.convert("RGB")), layers.vignette(), out=rgb)
+        has_photo_bg = True
+    else:
+        # フォールバック: グラデーション背景（ビネット適用済み）+ 光のボケ
+        rgb[...] = layers.background(scheme_index)
+        _add_light_bokeh(buf, scheme["glow"], count=rng.randint(4, 7), rng=rng)
+        has_photo_bg = False
+
+    # 2. ノイズテクスチャ（写真背景は軽め）
+    noise_rng = np.random.default_rng(rng.getrandbits(64))
+    add_noise(rgb, intensity=4 if has_photo_bg else 6, rng=noise_rng, out=rgb)
+
+    # 以降の合成は範囲を限定したオーバーレイで行う
+    img = Image.fromarray(buf, "RGBA")
+    del buf, rgb
+    canvas_copies += 1
+
+    # 3〜8. カード・テキストなど前景（レイアウトはフル解像度で計算）
+    layout = compute_layout(quote, author)
+    _draw_foreground(img, layout, has_photo_bg, shadow_style)
+
+    # アルファを落としたRGBで返す
+    img = img.convert("RGB")
+    canvas_copies += 1
+
+    pil_stats_after = Image.core.get_stats()
+    last_render_stats.clear()
+    last_render_stats.update({
+        "canvas_copies": canvas_copies,
+        "canvas_bytes": WIDTH * HEIGHT * 4 * canvas_copies,
+        "pil_images": pil_stats_after["new_count"] - pil_stats_before["new_count"],
+        "pil_blocks": pil_stats_after["allocated_blocks"] - pil_stats_before["allocated_blocks"],
+        "photo_background": has_photo_bg,
+        "cache_hit": False,
+    })
+    return img
+
+
+PREVIEW_SCALE = 0.25
+
+
+def render_preview(quote: str, author: str, scale: float = PREVIEW_SCALE, seed=None):
+    """縮小プレビューを描画して (画像, レイアウト) を返す
+
+    背景写真の取得・ボケ・ノイズは省き、配色のグラデーションだけを背景にする。
+    改行位置やカード範囲はフル解像度の compute_layout と同じものを縮小して使う。
+    """
+    if seed is None:
+        seed = default_seed(quote, author)
+    rng = random.Random(seed)
+    scheme = COLOR_SCHEMES[rng.randrange(len(COLOR_SCHEMES))]
+
+    width, height = max(1, int(round(WIDTH * scale))), max(1, int(round(HEIGHT * scale)))
+    background = gradient_array(width, height, scheme["grad1"], scheme["grad2"])
+    apply_vignette(background, out=background)
+    img = Image.fromarray(background, "RGB").convert("RGBA")
+
+    layout = compute_layout(quote, author)
+    _draw_foreground(img, layout, has_photo_bg=False, scale=scale)
+    return img.convert("RGB"), layout
+
+
+def make_contact_sheet(images, columns=4, padding=8, background=(24, 24, 24)):
+    """複数の画像を1枚のコンタクトシートに並べる"""
+    if not images:
+        raise ValueError("画像がありません")
+    cell_w = max(img.width for img in images)
+    cell_h = max(img.height for img in images)
+    columns = max(1, min(columns, len(images)))
+    rows = (len(images) + columns - 1) // columns
+    sheet = Image.new(
+        "RGB",
+        (columns * cell_w + (columns + 1) * padding, rows * cell_h + (rows + 1) * padding),
+        background,
+    )
+    for i, img in enumerate(images):
+        row, col = divmod(i, columns)
+        sheet.paste(img, (padding + col * (cell_w + padding), padding + row * (cell_h + padding)))
+    return sheet
+
+
+def generate_preview_sheet(items, output_path="preview_sheet.png", scale=PREVIEW_SCALE, columns=4) -> str:
+    """[(quote, author), ...] のプレビューを並べたコンタクトシートを保存"""
+    started = time.perf_counter()
+    previews = [render_preview(quote, author, scale=scale)[0] for quote, author in items]
+    make_contact_sheet(previews, columns=columns).save(output_path)
+    print(f"[OK] プレビュー {len(previews)} 件を {time.perf_counter() - started:.2f}秒で生成: {output_path}")
     return output_path
 
 
+# 直近のバッチ生成の統計（枚数・所要時間・スループット）
+last_batch_stats = {}
+
+
+def _init_render_worker():
+    """ワーカープロセス起動時にフォントを読み込んでおく"""
+    preload(FONT_SIZES)
+
+
+def _render_one(job):
+    """1枚描画して (出力パス, 所要秒数) を返す（ワーカー用）"""
+    quote, author, output_path = job
+    started = time.perf_counter()
+    try:
+        path = generate_quote_image(quote, author, output_path)
+    except Exception as e:
+        print(f"[WARN] 画像生成失敗 ({quote[:20]}): {e}")
+        path = None
+    return path, time.perf_counter() - started
+
+
+def generate_quote_images(items, workers=None, output_dir="quote_images") -> list:
+    """複数の名言画像をプロセス並列で生成する
+
+    Args:
+        items: [(quote, author), ...]
+        workers: 並列プロセス数（省略時はCPUコア数、1なら同一プロセスで順番に生成）
+        output_dir: 出力先ディレクトリ（1枚ごとに重複しないファイル名を付ける）
+
+    Returns:
+        list: 各itemの出力パス（失敗したものはNone）
+    """
+    items = list(items)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(items) or 1))
+
+    os.makedirs(output_dir, exist_ok=True)
+    batch_id = f"{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    jobs = [
+        (quote, author, os.path.join(output_dir, f"quote_{batch_id}_{i + 1:03d}.png"))
+        for i, (quote, author) in enumerate(items)
+    ]
+
+    started = time.perf_counter()
+    if workers == 1:
+        _init_render_worker()
+        results = [_render_one(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker) as pool:
+            results = list(pool.map(_render_one, jobs))
+    elapsed = time.perf_counter() - started
+
+    paths = [path for path, _ in results]
+    ok_count = sum(1 for path in paths if path)
+    throughput = ok_count / elapsed if elapsed > 0 else 0.0
+    last_batch_stats.clear()
+    last_batch_stats.update({
+        "count": len(jobs),
+        "succeeded": ok_count,
+        "workers": workers,
+        "seconds": elapsed,
+        "images_per_second": throughput,
+        "render_seconds": [seconds for _, seconds in results],
+    })
+    print(f"[OK] {ok_count}/{len(jobs)} 枚を {elapsed:.2f}秒で生成（{throughput:.2f}枚/秒, {workers}プロセス）")
+    return paths
+
+
+def parse_quote_line(line):
+    """「名言」 - 著者 形式の1行を (quote, author) に分解"""
+    if " - " in line:
+        quote_part, author_part = line.rsplit(" - ", 1)
+    else:
+        quote_part, author_part = line, ""
+    return quote_part.replace("「", "").replace("」", "").strip(), author_part.strip()
+
+
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="名言画像の生成")
+    parser.add_argument("--batch", metavar="FILE", help="「名言」 - 著者 形式の行を並べたファイルを一括生成")
+    parser.add_argument("--workers", type=int, default=None, help="並列プロセス数（省略時はCPUコア数）")
+    parser.add_argument("--out", default="quote_images", help="一括生成の出力先ディレクトリ")
+    parser.add_argument("--preview", metavar="FILE", help="縮小プレビューのコンタクトシートを生成（レイアウト確認用）")
+    parser.add_argument("--scale", type=float, default=PREVIEW_SCALE, help="プレビューの縮小率")
+    args = parser.parse_args()
+
+    if args.preview:
+        with open(args.preview, "r", encoding="utf-8") as f:
+            items = [parse_quote_line(line.strip()) for line in f if line.strip()]
+        generate_preview_sheet(items, scale=args.scale)
+        sys.exit(0)
+
+    if args.batch:
+        with open(args.batch, "r", encoding="utf-8") as f:
+            items = [parse_quote_line(line.strip()) for line in f if line.strip()]
+        generate_quote_images(items, workers=args.workers, output_dir=args.out)
+        sys.exit(0)
+
     quotes = [
         ("私は失敗していない。うまくいかない方法を1万通り見つけただけだ", "トーマス・エジソン"),
         ("夢を見ることができれば、それは実現できる", "ウォルト・ディズニー"),
@@ -0,0 +1,160 @@
+"""少しずつ届くJSON（AIのストリーミング応答）を読みながら、完成した文字列から順に取り出す
+
+    parser = JsonStreamParser()
+    for chunk in chunks:
+        for key, value, is_item in parser.feed(chunk):
+            ...   # {"tweets": ["a", "b"], "image_quote": "c"} なら
+                  # ("tweets", "a", True), ("tweets", "b", True), ("image_quote", "c", False)
+    result = parser.result()   # 閉じ括弧まで届いていなければ ValueError
+
+対象はトップレベルが {...} のJSONで、取り出すのはトップレベルの文字列値と
+トップレベルの配列の中の文字列要素。それより深い値は読み飛ばす。
+最初の { より前（```json など）と、最後の } より後は無視する。
+1文字ずつではなく正規表現で次の記号まで読み飛ばし、前回の続きから読む。
+括弧ごとに次に来てよいもの（キー・コロン・値・カンマ）を覚えておき、区切りの抜けや余分、
+トップレベルのキーの重複（後の値で前の値を置き換える）は ValueError にする。
+"""
+
+import re
+import json
+
+_SPECIAL = re.compile(r'["{}\[\],:]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+# 括弧の中で次に来てよいもの
+_KEY_OR_END = "key_or_end"      # { の直後
+_KEY = "key"                    # { の中のカンマの後
+_COLON = "colon"
+_VALUE_OR_END = "value_or_end"  # [ の直後
+_VALUE = "value"                # コロンの後・[ の中のカンマの後
+_NEXT = "next"                  # 値の後（カンマか閉じ括弧）
+
+
+class JsonStreamParser:
+    def __init__(self):
+        self.text = ""
+        self.done = False
+        self._pos = 0
+        self._stack = []          # 開いている括弧と次に来てよいもの（["{", _KEY] など）
+        self._string_start = None  # 読みかけの文字列の開始位置
+        self._key = None          # 今読んでいるトップレベルのキー
+        self._keys = set()        # 読んだトップレベルのキー
+        self._fields = {}
+
+    def feed(self, chunk) -> list:
+        """テキスト片を追加し、新しく完成した (キー, 値, 配列の要素か) のリストを返す"""
+        self.text += chunk
+        events = []
+        text = self.text
+        i = self._pos
+        while not self.done:
+            if self._string_start is not None:
+                m = _STRING_SPECIAL.search(text, i)
+                if m is None:
+                    i = len(text)
+                    break
+                if m.group() == "\\":
+                    if m.end() >= len(text):
+                        # エスケープの途中で切れている → 続きが届いてから読む
+                        i = m.start()
+                        break
+                    i = m.end() + 1
+                    continue
+                i = m.end()
+                raw = text[self._string_start:i]
+                self._string_start = None
+                self._string_done(raw, events)
+                continue
+
+            if not self._stack:
+                start = text.find("{", i)
+                if start < 0:
+                    i = len(text)
+                    break
+                self._stack.append(["{", _KEY_OR_END])
+                i = start + 1
+                continue
+
+            m = _SPECIAL.search(text, i)
+            if m is None:
+                # 読みかけの数値・true などは次の記号が届いてから読む
+                break
+            self._literal(text[i:m.start()], i)
+            ch = m.group()
+            i = m.end()
+            frame = self._stack[-1]
+            if ch == '"':
+                if frame[1] not in (_KEY_OR_END, _KEY, _VALUE_OR_END, _VALUE):
+                    self._error(m.start(), ch)
+                self._string_start = m.start()
+            elif ch in "{[":
+                self._value_done(m.start(), ch)
+                self._stack.append([ch, _KEY_OR_END if ch == "{" else _VALUE_OR_END])
+            elif ch in "}]":
+                opener, state = self._stack.pop()
+                if (opener == "{") != (ch == "}"):
+                    raise ValueError(f"JSONの括弧が対応していません（{m.start()}文字目）")
+                if state not in (_NEXT, _KEY_OR_END if opener == "{" else _VALUE_OR_END):
+                    self._error(m.start(), ch)
+                if not self._stack:
+                    self.done = True
+            elif ch == ":":
+                if frame[1] != _COLON:
+                    self._error(m.start(), ch)
+                frame[1] = _VALUE
+            else:
+                if frame[1] != _NEXT:
+                    self._error(m.start(), ch)
+                frame[1] = _KEY if frame[0] == "{" else _VALUE
+        self._pos = i
+        return events
+
+    @staticmethod
+    def _error(pos, ch):
+        raise ValueError(f"JSONの区切りが正しくありません（{pos}文字目の {ch}）")
+
+    def _value_done(self, pos, what):
+        """値が1つ来た（来てよい位置でなければ ValueError）"""
+        frame = self._stack[-1]
+        if frame[1] not in (_VALUE_OR_END, _VALUE):
+            self._error(pos, what)
+        frame[1] = _NEXT
+
+    def _literal(self, gap, pos):
+        """記号の間の数値・true・false・null"""
+        token = gap.strip()
+        if not token:
+            return
+        try:
+            json.loads(token)
+        except ValueError:
+            raise ValueError(f"JSONの値が正しくありません（{pos}文字目: {token[:20]}）")
+        self._value_done(pos, token[:20])
+
+    def _string_done(self, raw, events):
+        frame = self._stack[-1]
+        depth = len(self._stack)
+        if frame[1] in (_KEY_OR_END, _KEY):
+            frame[1] = _COLON
+            if depth == 1:
+                key = json.loads(raw)
+                if key in self._keys:
+                    raise ValueError(f"JSONのキー {key} が重複しています")
+                self._keys.add(key)
+                self._key = key
+            return
+        frame[1] = _NEXT
+        if depth == 1:
+            value = json.loads(raw)
+            self._fields[self._key] = value
+            events.append((self._key, value, False))
+        elif depth == 2 and frame[0] == "[":
+            value = json.loads(raw)
+            self._fields.setdefault(self._key, []).append(value)
+            events.append((self._key, value, True))
+
+    def result(self) -> dict:
+        """読み取ったトップレベルの文字列値・文字列配列の dict（JSONが閉じていなければ ValueError）"""
+        if not self.done:
+            raise ValueError(f"応答が途中で終わっています: {self.text[-200:]}")
+        return dict(self._fields)
@@ -0,0 +1,117 @@
+"""背景レイヤー（グラデーション + ビネット）のキャッシュモジュール
+
+配色パターンとキャンバスサイズだけで決まるレイヤーを一度だけ計算し、
+ディスク（.npy）とプロセス内に保持する。ディスクからはmmapで読み込むので
+コピーなしで使える。配色テーブルやサイズが変わるとキャッシュは作り直される。
+"""
+
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+from image_effects import gradient_array, vignette_mask, apply_vignette
+
+# レイヤーの計算方法を変えたら上げる（古いキャッシュを無効化）
+LAYER_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".cache", "layers")
+
+# プロセス内キャッシュ: fingerprint -> BackgroundLayers
+_registry = {}
+
+
+def _fingerprint(schemes, width, height) -> str:
+    """配色テーブル・サイズ・バージョンから決まるキャッシュ識別子"""
+    payload = json.dumps({
+        "version": LAYER_VERSION,
+        "size": [width, height],
+        "grads": [[list(s["grad1"]), list(s["grad2"])] for s in schemes],
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class BackgroundLayers:
+    """1つの配色テーブル・サイズに対応する背景レイヤー群"""
+
+    def __init__(self, schemes, width, height, cache_dir=None):
+        self.schemes = schemes
+        self.width = width
+        self.height = height
+        self.cache_dir = cache_dir or os.getenv("LAYER_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.fingerprint = _fingerprint(schemes, width, height)
+        self.dir = os.path.join(self.cache_dir, self.fingerprint)
+        self._layers = {}
+        self._pruned = False
+
+    def vignette(self) -> np.ndarray:
+        """ビネットの明るさマスク（写真背景用, 読み取り専用 HxW uint8）"""
+        return self._get("vignette", lambda: vignette_mask(self.width, self.height))
+
+    def background(self, index) -> np.ndarray:
+        """配色パターン index のグラデーション + ビネット（読み取り専用 HxWx3 uint8）"""
+        scheme = self.schemes[index]
+
+        def build():
+            grad = gradient_array(self.width, self.height, scheme["grad1"], scheme["grad2"])
+            return apply_vignette(grad, self.vignette())
+
+        return self._get(f"scheme_{index}", build)
+
+    def _get(self, name, build):
+        """メモリ → ディスク → 計算 の順でレイヤーを取得"""
+        arr = self._layers.get(name)
+        if arr is not None:
+            return arr
+
+        path = os.path.join(self.dir, name + ".npy")
+        if os.path.exists(path):
+            try:
+                arr = np.load(path, mmap_mode="r")
+            except (OSError, ValueError) as e:
+                print(f"[WARN] レイヤーキャッシュ読み込み失敗 ({name}): {e}")
+                arr = None
+            if arr is not None and arr.shape[:2] != (self.height, self.width):
+                arr = None
+
+        if arr is None:
+            arr = build()
+            arr.setflags(write=False)
+            self._save(path, arr)
+
+        self._layers[name] = arr
+        return arr
+
+    def _save(self, path, arr):
+        """一時ファイル経由で保存（書き込み途中のファイルを読ませない）"""
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            self._prune_stale()
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, arr)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[WARN] レイヤーキャッシュ保存失敗: {e}")
+
+    def _prune_stale(self):
+        """配色テーブルやサイズが変わる前の古いキャッシュを削除"""
+        if self._pruned:
+            return
+        self._pruned = True
+        for entry in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, entry)
+            if entry != self.fingerprint and len(entry) == 16 and os.path.isdir(entry_path):
+                shutil.rmtree(entry_path, ignore_errors=True)
+
+
+def get_layers(schemes, width, height) -> BackgroundLayers:
+    """プロセス内で共有する BackgroundLayers を返す"""
+    key = _fingerprint(schemes, width, height)
+    layers = _registry.get(key)
+    if layers is None:
+        layers = BackgroundLayers(schemes, width, height)
+        _registry[key] = layers
+    return layers
@@ -54,11 +54,19 @@ def main():
 
     elif choice == "3":
         from content_generator import ContentGenerator
+        from image_generator import generate_preview_sheet, parse_quote_line
         generator = ContentGenerator()
         print("\nテスト生成（5回）:")
+        items = []
         for i in range(5):
             content = generator.generate_post()
             print(f"\n[{i+1}] {content}")
+            if content:
+                items.append(parse_quote_line(generator.last_post))
+
+        # 画像のレイアウトは縮小プレビューでまとめて確認（フル解像度の描画はしない）
+        if items:
+            generate_preview_sheet(items)
 
     elif choice == "4":
         client.login_manual()
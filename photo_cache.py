@@ -0,0 +1,243 @@
+"""背景写真のローカルキャッシュ（キーワード別・LRU削除付き）
+
+加工済み（リサイズ・クロップ・ダーク加工済み）の背景写真をキーワードごとに保存し、
+ネットワークなしで再利用できるようにする。容量上限を超えたら最後に使われた
+時刻が古いものから削除する。ディレクトリごとCIのキャッシュとして保存・復元できる。
+
+同じディレクトリを複数プロセスで使っても壊れないよう、インデックスの更新はファイルロックの中で
+ディスク上のインデックスと突き合わせて（他プロセスの追加・削除を取り込んで）から書き込む。
+"""
+
+import os
+import json
+import time
+import atexit
+import random
+import hashlib
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: ファイルロックなし
+
+from PIL import Image
+
+DEFAULT_PHOTO_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".cache", "photos")
+INDEX_FILE = "index.json"
+PHOTO_CACHE_MAX_MB = 50     # キャッシュ全体の容量上限
+PHOTOS_PER_QUERY = 3        # キーワードごとに保持したい枚数（下回ったら補充）
+REFILL_JOIN_TIMEOUT = 30    # 終了時に補充中の書き込みを待つ秒数
+
+
+class PhotoCache:
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.getenv("PHOTO_CACHE_DIR", DEFAULT_PHOTO_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("PHOTO_CACHE_MAX_MB", PHOTO_CACHE_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._refilling = set()
+        self._threads = []
+        self._removed = set()  # このプロセスで削除した（ディスク上のインデックスからも消す）写真
+        self.entries = self._load_index()
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, INDEX_FILE)
+
+    def _load_index(self) -> dict:
+        """インデックスを読み込む（実ファイルがないエントリは捨てる）"""
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                entries = json.load(f).get("entries", {})
+        except (OSError, ValueError):
+            return {}
+        return {
+            name: entry for name, entry in entries.items()
+            if os.path.exists(os.path.join(self.cache_dir, name))
+        }
+
+    def _open_lock(self):
+        """別プロセスとインデックスを取り合わないようにロック（fcntl がなければ何もしない）"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if fcntl is None:
+            return None
+        lock_file = open(self._index_path() + ".lock", "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _save_index(self):
+        """ディスク上のインデックスと合わせて保存（ファイルロックを取ってから呼ぶ）
+
+        他プロセスが追加した写真も数えて容量上限を守り、インデックスにない写真・
+        書きかけの一時ファイル（途中で止まったプロセスの残り）は削除する。
+        """
+        merged = self._load_index()
+        for name in self._removed:
+            merged.pop(name, None)
+        for name, entry in self.entries.items():
+            if name in merged:
+                entry["last_used"] = max(entry["last_used"], merged[name]["last_used"])
+            merged[name] = entry
+        self.entries = merged
+        self._evict()
+        self._removed.clear()
+
+        tmp_path = f"{self._index_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self._index_path())
+
+        for name in os.listdir(self.cache_dir):
+            if name in self.entries or not (name.endswith(".jpg") or name.endswith(".tmp")):
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def _sync_index(self):
+        """ファイルロックの中でインデックスを保存（self._lock を取ってから呼ぶ）"""
+        lock_file = self._open_lock()
+        try:
+            self._save_index()
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+
+    def count(self, query, size=None) -> int:
+        """キーワードに対応する保存枚数"""
+        with self._lock:
+            return len(self._find(query, size))
+
+    def total_bytes(self) -> int:
+        return sum(e["bytes"] for e in self.entries.values())
+
+    def _find(self, query, size):
+        return [
+            name for name, e in self.entries.items()
+            if (query is None or e["query"] == query)
+            and (size is None or tuple(e["size"]) == tuple(size))
+        ]
+
+    def get(self, query, size, rng=random):
+        """キャッシュから加工済み写真を取得（なければNone）
+
+        query=None なら全キーワードから選ぶ（オフライン時のフォールバック用）
+        """
+        with self._lock:
+            names = self._find(query, size)
+            if not names:
+                return None
+            name = rng.choice(sorted(names))
+            self.entries[name]["last_used"] = time.time()
+            try:
+                self._sync_index()
+            except OSError:
+                pass
+        path = os.path.join(self.cache_dir, name)
+        try:
+            with Image.open(path) as img:
+                return img.convert("RGB")
+        except OSError as e:
+            print(f"[WARN] キャッシュ写真の読み込み失敗: {e}")
+            with self._lock:
+                self.entries.pop(name, None)
+                self._removed.add(name)
+            return None
+
+    def put(self, query, img, source=""):
+        """加工済み写真を保存し、容量上限を超えたら古いものから削除"""
+        key = source or f"{time.time()}-{random.random()}"
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + ".jpg"
+        with self._lock:
+            if name in self.entries:
+                self.entries[name]["last_used"] = time.time()
+                return
+            # 画像の書き込みからインデックスへの登録までロックの中で行う
+            # （ロックの外で見つかるインデックスにない写真は、途中で止まったプロセスの残り）
+            lock_file = self._open_lock()
+            try:
+                path = os.path.join(self.cache_dir, name)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                img.convert("RGB").save(tmp_path, "JPEG", quality=92)
+                os.replace(tmp_path, path)
+                now = time.time()
+                self.entries[name] = {
+                    "query": query,
+                    "size": list(img.size),
+                    "bytes": os.path.getsize(path),
+                    "source": source,
+                    "created": now,
+                    "last_used": now,
+                }
+                self._save_index()
+            finally:
+                if lock_file is not None:
+                    lock_file.close()
+
+    def _evict(self):
+        """LRU: 合計サイズが上限以下になるまで最終使用が古いものを削除"""
+        total = self.total_bytes()
+        for name in sorted(self.entries, key=lambda n: self.entries[n]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= self.entries.pop(name)["bytes"]
+            self._removed.add(name)
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def refill_async(self, query, fetch, size=None):
+        """保存枚数が少なければバックグラウンドで1枚補充する
+
+        fetch: 引数なしで (加工済み画像, 取得元URL) または None を返す関数
+        """
+        if self.count(query, size) >= PHOTOS_PER_QUERY:
+            return None
+        with self._lock:
+            if query in self._refilling:
+                return None
+            self._refilling.add(query)
+
+        def worker():
+            try:
+                result = fetch()
+                if result:
+                    img, source = result
+                    self.put(query, img, source=source)
+                    print(f"[OK] 背景写真キャッシュを補充: {query}")
+            except Exception as e:
+                print(f"[WARN] 背景写真キャッシュ補充失敗 ({query}): {e}")
+            finally:
+                with self._lock:
+                    self._refilling.discard(query)
+
+        thread = threading.Thread(target=worker, daemon=True)
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            self._threads.append(thread)
+        thread.start()
+        return thread
+
+    def join_refills(self, timeout=REFILL_JOIN_TIMEOUT):
+        """補充中のスレッドが書き終えるまで待つ（全体で最大 timeout 秒。プロセス終了前に呼ぶ）"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+
+_photo_cache = None
+
+
+def get_photo_cache() -> PhotoCache:
+    """プロセス内で共有する PhotoCache を返す"""
+    global _photo_cache
+    if _photo_cache is None:
+        _photo_cache = PhotoCache()
+        # 補充はデーモンスレッドなので、終了時に書き込みの途中で止まらないよう待つ
+        atexit.register(_photo_cache.join_refills)
+    return _photo_cache
@@ -0,0 +1,255 @@
+"""SQLiteで投稿・著者・投稿履歴をまとめて管理するモジュール（任意）
+
+環境変数 POST_DB にデータベースのパスを指定すると ContentGenerator がこちらを使う。
+posts.txt / post_history.jsonl から取り込み（import）、書き戻し（export）できる。
+
+    python post_db.py import          # posts.txt と投稿履歴を取り込む
+    python post_db.py export          # データベースの内容をファイルに書き戻す
+    python post_db.py stats           # 件数・出典別の内訳
+    python post_db.py author イチロー  # 著者の名言一覧
+"""
+
+import os
+import time
+import sqlite3
+
+DEFAULT_POST_DB = os.path.join(os.path.dirname(__file__), "posts.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS authors (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE,          -- 「名言」 - 著者 の1行
+    quote TEXT NOT NULL,
+    author_id INTEGER REFERENCES authors(id),
+    source TEXT NOT NULL,               -- file / api / history（履歴にだけある投稿）
+    added_at INTEGER NOT NULL,
+    posted_at INTEGER,                  -- 投稿時刻（UNIX秒, 不明なら NULL）
+    posted_seq INTEGER,                 -- 投稿順（未投稿は NULL）
+    use_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_posts_unposted ON posts(id) WHERE posted_seq IS NULL;
+CREATE INDEX IF NOT EXISTS idx_posts_posted ON posts(posted_seq) WHERE posted_seq IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_posts_author ON posts(author_id);
+"""
+
+
+def split_author(text):
+    """「名言」 - 著者 形式の1行を (名言, 著者) に分解（著者なしは None）"""
+    if " - " in text:
+        quote, author = text.rsplit(" - ", 1)
+        return quote.strip(), author.strip() or None
+    return text.strip(), None
+
+
+class PostDatabase:
+    """投稿のコーパスと投稿履歴（PostIndex と同じ操作を索引付きクエリで行う）"""
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("POST_DB", DEFAULT_POST_DB)
+        # 補充ワーカーのスレッドからも使う（排他は ContentGenerator のロックで行う）
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._author_ids = {}
+
+    def close(self):
+        self.conn.close()
+
+    def _scalar(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchone()[0]
+
+    def _author_id(self, name):
+        if name is None:
+            return None
+        author_id = self._author_ids.get(name)
+        if author_id is None:
+            self.conn.execute("INSERT OR IGNORE INTO authors (name) VALUES (?)", (name,))
+            author_id = self._scalar("SELECT id FROM authors WHERE name = ?", (name,))
+            self._author_ids[name] = author_id
+        return author_id
+
+    # --- PostIndex と同じ操作 ---
+
+    def __contains__(self, post):
+        return self.conn.execute("SELECT 1 FROM posts WHERE text = ?", (post,)).fetchone() is not None
+
+    @property
+    def remaining(self) -> int:
+        """未投稿の件数"""
+        return self._scalar("SELECT COUNT(*) FROM posts WHERE posted_seq IS NULL")
+
+    @property
+    def total(self) -> int:
+        """コーパス（履歴にだけある投稿を除く）の件数"""
+        return self._scalar("SELECT COUNT(*) FROM posts WHERE source != 'history'")
+
+    def add_posts(self, posts, source="file") -> list:
+        """投稿を追加して、新しく入ったものを返す（既存の投稿は無視）"""
+        added = []
+        now = int(time.time())
+        with self.conn:
+            for post in posts:
+                quote, author = split_author(post)
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO posts (text, quote, author_id, source, added_at) VALUES (?, ?, ?, ?, ?)",
+                    (post, quote, self._author_id(author), source, now),
+                )
+                if cursor.rowcount:
+                    added.append(post)
+        return added
+
+    def mark_posted(self, post, posted_at=None):
+        """投稿済みとして記録（コーパスにない投稿は source=history で追加）"""
+        self._mark_posted(post, int(time.time()) if posted_at is None else posted_at)
+
+    def _mark_posted(self, post, posted_at):
+        """posted_at=None は投稿時刻不明（旧形式の履歴の取り込み）"""
+        with self.conn:
+            seq = self._scalar("SELECT COALESCE(MAX(posted_seq), 0) + 1 FROM posts WHERE posted_seq IS NOT NULL")
+            cursor = self.conn.execute(
+                "UPDATE posts SET posted_at = ?, posted_seq = ?, use_count = use_count + 1 "
+                "WHERE text = ? AND posted_seq IS NULL",
+                (posted_at, seq, post),
+            )
+            if cursor.rowcount:
+                return
+            if post in self:
+                self.conn.execute("UPDATE posts SET use_count = use_count + 1 WHERE text = ?", (post,))
+                return
+            quote, author = split_author(post)
+            self.conn.execute(
+                "INSERT INTO posts (text, quote, author_id, source, added_at, posted_at, posted_seq, use_count) "
+                "VALUES (?, ?, ?, 'history', ?, ?, ?, 1)",
+                (post, quote, self._author_id(author), int(time.time()), posted_at, seq),
+            )
+
+    def all_texts(self):
+        """全投稿（コーパスと履歴）"""
+        for (text,) in self.conn.execute("SELECT text FROM posts ORDER BY id"):
+            yield text
+
+    # --- シャッフルバッグ用（投稿IDは posts.id） ---
+
+    @property
+    def id_count(self) -> int:
+        return self._scalar("SELECT COALESCE(MAX(id), 0) + 1 FROM posts")
+
+    @property
+    def unposted_count(self) -> int:
+        return self.remaining
+
+    def unposted_ids(self, start=0) -> list:
+        rows = self.conn.execute(
+            "SELECT id FROM posts WHERE posted_seq IS NULL AND id >= ? ORDER BY id", (start,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def is_posted_id(self, post_id) -> bool:
+        row = self.conn.execute("SELECT posted_seq FROM posts WHERE id = ?", (post_id,)).fetchone()
+        return row is None or row[0] is not None
+
+    def post_of(self, post_id):
+        row = self.conn.execute("SELECT text FROM posts WHERE id = ?", (post_id,)).fetchone()
+        return row[0] if row else None
+
+    def fingerprint(self, count) -> int:
+        """IDは行を消さない限り変わらないので常に0"""
+        return 0
+
+    # --- 参照 ---
+
+    def recent(self, count) -> list:
+        """直近 count 件の投稿を古い順に返す"""
+        rows = self.conn.execute(
+            "SELECT text FROM posts WHERE posted_seq IS NOT NULL ORDER BY posted_seq DESC LIMIT ?", (count,)
+        ).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def last_posted(self):
+        row = self.conn.execute(
+            "SELECT text FROM posts WHERE posted_seq IS NOT NULL ORDER BY posted_seq DESC LIMIT 1"
+        ).fetchone()
+        return row[0] if row else None
+
+    def history(self) -> list:
+        """[(投稿, 投稿時刻), ...] を投稿順で返す"""
+        return self.conn.execute(
+            "SELECT text, posted_at FROM posts WHERE posted_seq IS NOT NULL ORDER BY posted_seq"
+        ).fetchall()
+
+    def posts_by_author(self, name) -> list:
+        """著者の投稿を [(投稿, 投稿済みか), ...] で返す"""
+        rows = self.conn.execute(
+            "SELECT p.text, p.posted_seq IS NOT NULL FROM posts p "
+            "JOIN authors a ON a.id = p.author_id WHERE a.name = ? ORDER BY p.id",
+            (name,),
+        ).fetchall()
+        return [(text, bool(posted)) for text, posted in rows]
+
+    def stats(self) -> dict:
+        by_source = dict(self.conn.execute("SELECT source, COUNT(*) FROM posts GROUP BY source").fetchall())
+        return {
+            "total": self.total,
+            "remaining": self.remaining,
+            "posted": self._scalar("SELECT COUNT(*) FROM posts WHERE posted_seq IS NOT NULL"),
+            "authors": self._scalar("SELECT COUNT(*) FROM authors"),
+            "by_source": by_source,
+        }
+
+    # --- ファイルとの取り込み・書き戻し ---
+
+    def import_files(self, posts_file, history_log):
+        """posts.txt と投稿履歴（HistoryLog）を取り込む（何度実行しても重複しない）"""
+        posts = []
+        if os.path.exists(posts_file):
+            with open(posts_file, "r", encoding="utf-8") as f:
+                posts = [line.strip() for line in f if line.strip()]
+        added = self.add_posts(posts, source="file")
+        entries = history_log.entries()
+        for post, posted_at in entries:
+            if not self._is_posted(post):
+                self._mark_posted(post, posted_at)
+        print(f"[OK] データベースに取り込みました（投稿 {len(added)} 件追加 / 履歴 {len(entries)} 件）")
+
+    def _is_posted(self, post) -> bool:
+        row = self.conn.execute("SELECT posted_seq FROM posts WHERE text = ?", (post,)).fetchone()
+        return row is not None and row[0] is not None
+
+    def export_files(self, posts_file, history_log):
+        """posts.txt と投稿履歴をデータベースの内容で書き直す"""
+        rows = self.conn.execute("SELECT text FROM posts WHERE source != 'history' ORDER BY id").fetchall()
+        tmp_path = f"{posts_file}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for (text,) in rows:
+                f.write(text + "\n")
+        os.replace(tmp_path, posts_file)
+        history = self.history()
+        history_log.rewrite(history)
+        print(f"[OK] ファイルに書き戻しました（投稿 {len(rows)} 件 / 履歴 {len(history)} 件）")
+
+
+if __name__ == "__main__":
+    import sys
+    from history_log import HistoryLog
+    from content_generator import DEFAULT_HISTORY_FILE
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    db = PostDatabase()
+    posts_file = os.getenv("POSTS_FILE", "posts.txt")
+    history_log = HistoryLog(os.getenv("HISTORY_FILE", DEFAULT_HISTORY_FILE))
+
+    if command == "import":
+        db.import_files(posts_file, history_log)
+    elif command == "export":
+        db.export_files(posts_file, history_log)
+    elif command == "author" and len(sys.argv) > 2:
+        for text, posted in db.posts_by_author(sys.argv[2]):
+            print(f"{'済' if posted else '未'} {text}")
+    else:
+        print(db.stats())
+    db.close()
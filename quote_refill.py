@@ -0,0 +1,171 @@
+"""名言APIからの先読み補充（バックグラウンドのワーカー）
+
+未投稿が REFILL_BUFFER 件を下回ったら、裏のスレッドで名言APIから取得して補充する。
+投稿処理（generate_post）はネットワークを待たない。
+接続は使い回し（keep-alive）、失敗したら間隔を倍々に空けて再試行する。
+環境変数 MEIGEN_API_STUB=1 ならネットワークを使わずテスト用の名言を返す。
+"""
+
+import os
+import json
+import random
+import threading
+import http.client
+import urllib.parse
+
+MEIGEN_API_URL = "https://meigen.doodlenote.net/api/json.php"
+USER_AGENT = "QuoteBot/1.0 (educational project)"
+REFILL_BUFFER = 20          # 未投稿をこの件数以上に保つ
+FETCH_MIN = 10              # 1回に取得する最小件数
+FETCH_MAX = 50              # 1回に取得する最大件数
+BACKOFF_MIN = 5.0           # 失敗時の待ち時間（秒, 倍々に増やす）
+BACKOFF_MAX = 600.0
+EMPTY_BATCHES_LIMIT = 3     # 新しい名言が取れない回数がこれを超えたら休む
+_STUB_CHARSET = 3000        # テスト用の名言に使う漢字の種類数
+
+
+def format_quote(meigen, author) -> str:
+    """posts.txt と同じ 「名言」 - 著者 形式にする"""
+    return f"「{meigen}」 - {author}"
+
+
+class MeigenClient:
+    """名言APIのクライアント（HTTP接続を使い回す）"""
+
+    def __init__(self, url=None, timeout=10):
+        parsed = urllib.parse.urlsplit(url or os.getenv("MEIGEN_API_URL", MEIGEN_API_URL))
+        self.scheme = parsed.scheme
+        self.host = parsed.netloc
+        self.path = parsed.path or "/"
+        self.timeout = timeout
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            conn_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            self._conn = conn_class(self.host, timeout=self.timeout)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def fetch(self, count) -> list:
+        """名言を count 件取得して 「名言」 - 著者 の形式で返す"""
+        try:
+            conn = self._connection()
+            conn.request("GET", f"{self.path}?c={count}", headers={"User-Agent": USER_AGENT})
+            resp = conn.getresponse()
+            body = resp.read()
+            if resp.status != 200:
+                raise RuntimeError(f"HTTP {resp.status}")
+        except Exception:
+            # 切れた接続は捨てて次回つなぎ直す
+            self.close()
+            raise
+        data = json.loads(body.decode("utf-8"))
+        return [format_quote(item["meigen"], item["auther"]) for item in data]
+
+
+class StubMeigenClient:
+    """ネットワークを使わないテスト用の代替（毎回新しい名言を返す）"""
+
+    def __init__(self, seed=0):
+        self._next = 0
+        self._rng = random.Random(seed)
+
+    def close(self):
+        pass
+
+    def fetch(self, count) -> list:
+        quotes = []
+        for _ in range(count):
+            self._next += 1
+            # 連番だけ違う文は重複除外（文字2-gramの類似度）で弾かれるので、本文は毎回ランダムな漢字列にする
+            body = "".join(chr(0x4E00 + self._rng.randrange(_STUB_CHARSET)) for _ in range(12))
+            author = f"テスト著者{self._rng.randrange(8)}"
+            quotes.append(format_quote(f"{body}（テスト{self._next}）", author))
+        return quotes
+
+
+def make_client():
+    """環境変数に応じて本物またはテスト用のクライアントを返す"""
+    if os.getenv("MEIGEN_API_STUB", "").lower() in ("1", "true", "yes"):
+        return StubMeigenClient()
+    return MeigenClient()
+
+
+class RefillWorker:
+    """未投稿が足りなくなったら裏で名言を補充するワーカー
+
+    needed: 今あと何件欲しいかを返す関数
+    deliver: 取得した名言のリストを受け取り、実際に追加した件数を返す関数（重複除外は呼び出し側）
+    """
+
+    def __init__(self, needed, deliver, client=None):
+        self.needed = needed
+        self.deliver = deliver
+        self.client = client or make_client()
+        self.backoff = 0.0
+        self.stats = {"fetches": 0, "added": 0, "failures": 0}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._idle = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def kick(self):
+        """補充が必要か確認させる（スレッドがなければ起動）"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="quote-refill", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self, timeout=None):
+        """ワーカーを止める（取得・追加の途中ならその区切りまで待つ）"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.client.close()
+
+    def wait_idle(self, timeout=None) -> bool:
+        """補充が一段落する（足りた・失敗して待機中）まで待つ（テスト用）"""
+        return self._idle.wait(timeout)
+
+    def _run(self):
+        empty_batches = 0
+        while not self._stop.is_set():
+            need = self.needed()
+            if need <= 0 or empty_batches > EMPTY_BATCHES_LIMIT:
+                # 足りている / APIから新しい名言が出てこない → 次に呼ばれるまで休む
+                empty_batches = 0
+                self._idle.set()
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            self._idle.clear()
+            try:
+                quotes = self.client.fetch(max(FETCH_MIN, min(FETCH_MAX, need)))
+            except Exception as e:
+                self.stats["failures"] += 1
+                self.backoff = min(BACKOFF_MAX, max(BACKOFF_MIN, self.backoff * 2))
+                print(f"[WARN] 名言APIの取得に失敗（{self.backoff:.0f}秒後に再試行）: {e}")
+                self._idle.set()
+                self._stop.wait(self.backoff * random.uniform(0.8, 1.2))
+                continue
+
+            self.backoff = 0.0
+            self.stats["fetches"] += 1
+            added = self.deliver(quotes)
+            self.stats["added"] += added
+            empty_batches = 0 if added else empty_batches + 1
+            print(f"[API] {added} 件の新しい名言を補充しました")
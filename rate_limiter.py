@@ -0,0 +1,271 @@
+"""Gemini API の流量制限（トークンバケット）と1日の利用量台帳
+
+  - 1分あたりのリクエスト数はトークンバケットで平準化する（GEMINI_RPM, 瞬間的には GEMINI_BURST 件まで）
+  - 1日のリクエスト数・トークン数は gemini_usage.json に記録し、別々のCIジョブ
+    （自動投稿・自動リプライ・AIプール補充）で同じ上限（GEMINI_RPD）を分け合う
+  - 直近1分のリクエスト時刻も台帳に残すので、同時に動く別プロセスとも1分の枠を共有する
+  - 呼ぶ前に expected_wait() で待ち時間が分かる（1日の上限に達していれば inf）
+
+無料枠の上限は日本時間ではなく米国太平洋時間の0時にリセットされるので、日付もそれで数える。
+環境変数 GEMINI_USAGE_FILE を空にすると台帳をファイルに保存しない（プロセス内だけで数える）。
+
+台帳はCIジョブがそれぞれリポジトリにコミットするので、git の merge ドライバとして
+merge_ledgers() を登録し（.gitattributes）、両方のジョブの利用分を足し合わせて取り込む:
+    git config merge.gemini-usage.driver "python rate_limiter.py merge %O %A %B"
+"""
+
+import os
+import json
+import time
+import datetime
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: ファイルロックなし
+
+try:
+    from zoneinfo import ZoneInfo
+    _QUOTA_TZ = ZoneInfo("America/Los_Angeles")
+except Exception:
+    _QUOTA_TZ = datetime.timezone(datetime.timedelta(hours=-8))
+
+DEFAULT_USAGE_FILE = os.path.join(os.path.dirname(__file__), "gemini_usage.json")
+DEFAULT_RPM = 15        # 1分あたりのリクエスト数
+DEFAULT_BURST = 3       # 連続で送ってよいリクエスト数
+DEFAULT_RPD = 1500      # 1日あたりのリクエスト数
+WINDOW = 60.0           # 直近何秒のリクエストを数えるか
+RATE_LIMITED_PAUSE = 60.0  # 429（上限超過）が返ったら止める秒数
+KEEP_DAYS = 7           # 台帳に残す日数
+
+
+class QuotaExceeded(RuntimeError):
+    """1日の上限に達した・待ち時間が長すぎるときの例外（APIは呼ばずに投げる）"""
+
+
+def quota_date(now=None) -> str:
+    """上限のリセット基準（米国太平洋時間）での日付"""
+    now = time.time() if now is None else now
+    return datetime.datetime.fromtimestamp(now, _QUOTA_TZ).date().isoformat()
+
+
+class TokenBucket:
+    """rate 件/秒で補充され、最大 capacity 件までためられるバケット"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def expected_wait(self, now=None) -> float:
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def reserve(self, now=None) -> float:
+        """1件分を予約して、送ってよくなるまでの秒数を返す（後続の予約はさらに後ろに並ぶ）"""
+        wait = self.expected_wait(now)
+        self.tokens -= 1
+        return wait
+
+
+class RateLimiter:
+    def __init__(self, path=None, rpm=None, rpd=None, burst=None):
+        if path is None:
+            path = os.getenv("GEMINI_USAGE_FILE", DEFAULT_USAGE_FILE)
+        self.path = path or None
+        self.rpm = int(rpm or os.getenv("GEMINI_RPM", DEFAULT_RPM))
+        self.rpd = int(rpd or os.getenv("GEMINI_RPD", DEFAULT_RPD))
+        self.bucket = TokenBucket(self.rpm / 60.0, int(burst or os.getenv("GEMINI_BURST", DEFAULT_BURST)))
+        self._lock = threading.Lock()
+        self._memory = {}  # ファイルに保存しないときの台帳
+
+    # --- 台帳 ---
+
+    def _open_lock(self, shared=False):
+        """別プロセスと台帳を取り合わないようにロック（fcntl がなければ何もしない）"""
+        if self.path is None or fcntl is None:
+            return None
+        lock_file = open(f"{self.path}.lock", "a")
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        return lock_file
+
+    def _load(self) -> dict:
+        if self.path is None:
+            return self._memory
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Gemini利用量の台帳を読み込めません（0から数えます）: {e}")
+            return {}
+
+    def _save(self, ledger):
+        if self.path is None:
+            self._memory = ledger
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(ledger, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def _update(self, fn):
+        """台帳を読み込んで fn(ledger, now) で更新・保存し、fn の戻り値を返す"""
+        with self._lock:
+            lock_file = self._open_lock()
+            try:
+                ledger = self._load()
+                now = time.time()
+                result = fn(ledger, now)
+                days = ledger.setdefault("days", {})
+                for day in sorted(days)[:-KEEP_DAYS]:
+                    del days[day]
+                ledger["recent"] = [t for t in ledger.get("recent", []) if t > now - WINDOW]
+                self._save(ledger)
+                return result
+            finally:
+                if lock_file is not None:
+                    lock_file.close()
+
+    def _read(self, fn):
+        """台帳を読み込んで fn(ledger, now) の戻り値を返す（ファイルは書き換えない）"""
+        with self._lock:
+            lock_file = self._open_lock(shared=True)
+            try:
+                ledger = self._load()
+            finally:
+                if lock_file is not None:
+                    lock_file.close()
+            return fn(ledger, time.time())
+
+    @staticmethod
+    def _today(ledger, now) -> dict:
+        return ledger.setdefault("days", {}).setdefault(quota_date(now), {"requests": 0, "tokens": 0})
+
+    def _wait(self, ledger, now, reserve) -> float:
+        today = self._today(ledger, now)
+        if today["requests"] >= self.rpd:
+            return float("inf")
+        waits = [ledger.get("paused_until", 0) - now]
+        recent = sorted(t for t in ledger.get("recent", []) if t > now - WINDOW)
+        if len(recent) >= self.rpm:
+            # 直近1分の枠が埋まっている（別プロセスの分も含む）→ 古い分が枠から出るまで
+            waits.append(recent[len(recent) - self.rpm] + WINDOW - now)
+        waits.append(self.bucket.reserve() if reserve else self.bucket.expected_wait())
+        return max(0.0, *waits)
+
+    # --- 公開API ---
+
+    def expected_wait(self) -> float:
+        """今リクエストするとしたら何秒待つか（1日の上限に達していれば inf）"""
+        return self._read(lambda ledger, now: self._wait(ledger, now, reserve=False))
+
+    def remaining_today(self) -> int:
+        return self._read(lambda ledger, now: max(0, self.rpd - self._today(ledger, now)["requests"]))
+
+    def acquire(self, max_wait=None) -> float:
+        """1件分の枠を予約し、送ってよい時刻まで待つ（待った秒数を返す）
+
+        1日の上限に達している、または待ち時間が max_wait 秒を超えるなら待たずに QuotaExceeded。
+        """
+        def reserve(ledger, now):
+            wait = self._wait(ledger, now, reserve=False)
+            if wait == float("inf"):
+                raise QuotaExceeded(f"Gemini APIの1日の上限（{self.rpd}件）に達しています")
+            if max_wait is not None and wait > max_wait:
+                raise QuotaExceeded(f"Gemini APIの待ち時間が長すぎます（{wait:.0f}秒）")
+            wait = self._wait(ledger, now, reserve=True)
+            self._today(ledger, now)["requests"] += 1
+            ledger.setdefault("recent", []).append(now + wait)
+            return wait
+
+        wait = self._update(reserve)
+        if wait > 0:
+            print(f"[INFO] Gemini APIの流量制限のため {wait:.1f}秒待ちます")
+            time.sleep(wait)
+        return wait
+
+    def record_tokens(self, tokens):
+        """応答で使ったトークン数を台帳に足す"""
+        if not tokens:
+            return
+
+        def add(ledger, now):
+            self._today(ledger, now)["tokens"] += int(tokens)
+
+        self._update(add)
+
+    def pause(self, seconds=RATE_LIMITED_PAUSE):
+        """API側で上限超過（429）になったとき、しばらく全プロセスで送らないようにする"""
+        def set_pause(ledger, now):
+            ledger["paused_until"] = max(ledger.get("paused_until", 0), now + seconds)
+
+        self._update(set_pause)
+        print(f"[WARN] Gemini APIが上限超過を返しました。{seconds:.0f}秒間リクエストを止めます")
+
+
+def merge_ledgers(base, ours, theirs) -> dict:
+    """共通の祖先 base から別々に増えた2つの台帳を合わせる（日ごとの件数は両方の増分を足す）"""
+    merged = {"days": {}}
+    base_days = base.get("days", {})
+    for side in (ours, theirs):
+        for day in side.get("days", {}):
+            merged["days"].setdefault(day, {"requests": 0, "tokens": 0})
+    for day, counts in merged["days"].items():
+        for key in counts:
+            before = base_days.get(day, {}).get(key, 0)
+            grown = [side.get("days", {}).get(day, {}).get(key, before) - before for side in (ours, theirs)]
+            counts[key] = max(0, before + sum(grown))
+    for day in sorted(merged["days"])[:-KEEP_DAYS]:
+        del merged["days"][day]
+    merged["recent"] = sorted(set(ours.get("recent", [])) | set(theirs.get("recent", [])))
+    paused_until = max(ours.get("paused_until", 0), theirs.get("paused_until", 0))
+    if paused_until:
+        merged["paused_until"] = paused_until
+    return merged
+
+
+def _read_ledger_file(path) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    """プロセス内で共有する RateLimiter を返す"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) == 5 and sys.argv[1] == "merge":
+        # git の merge ドライバ: 祖先 %O・自分 %A・相手 %B を合わせて %A に書く
+        base_path, ours_path, theirs_path = sys.argv[2:]
+        merged = merge_ledgers(*(_read_ledger_file(p) for p in (base_path, ours_path, theirs_path)))
+        with open(ours_path, "w", encoding="utf-8") as f:
+            json.dump(merged, f, ensure_ascii=False, indent=1)
+        sys.exit(0)
+
+    limiter = get_limiter()
+    wait = limiter.expected_wait()
+    print(f"今日（{quota_date()}）の残り: {limiter.remaining_today()} / {limiter.rpd} 件")
+    print(f"次のリクエストまでの待ち時間: {'上限到達' if wait == float('inf') else f'{wait:.1f}秒'}")
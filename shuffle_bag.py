@@ -0,0 +1,136 @@
+"""未投稿の投稿IDをシャッフル済みで保存しておく袋（シャッフルバッグ）
+
+ファイルは固定長（uint32）のID列なので、
+  - 取り出し: 末尾の4バイトを読んでファイルを切り詰めるだけ（O(1)）
+  - 追加: 末尾に書いてからランダムな位置と入れ替える（O(1), 並びは一様なシャッフルのまま）
+で済み、プロセスを再起動しても続きから取り出せる。
+
+投稿IDは索引（PostIndex / PostDatabase）が決める。索引が持つべき操作:
+    id_count, unposted_count, unposted_ids(start), is_posted_id(id), post_of(id), fingerprint(n)
+"""
+
+import os
+import random
+import struct
+
+HEADER = struct.Struct("<4sII")  # マジック, 取り込み済みIDの上限, 取り込み済み範囲のチェックサム
+MAGIC = b"BAG1"
+ID = struct.Struct("<I")
+
+
+class ShuffleBag:
+    def __init__(self, path):
+        self.path = path
+
+    def __len__(self):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return 0
+        return max(0, (size - HEADER.size) // ID.size)
+
+    def _read_header(self):
+        try:
+            with open(self.path, "rb") as f:
+                header = f.read(HEADER.size)
+        except OSError:
+            return None
+        if len(header) != HEADER.size:
+            return None
+        magic, known, checksum = HEADER.unpack(header)
+        if magic != MAGIC:
+            return None
+        return known, checksum
+
+    def sync(self, index, rng=random):
+        """索引と突き合わせる（新しい投稿は袋に入れ、食い違っていれば作り直す）"""
+        header = self._read_header()
+        count = index.id_count
+        if header is not None:
+            known, checksum = header
+            # 未投稿より袋が少ない（取り出した後に投稿されなかった等）・投稿が減った・並びが変わった
+            consistent = known <= count and checksum == index.fingerprint(known)
+            if consistent:
+                new_ids = index.unposted_ids(known)
+                consistent = len(self) >= index.unposted_count - len(new_ids)
+            if consistent:
+                if known < count:
+                    self.insert(new_ids, rng)
+                    self._write_header(count, index.fingerprint(count))
+                return
+            print("[INFO] シャッフルバッグを作り直します（投稿ファイルと一致しません）")
+        self.rebuild(index, rng)
+
+    def rebuild(self, index, rng=random):
+        """未投稿のIDをシャッフルして袋を作り直す"""
+        ids = list(index.unposted_ids(0))
+        rng.shuffle(ids)
+        count = index.id_count
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, count, index.fingerprint(count)))
+            f.write(b"".join(ID.pack(i) for i in ids))
+        os.replace(tmp_path, self.path)
+
+    def _write_header(self, known, checksum):
+        with open(self.path, "r+b") as f:
+            f.write(HEADER.pack(MAGIC, known, checksum))
+
+    def insert(self, ids, rng=random):
+        """IDを袋のランダムな位置に入れる（末尾に足してから入れ替え）"""
+        if not ids:
+            return
+        with open(self.path, "r+b") as f:
+            for new_id in ids:
+                f.seek(0, os.SEEK_END)
+                size = (f.tell() - HEADER.size) // ID.size
+                j = rng.randrange(size + 1)
+                if j == size:
+                    f.write(ID.pack(new_id))
+                    continue
+                f.seek(HEADER.size + j * ID.size)
+                displaced = f.read(ID.size)
+                f.seek(HEADER.size + j * ID.size)
+                f.write(ID.pack(new_id))
+                f.seek(0, os.SEEK_END)
+                f.write(displaced)
+
+    def pop(self):
+        """末尾のIDを取り出す（空ならNone）"""
+        with open(self.path, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size < HEADER.size + ID.size:
+                return None
+            f.seek(size - ID.size)
+            (value,) = ID.unpack(f.read(ID.size))
+            f.truncate(size - ID.size)
+        return value
+
+    def pick(self, index, accept=None, rng=random, max_tries=8):
+        """未投稿の投稿を1件取り出して返す（空ならNone）
+
+        accept(post) が False の投稿は袋のランダムな位置に戻して引き直す（重み付け用）。
+        max_tries 回引いても受け入れられなければ最後に引いたものを使う。
+        投稿済みのIDは読み飛ばして捨てる。
+        """
+        fallback = None
+        tries = 0
+        while True:
+            post_id = self.pop()
+            if post_id is None:
+                break
+            if post_id >= index.id_count or index.is_posted_id(post_id):
+                continue
+            post = index.post_of(post_id)
+            tries += 1
+            if accept is None or tries >= max_tries or accept(post):
+                if fallback is not None:
+                    self.insert([fallback[0]], rng)
+                return post
+            if fallback is not None:
+                self.insert([fallback[0]], rng)
+            fallback = (post_id, post)
+        if fallback is not None:
+            return fallback[1]
+        return None
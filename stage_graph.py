@@ -0,0 +1,164 @@
+"""依存関係つきの処理段階（ステージ）を並行に実行する小さな仕組み
+
+    graph = StageGraph()
+    graph.add("browser", client.prepare, timeout=180)
+    graph.add("content", make_content, timeout=120)
+    graph.add("image", make_image, deps=("content",), timeout=60)
+    results = graph.run()   # {ステージ名: 戻り値}
+    graph.report()          # 各ステージの所要時間とクリティカルパスを表示
+
+依存するステージが終わったものから順に別スレッドで始まる。
+ステージ関数は依存先の戻り値をキーワード引数で受け取る（失敗・タイムアウトした依存先は None）。
+タイムアウトしたステージは結果を待たずに None 扱いにする（スレッドは裏で走り続ける）。
+スレッドは外から止められないので、代わりに
+  - cancellable=True のステージ関数には cancel（threading.Event）を渡し、タイムアウトで set する
+    （関数は投稿履歴の更新などの副作用の前に cancel を確かめて、set されていたら何もせず戻る）
+  - on_late(value) はタイムアウト後にステージ関数が戻ったときに呼ぶ（作ったブラウザを閉じる等）
+  - join(name, timeout) でタイムアウトしたステージのスレッドが終わるのを待てる
+"""
+
+import time
+import threading
+
+
+class Stage:
+    def __init__(self, name, fn, deps=(), timeout=None, cancellable=False, on_late=None):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.cancellable = cancellable
+        self.on_late = on_late
+        self.status = "pending"  # pending / ok / failed / timeout
+        self.value = None
+        self.error = None
+        self.late_value = None   # タイムアウト後に戻ってきた値
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+        self.cancel = threading.Event()
+        self.worker = None
+        self._lock = threading.Lock()
+
+    @property
+    def seconds(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+
+class StageGraph:
+    def __init__(self):
+        self.stages = {}
+        self._origin = None
+
+    def add(self, name, fn, deps=(), timeout=None, cancellable=False, on_late=None):
+        """ステージを追加（依存先は先に追加しておく＝循環しない）"""
+        if name in self.stages:
+            raise ValueError(f"ステージ {name} は追加済みです")
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"ステージ {name} の依存先 {dep} がありません")
+        self.stages[name] = Stage(name, fn, deps, timeout, cancellable, on_late)
+        return self
+
+    def status(self, name) -> str:
+        return self.stages[name].status
+
+    def join(self, name, timeout=None) -> bool:
+        """ステージのスレッドが終わるまで最大 timeout 秒待つ（終わっていれば True）"""
+        worker = self.stages[name].worker
+        if worker is not None:
+            worker.join(timeout)
+            return not worker.is_alive()
+        return True
+
+    def run(self) -> dict:
+        """全ステージを実行して {ステージ名: 戻り値} を返す"""
+        self._origin = time.perf_counter()
+        for stage in self.stages.values():
+            threading.Thread(target=self._run_stage, args=(stage,), name=f"stage-{stage.name}", daemon=True).start()
+        for stage in self.stages.values():
+            stage.done.wait()
+        return {name: stage.value for name, stage in self.stages.items()}
+
+    def _run_stage(self, stage):
+        for dep in stage.deps:
+            self.stages[dep].done.wait()
+        kwargs = {dep: self.stages[dep].value for dep in stage.deps}
+        if stage.cancellable:
+            kwargs["cancel"] = stage.cancel
+        outcome = {}
+
+        def worker():
+            try:
+                outcome["value"] = stage.fn(**kwargs)
+            except Exception as e:
+                outcome["error"] = e
+            with stage._lock:
+                outcome["done"] = True
+                late = stage.status == "timeout"
+            if late:
+                self._finish_late(stage, outcome)
+
+        stage.started = time.perf_counter()
+        stage.worker = threading.Thread(target=worker, name=f"stage-{stage.name}-work", daemon=True)
+        stage.worker.start()
+        stage.worker.join(stage.timeout)
+        stage.finished = time.perf_counter()
+
+        # 「タイムアウトと判定した」と「関数が戻った」が入れ違わないようにロックの中で決める
+        with stage._lock:
+            timed_out = "done" not in outcome
+            if timed_out:
+                stage.status = "timeout"
+                stage.cancel.set()
+        if timed_out:
+            print(f"[WARN] {stage.name} が {stage.timeout}秒でタイムアウトしました（中断を要求）")
+        elif "error" in outcome:
+            stage.status = "failed"
+            stage.error = outcome["error"]
+            print(f"[WARN] {stage.name} が失敗しました: {stage.error}")
+        else:
+            stage.status = "ok"
+            stage.value = outcome.get("value")
+        stage.done.set()
+
+    @staticmethod
+    def _finish_late(stage, outcome):
+        """タイムアウトしたステージの関数が後から戻ったときの後始末"""
+        if "error" in outcome:
+            print(f"[INFO] タイムアウトした {stage.name} が後から失敗しました: {outcome['error']}")
+        else:
+            stage.late_value = outcome.get("value")
+        if stage.on_late is not None:
+            try:
+                stage.on_late(stage.late_value)
+            except Exception as e:
+                print(f"[WARN] {stage.name} の後始末に失敗: {e}")
+
+    def critical_path(self) -> list:
+        """最後に終わったステージから、開始を待たせた依存先をたどった経路（先頭から順）"""
+        finished = [s for s in self.stages.values() if s.finished is not None]
+        if not finished:
+            return []
+        stage = max(finished, key=lambda s: s.finished)
+        path = [stage]
+        while stage.deps:
+            stage = max((self.stages[d] for d in stage.deps), key=lambda s: s.finished)
+            path.append(stage)
+        return path[::-1]
+
+    def report(self):
+        """各ステージの開始・終了時刻（実行開始からの秒数）とクリティカルパスを表示"""
+        print("[INFO] 処理時間:")
+        for stage in self.stages.values():
+            if stage.started is None:
+                continue
+            print(f"  {stage.name:<12} {stage.status:<8} +{stage.started - self._origin:6.2f}秒 "
+                  f"→ +{stage.finished - self._origin:6.2f}秒（{stage.seconds:.2f}秒）")
+        path = self.critical_path()
+        if path:
+            total = path[-1].finished - self._origin
+            names = " → ".join(s.name for s in path)
+            print(f"[INFO] クリティカルパス: {names}（{total:.2f}秒）")
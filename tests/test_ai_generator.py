@@ -0,0 +1,38 @@
+"""ai_generator.generate_thread_stream の検証（Gemini は呼ばず、プロンプトの出力例をそのまま流す）"""
+
+import ai_generator
+import gemini_client
+
+
+def _prompt_example():
+    """THREAD_PROMPT に書いた出力例のJSON（キーの順番はプロンプトのまま）"""
+    prompt = ai_generator.THREAD_PROMPT
+    return prompt[prompt.index("{"):prompt.rindex("}") + 1]
+
+
+def test_on_image_before_first_tweet(monkeypatch):
+    example = _prompt_example()
+    first_tweet_end = example.index('"1ツイート目の本文"') + len('"1ツイート目の本文"')
+    fed = {"chars": 0}
+
+    def fake_stream(prompt, kind="post", **overrides):
+        for i in range(0, len(example), 4):
+            fed["chars"] = i + 4
+            yield example[i:i + 4]
+
+    monkeypatch.setattr(gemini_client, "generate_stream", fake_stream)
+    events = []
+
+    def on_image(quote, author):
+        events.append(("image", fed["chars"]))
+
+    def on_tweet(i, tweet):
+        events.append(("tweet", i))
+
+    result = ai_generator.generate_thread_stream(on_tweet=on_tweet, on_image=on_image)
+
+    assert len(result["tweets"]) == 5
+    assert events[0][0] == "image"
+    # 画像用の一言は1ツイート目が届き終わる前にそろう（画像生成をツイートの生成と重ねられる）
+    assert events[0][1] < first_tweet_end
+    assert [e for e in events if e[0] == "tweet"] == [("tweet", i) for i in range(5)]
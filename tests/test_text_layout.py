@@ -0,0 +1,100 @@
+"""text_layout.wrap_lines が1文字ずつ textbbox で測る従来の折り返しと一致するかの検証"""
+
+import os
+
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from font_registry import get_font
+from image_generator import FONT_SIZE_QUOTE, WIDTH
+from text_layout import wrap_lines
+
+POSTS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "posts.txt")
+# カーニングのある欧文フォント（送り幅の和と実際の行幅がずれる）
+KERNED_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+KERNED_TEXTS = [
+    "AVATAR Toyota WAVE To You, LTA Va Vo Ty Yo AWAY from Tokyo",
+    "Your Patience Will Vary; Try Today AV AV AV AV AV AV AV",
+    "Trust yourself. Yesterday's WAVE is today's VALLEY.",
+]
+MAX_WIDTHS = [WIDTH - (70 + 55) * 2, 400, 200]
+
+
+def _reference_wrap(text, font, max_width):
+    """従来の折り返し（1文字ごとに textbbox で計測, O(n²)）"""
+    draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    lines = []
+    for paragraph in text.split("\n"):
+        if not paragraph.strip():
+            lines.append("")
+            continue
+        current_line = ""
+        for char in paragraph:
+            test_line = current_line + char
+            bbox = draw.textbbox((0, 0), test_line, font=font)
+            if bbox[2] - bbox[0] > max_width:
+                lines.append(current_line)
+                current_line = char
+            else:
+                current_line = test_line
+        if current_line:
+            lines.append(current_line)
+    return lines
+
+
+def _quotes():
+    quotes = []
+    with open(POSTS_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            quote = line.rsplit(" - ", 1)[0] if " - " in line else line
+            quotes.append(quote.replace("「", "").replace("」", ""))
+    return quotes
+
+
+def _assert_same_as_reference(text, font, max_width):
+    draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    result = wrap_lines(text, font, max_width)
+    assert [line for line, _ in result] == _reference_wrap(text, font, max_width)
+    for line, width in result:
+        if line:
+            bbox = draw.textbbox((0, 0), line, font=font)
+            assert width == bbox[2] - bbox[0], line
+
+
+@pytest.mark.parametrize("max_width", MAX_WIDTHS)
+def test_posts_wrap_like_textbbox(max_width):
+    font = get_font(FONT_SIZE_QUOTE)
+    for quote in _quotes():
+        _assert_same_as_reference(quote, font, max_width)
+
+
+@pytest.mark.skipif(not os.path.exists(KERNED_FONT), reason="DejaVuSans がありません")
+@pytest.mark.parametrize("max_width", range(150, 900, 7))
+def test_kerned_text_wraps_like_textbbox(max_width):
+    font = ImageFont.truetype(KERNED_FONT, 48)
+    for text in KERNED_TEXTS:
+        _assert_same_as_reference(text, font, max_width)
+
+
+@pytest.mark.parametrize("max_width", [0, 10, 30, 45])
+def test_glyph_wider_than_max_width(max_width):
+    # 1文字目だけで幅を超えると従来どおり先頭に空行が入り、以降は1行1文字ずつ
+    font = get_font(FONT_SIZE_QUOTE)
+    for text in ["名言", "一歩ずつ進め\n今日も"] + _quotes()[:5]:
+        _assert_same_as_reference(text, font, max_width)
+    if os.path.exists(KERNED_FONT):
+        kerned = ImageFont.truetype(KERNED_FONT, 48)
+        for text in KERNED_TEXTS:
+            _assert_same_as_reference(text, kerned, max_width)
+
+
+def test_blank_paragraph_and_newlines():
+    font = get_font(FONT_SIZE_QUOTE)
+    assert wrap_lines("一行目\n\n三行目", font, 800) == [
+        ("一行目", font.getbbox("一行目")[2] - font.getbbox("一行目")[0]),
+        ("", 0),
+        ("三行目", font.getbbox("三行目")[2] - font.getbbox("三行目")[0]),
+    ]
@@ -0,0 +1,110 @@
+"""グリフ送り幅キャッシュを使ったテキスト折り返しモジュール
+
+(フォント, サイズ) ごとに1文字ずつの送り幅とインク範囲をキャッシュし、
+行の幅を文字を足すたびに差分で見積もって折り返し位置の候補を決める。
+1文字ずつの送り幅の和にはカーニング（"AV" などの字詰め）が入らないので、
+候補の前後だけ実際の行を font.getbbox で測り直して位置を確定する（1行あたり数回）。
+結果は1文字ずつ textbbox で測る方法と同じで、各行の幅（同じインク幅）も一緒に返す。
+"""
+
+# (フォントファイル, サイズ, フェイス番号) -> GlyphMetrics
+_metrics_cache = {}
+
+
+class GlyphMetrics:
+    """1つのフォント・サイズの文字ごとの寸法キャッシュ"""
+
+    def __init__(self, font):
+        self.font = font
+        self._glyphs = {}
+
+    def glyph(self, char):
+        """(送り幅, インク左端, インク右端) を返す"""
+        metrics = self._glyphs.get(char)
+        if metrics is None:
+            left, _, right, _ = self.font.getbbox(char)
+            metrics = (self.font.getlength(char), left, right)
+            self._glyphs[char] = metrics
+        return metrics
+
+    def text_width(self, text) -> int:
+        """draw.textbbox で測るのと同じインク幅（カーニング込み）"""
+        if not text:
+            return 0
+        left, _, right, _ = self.font.getbbox(text)
+        return right - left
+
+    def extend(self, state, char):
+        """行に1文字足したときの (新しい状態, インク幅の見積もり) を返す（カーニングは含まない）
+
+        state: (ペン位置, インク左端, インク右端) / 空行は None
+        """
+        advance, left, right = self.glyph(char)
+        if state is None:
+            pen, ink_left, ink_right = 0.0, left, right
+        else:
+            pen, ink_left, ink_right = state
+            ink_left = min(ink_left, int(pen + left))
+            ink_right = max(ink_right, int(pen + right))
+        return (pen + advance, ink_left, ink_right), ink_right - ink_left
+
+
+def glyph_metrics(font) -> GlyphMetrics:
+    """フォントに対応する GlyphMetrics を返す（プロセス内で共有）"""
+    path = getattr(font, "path", None)
+    if path is None:
+        key = ("id", id(font))
+    else:
+        key = (path, font.size, getattr(font, "index", 0), getattr(font, "layout_engine", None))
+    metrics = _metrics_cache.get(key)
+    if metrics is None:
+        metrics = GlyphMetrics(font)
+        _metrics_cache[key] = metrics
+    return metrics
+
+
+def wrap_lines(text, font, max_width) -> list:
+    """テキストを指定幅で折り返し、[(行, 行のインク幅), ...] を返す
+
+    折り返し位置は1文字ずつ textbbox で測っていた従来の方法と同じ。
+    空の段落は ("", 0) になる。段落の1文字目だけで max_width を超えるときも従来どおり
+    先頭に ("", 0) が入り、以降は幅を超えても1行に最低1文字ずつ置く。
+    """
+    metrics = glyph_metrics(font)
+    lines = []
+    for paragraph in text.split("\n"):
+        if not paragraph.strip():
+            lines.append(("", 0))
+            continue
+        if metrics.text_width(paragraph[0]) > max_width:
+            lines.append(("", 0))
+        start = 0
+        while start < len(paragraph):
+            end = _estimate_break(metrics, paragraph, start, max_width)
+            end = _exact_break(metrics, paragraph, start, end, max_width)
+            line = paragraph[start:end]
+            lines.append((line, metrics.text_width(line)))
+            start = end
+    return lines
+
+
+def _estimate_break(metrics, paragraph, start, max_width) -> int:
+    """送り幅の和で見積もった、start から始まる行の終わり（最低1文字は入れる）"""
+    state, _ = metrics.extend(None, paragraph[start])
+    end = start + 1
+    while end < len(paragraph):
+        test_state, test_width = metrics.extend(state, paragraph[end])
+        if test_width > max_width:
+            break
+        state = test_state
+        end += 1
+    return end
+
+
+def _exact_break(metrics, paragraph, start, end, max_width) -> int:
+    """見積もった行の終わり end を、実際の行の幅（カーニング込み）で前後に詰める"""
+    while end > start + 1 and metrics.text_width(paragraph[start:end]) > max_width:
+        end -= 1
+    while end < len(paragraph) and metrics.text_width(paragraph[start:end + 1]) <= max_width:
+        end += 1
+    return end
@@ -36,6 +36,7 @@ class TwitterClient:
         self.username = os.getenv("X_USERNAME")
         self.password = os.getenv("X_PASSWORD")
         self.driver = None
+        self._logged_in = False
 
     def _create_driver(self, headless=False):
         """Chromeドライバーを作成"""
@@ -57,6 +58,7 @@ class TwitterClient:
             options.add_argument("--lang=ja-JP")
 
         self.driver = webdriver.Chrome(options=options)
+        self._logged_in = False
 
         # navigator.webdriverを隠す（CSPでブロックされる場合はスキップ）
         try:
@@ -205,25 +207,54 @@ class TwitterClient:
         print("[OK] Cookieでログインしました")
         return True
 
-    def post_tweet(self, text: str, image_path: str = None) -> dict:
-        """ツイートを投稿する（ブラウザ表示して人間操作を模倣）"""
-        try:
-            # CI環境はヘッドレス、ローカルはブラウザ表示
-            is_ci = bool(os.getenv("CI"))
+    def _ensure_login(self):
+        """ログイン済みのブラウザを用意する（prepare() 済みならそのまま使う）。失敗時はエラー文字列"""
+        if self.driver and self._logged_in:
+            return None
+
+        # CI環境はヘッドレス、ローカルはブラウザ表示
+        is_ci = bool(os.getenv("CI"))
+        if self.driver is None:
             self._create_driver(headless=is_ci)
 
+        if not self._login_with_cookies():
+            print("[INFO] Cookie無効。自動ログインを試みます...")
+            self.close()
+            # 自動ログインしてCookieを保存
+            if not self.login_auto():
+                return "auto login failed"
+            # 再度ドライバー作成してCookieログイン
+            self._create_driver(headless=is_ci)
             if not self._login_with_cookies():
-                print("[INFO] Cookie無効。自動ログインを試みます...")
-                if self.driver:
-                    self.driver.quit()
-                    self.driver = None
-                # 自動ログインしてCookieを保存
-                if not self.login_auto():
-                    return {"success": False, "error": "auto login failed"}
-                # 再度ドライバー作成してCookieログイン
-                self._create_driver(headless=is_ci)
-                if not self._login_with_cookies():
-                    return {"success": False, "error": "cookie login failed after auto login"}
+                return "cookie login failed after auto login"
+        self._logged_in = True
+        return None
+
+    def prepare(self) -> bool:
+        """ブラウザ起動とログイン確認だけ先に済ませておく（投稿内容の生成と並行して呼ぶ用）"""
+        try:
+            error = self._ensure_login()
+        except Exception as e:
+            error = str(e)
+        if error:
+            print(f"[WARN] ブラウザの事前準備に失敗: {error}")
+            self.close()
+            return False
+        return True
+
+    def close(self):
+        """ブラウザを閉じる"""
+        if self.driver:
+            self.driver.quit()
+            self.driver = None
+        self._logged_in = False
+
+    def post_tweet(self, text: str, image_path: str = None) -> dict:
+        """ツイートを投稿する（ブラウザ表示して人間操作を模倣）"""
+        try:
+            error = self._ensure_login()
+            if error:
+                return {"success": False, "error": error}
 
             human_delay(2, 4)
 
@@ -310,9 +341,7 @@ class TwitterClient:
             return {"success": False, "error": str(e)}
 
         finally:
-            if self.driver:
-                self.driver.quit()
-                self.driver = None
+            self.close()
 
     def post_thread(self, tweets: list, image_path: str = None) -> dict:
         """スレッド投稿（複数ツイートを連続リプライ形式で投稿）
@@ -328,19 +357,9 @@ class TwitterClient:
             return {"success": False, "error": "tweets is empty"}
 
         try:
-            is_ci = bool(os.getenv("CI"))
-            self._create_driver(headless=is_ci)
-
-            if not self._login_with_cookies():
-                print("[INFO] Cookie無効。自動ログインを試みます...")
-                if self.driver:
-                    self.driver.quit()
-                    self.driver = None
-                if not self.login_auto():
-                    return {"success": False, "error": "auto login failed"}
-                self._create_driver(headless=is_ci)
-                if not self._login_with_cookies():
-                    return {"success": False, "error": "cookie login failed after auto login"}
+            error = self._ensure_login()
+            if error:
+                return {"success": False, "error": error}
 
             posted_count = 0
 
@@ -412,9 +431,7 @@ class TwitterClient:
             return {"success": False, "error": str(e)}
 
         finally:
-            if self.driver:
-                self.driver.quit()
-                self.driver = None
+            self.close()
 
     def verify_credentials(self) -> bool:
         """Cookieでログインできるか確認"""